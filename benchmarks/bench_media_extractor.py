@@ -0,0 +1,132 @@
+'''
+micro-benchmark of `media_extractor` against the jmespath queries the wpull plugin used to run
+
+run it from the root of the repo:
+
+    python benchmarks/bench_media_extractor.py [valkyrie.json chihiro.json]
+
+without any arguments it uses made up documents shaped like the real api responses, otherwise give
+it a saved valkyrie and chihiro response
+'''
+
+import argparse
+import json
+import pathlib
+import sys
+import timeit
+
+import jmespath
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from playstation_store_2020_oct_scrape import media_extractor
+
+# these are the queries that `ps_store_json_api_wpull_plugin.py` used before it switched to `media_extractor`
+VALKYRIE_JMESPATH_QUERY_LIST = [
+    '''included[].attributes."content-rating".url''',
+    '''included[].attributes."thumbnail-url-base"''',
+    '''included[].attributes.parent.thumbnail''',
+    '''included[].attributes."media-list".preview.url''',
+    '''included[].attributes."media-list".promo.images[].url''',
+    '''included[].attributes."media-list".promo.videos[].url''',
+    '''included[].attributes."media-list".screenshots[].url''',
+]
+
+CHIHIRO_JMESPATH_QUERY_LIST = [
+    '''content_rating.url''',
+    '''images[].url''',
+    '''promomedia[].materials[].urls[].url''',
+    '''sku_links[].url''',
+]
+
+def get_fake_valkyrie_json(num_included:int=20) -> dict:
+
+    def _get_included(idx):
+        base = "https://store.playstation.com/store/api/chihiro/00_09_000/container/US/en/999/UP0000-CUSA{:05d}_00-GAME/image".format(idx)
+        return {
+            "id": "UP0000-CUSA{:05d}_00-GAME".format(idx),
+            "type": "game",
+            "attributes": {
+                "name": "a game",
+                "content-rating": {"url": "https://example.com/rating/{}.png".format(idx)},
+                "thumbnail-url-base": base,
+                "parent": {"id": "UP0000-CUSA00000_00-PARENT", "thumbnail": base + "?parent"},
+                "media-list": {
+                    "preview": [{"url": "https://example.com/preview/{}/{}.mp4".format(idx, x)} for x in range(2)],
+                    "promo": {
+                        "images": [{"url": "https://example.com/promo/{}/{}.jpg".format(idx, x)} for x in range(3)],
+                        "videos": [{"url": "https://example.com/video/{}/{}.mp4".format(idx, x)} for x in range(2)],
+                    },
+                    "screenshots": [{"url": "https://example.com/ss/{}/{}.jpg".format(idx, x)} for x in range(8)],
+                },
+            },
+        }
+
+    return {"data": {"id": "UP0000-CUSA00000_00-GAME"}, "included": [_get_included(x) for x in range(num_included)]}
+
+def get_fake_chihiro_json() -> dict:
+
+    return {
+        "id": "UP0000-CUSA00000_00-GAME",
+        "content_rating": {"url": "https://example.com/rating.png"},
+        "images": [{"type": x, "url": "https://example.com/image/{}.png".format(x)} for x in range(12)],
+        "promomedia": [{"materials": [{"urls": [{"url": "https://example.com/promo/{}/{}.jpg".format(x, y)} for y in range(3)]}
+            for x in range(4)]}],
+        "sku_links": [{"url": "https://store.playstation.com/store/api/chihiro/00_09_000/container/US/en/999/SKU{}".format(x)}
+            for x in range(3)],
+    }
+
+def jmespath_get_url_set(compiled_query_list, json_obj) -> set:
+    ''' what the plugin's `process_result()` used to do, minus the logging '''
+
+    urls_to_add_set = set()
+
+    for iter_query in compiled_query_list:
+
+        result_obj = iter_query.search(json_obj)
+
+        if result_obj is None:
+            continue
+        elif isinstance(result_obj, str):
+            urls_to_add_set.add(result_obj)
+        else:
+            urls_to_add_set.update(x for x in result_obj if x)
+
+    return urls_to_add_set
+
+def bench(name:str, func, number:int):
+
+    best_seconds = min(timeit.repeat(func, number=number, repeat=5))
+    print("{:<32} {:>10.2f} us per document".format(name, best_seconds / number * 1e6))
+    return best_seconds
+
+def main():
+
+    parser = argparse.ArgumentParser(description="benchmark the media url extraction")
+    parser.add_argument("valkyrie_json", nargs="?", type=pathlib.Path, help="a saved valkyrie api response")
+    parser.add_argument("chihiro_json", nargs="?", type=pathlib.Path, help="a saved chihiro api response")
+    parser.add_argument("--number", type=int, default=2000, help="how many times to extract from each document per repeat")
+    args = parser.parse_args()
+
+    valkyrie_json = json.loads(args.valkyrie_json.read_text(encoding="utf-8")) if args.valkyrie_json else get_fake_valkyrie_json()
+    chihiro_json = json.loads(args.chihiro_json.read_text(encoding="utf-8")) if args.chihiro_json else get_fake_chihiro_json()
+
+    valkyrie_compiled_list = [jmespath.compile(x) for x in VALKYRIE_JMESPATH_QUERY_LIST]
+    chihiro_compiled_list = [jmespath.compile(x) for x in CHIHIRO_JMESPATH_QUERY_LIST]
+
+    for name, json_obj, compiled_list, extract_func in [
+        ("valkyrie", valkyrie_json, valkyrie_compiled_list, media_extractor.get_valkyrie_media_urls),
+        ("chihiro", chihiro_json, chihiro_compiled_list, media_extractor.get_chihiro_media_urls)]:
+
+        jmespath_set = jmespath_get_url_set(compiled_list, json_obj)
+        extractor_set = set(media_extractor.get_media_url_list(extract_func(json_obj)))
+        print("{}: jmespath found `{}` urls, media_extractor found `{}` urls (`{}` only found by media_extractor)".format(
+            name, len(jmespath_set), len(extractor_set), len(extractor_set - jmespath_set)))
+
+        jmespath_seconds = bench("{} jmespath".format(name), lambda: jmespath_get_url_set(compiled_list, json_obj), args.number)
+        extractor_seconds = bench("{} media_extractor".format(name),
+            lambda: set(media_extractor.get_media_url_list(extract_func(json_obj))), args.number)
+        print("{}: media_extractor is `{:.1f}x` the speed of jmespath\n".format(name, jmespath_seconds / extractor_seconds))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+'''
+the inputs for the benchmarks: api responses, a warcio_scrape log and a content id list
+
+the api responses come from a corpus folder, laid out like the `mock_store_server` fixtures
+(`valkyrie/<sku>.json`, `chihiro/<sku>.json`), which can be recorded from the WARC of a real scrape:
+
+    python benchmarks/corpus.py --warc-file ja-jp.warc.gz --output-dir benchmarks/corpus
+
+without a corpus the benchmarks fall back to made up documents shaped like the real ones. The log and the
+content id list are big enough that they are made up on the spot unless a real one is given
+'''
+
+import argparse
+import json
+import logging
+import lzma
+import pathlib
+import random
+import sys
+import typing
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from playstation_store_2020_oct_scrape import mock_store_server
+from playstation_store_2020_oct_scrape import warcio_scrape
+
+import bench_media_extractor
+
+logger = logging.getLogger(__name__)
+
+VALKYRIE_API_NAME = "valkyrie"
+CHIHIRO_API_NAME = "chihiro"
+
+# what the start of a `warcio_scrape` log line looks like with `main.py`'s log format
+LOG_LINE_PREFIX_FORMAT = "2020-11-11T23:57:57.376226+09:00 {:<10} playstation_store_2020_oct_scrape.warcio_scrape INFO    : "
+
+
+class CorpusDocument(typing.NamedTuple):
+    api_name:str
+    sku:str
+    url:str
+    body:bytes
+
+
+def get_api_url(api_name:str, sku:str) -> str:
+
+    if api_name == VALKYRIE_API_NAME:
+        return warcio_scrape.VALKYRIE_API_URL_FORMAT.format("en", "us", sku)
+
+    return warcio_scrape.CHIHIRO_API_URL_FORMAT.format("us", "en", sku)
+
+def load_corpus(corpus_dir:pathlib.Path) -> typing.List[CorpusDocument]:
+
+    store_data = mock_store_server.MockStoreData()
+    store_data.load_fixture_dir(corpus_dir)
+
+    document_list = []
+
+    for (iter_kind, iter_sku), iter_mock_response in sorted(store_data.response_dict.items(), key=lambda x: (x[0][0].value, x[0][1])):
+
+        if iter_kind == mock_store_server.MockResourceKind.GRID:
+            continue
+
+        api_name = iter_kind.name.lower()
+        document_list.append(CorpusDocument(api_name, iter_sku, get_api_url(api_name, iter_sku), iter_mock_response.body))
+
+    return document_list
+
+def get_synthetic_corpus(sku_count:int) -> typing.List[CorpusDocument]:
+    ''' documents with about as many media urls as a big real game has '''
+
+    document_list = []
+
+    for idx in range(sku_count):
+
+        sku = "UP0000-CUSA{:05d}_00-GAME".format(idx)
+
+        valkyrie_body = json.dumps(bench_media_extractor.get_fake_valkyrie_json(num_included=1 + idx % 20)).encode("utf-8")
+        chihiro_body = json.dumps(bench_media_extractor.get_fake_chihiro_json()).encode("utf-8")
+
+        document_list.append(CorpusDocument(VALKYRIE_API_NAME, sku, get_api_url(VALKYRIE_API_NAME, sku), valkyrie_body))
+        document_list.append(CorpusDocument(CHIHIRO_API_NAME, sku, get_api_url(CHIHIRO_API_NAME, sku), chihiro_body))
+
+    return document_list
+
+def write_synthetic_log(log_path:pathlib.Path, line_count:int, failure_rate:float=0.01, seed:int=0) -> int:
+    '''
+    writes a log that looks like what `warcio_scrape --concurrency` writes, for `get_errored_items_from_log`
+
+    @param log_path - where to write it
+    @param line_count - about how many lines to write
+    @param failure_rate - the fraction of skus that run out of retries for one of their urls
+    @param seed - for the random failures
+    @return how many skus are in the log
+    '''
+
+    rng = random.Random(seed)
+    # the sku start line, a HTTP line per url, and a few retry lines now and then
+    sku_count = max(1, line_count // 3)
+
+    with open(log_path, "w", encoding="utf-8", newline="\n") as f:
+
+        for idx in range(sku_count):
+
+            thread_name = "fetch_{}".format(idx % 8)
+            prefix = LOG_LINE_PREFIX_FORMAT.format(thread_name)
+            sku = "UP0000-CUSA{:05d}_00-GAME{:07d}".format(idx % 100000, idx)
+            api_entry = warcio_scrape.ApiEntry(sku=sku, valkyrie_url=get_api_url(VALKYRIE_API_NAME, sku), chihiro_url=get_api_url(CHIHIRO_API_NAME, sku))
+
+            f.write("{}`{} / {}`: url: `{}`\n".format(LOG_LINE_PREFIX_FORMAT.format("MainThread"), idx + 1, sku_count, api_entry))
+
+            if rng.random() < failure_rate:
+                failed_url = api_entry.valkyrie_url if rng.random() < 0.5 else api_entry.chihiro_url
+                f.write("{}-- error when getting url `{}`: `500 Server Error`\n".format(prefix, failed_url))
+                f.write("{}-- hit `5` retries when attempting to get URL `{}`, skipping\n".format(
+                    LOG_LINE_PREFIX_FORMAT.format("MainThread"), failed_url))
+            else:
+                f.write("{}-- url `{}` - HTTP `200`\n".format(prefix, api_entry.valkyrie_url))
+                f.write("{}-- url `{}` - HTTP `200`\n".format(prefix, api_entry.chihiro_url))
+
+        f.write("{}start time: `2020-11-11T00:00:00+00:00`, end time: `2020-11-12T00:00:00+00:00`\n".format(LOG_LINE_PREFIX_FORMAT.format("MainThread")))
+
+    return sku_count
+
+def write_synthetic_content_id_list(content_id_path:pathlib.Path, content_id_count:int):
+    ''' a content id list like the ones in the `playstation_content_ids` repo, XZ compressed if the path ends in `.xz` '''
+
+    open_func = lzma.open if content_id_path.suffix == ".xz" else open
+
+    with open_func(content_id_path, "wt", encoding="utf-8", newline="\n") as f:
+        for idx in range(content_id_count):
+            f.write("UP{:04d}-CUSA{:05d}_00-GAME{:07d}\n".format(idx % 9000, idx % 100000, idx))
+
+
+def main():
+
+    logging.basicConfig(level="INFO", format="%(name)s %(levelname)s: %(message)s")
+
+    parser = argparse.ArgumentParser(description="record a benchmark corpus from the WARC of a real scrape")
+    parser.add_argument("--warc-file", dest="warc_file", required=True, type=pathlib.Path, help="the WARC to take the api responses from")
+    parser.add_argument("--output-dir", dest="output_dir", required=True, type=pathlib.Path, help="where to save the corpus")
+    args = parser.parse_args()
+
+    store_data = mock_store_server.MockStoreData()
+    store_data.load_warc(args.warc_file)
+    store_data.save_fixture_dir(args.output_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+'''
+runs the benchmark suite and saves the results as JSON, so a regression shows up when comparing versions
+
+run it from the root of the repo:
+
+    python benchmarks/run_benchmarks.py --corpus-dir benchmarks/corpus --compare benchmarks/results/<older>.json
+
+what it times:
+
+- `plugin_process_result`: the wpull plugin's `process_result()` for every api response in the corpus
+- `plugin_get_urls_replay`: the same responses fed through the plugin's `get_urls` hook, see `wpull_replay.py`
+- `plugin_accept_url`: the plugin's `accept_url` hook for every url those responses queue, and the urls it skips
+- `warcio_extract_media_urls`: the json parsing and media url extraction `warcio_scrape` does for every response
+- `get_errored_items_from_log`: `get_errored_items_from_log.run()` on a (by default multi million line) log
+- `generate_wpull_urls_xz`: `generate_wpull_urls_from_content_ids.run()` on a region sized `.xz` content id list
+- `generate_wpull_urls_for_regions`: `generate_wpull_urls_from_content_ids.run_batch()` on the same list, in one process
+- `dedupe_content_ids`: `dedupe_content_ids.run()` merging the same list with itself, through runs of a quarter of it
+
+see `corpus.py` for where the inputs come from
+'''
+
+import argparse
+import json
+import logging
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import timeit
+import typing
+
+import arrow
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from playstation_store_2020_oct_scrape import dedupe_content_ids
+from playstation_store_2020_oct_scrape import generate_wpull_urls_from_content_ids
+from playstation_store_2020_oct_scrape import get_errored_items_from_log
+from playstation_store_2020_oct_scrape import media_extractor
+from playstation_store_2020_oct_scrape import warcio_scrape
+
+import corpus
+import wpull_replay
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = pathlib.Path(__file__).resolve().parent / "results"
+
+# a result is flagged in `--compare` if it got slower by more then this
+REGRESSION_THRESHOLD = 1.10
+
+WARCIO_MEDIA_URL_FUNC_DICT = {
+    corpus.VALKYRIE_API_NAME: warcio_scrape.MEDIA_URL_FUNC_DICT[warcio_scrape.ApiType.VALKYRIE],
+    corpus.CHIHIRO_API_NAME: warcio_scrape.MEDIA_URL_FUNC_DICT[warcio_scrape.ApiType.CHIHIRO],
+}
+
+
+def get_git_revision() -> typing.Optional[str]:
+
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+            cwd=pathlib.Path(__file__).resolve().parent).stdout.strip()
+    except Exception:
+        return None
+
+def time_func(func:typing.Callable, number:int, repeat:int) -> dict:
+    '''
+    @param func - what to time
+    @param number - how many times to call it per repeat
+    @param repeat - how many repeats, the best one is what counts
+    @return the result dict for the JSON
+    '''
+
+    best_seconds = min(timeit.repeat(func, number=number, repeat=repeat))
+
+    return {
+        "best_seconds": best_seconds,
+        "number": number,
+        "repeat": repeat,
+        "seconds_per_call": best_seconds / number,
+    }
+
+
+def bench_plugin_process_result(document_list, repeat:int) -> dict:
+
+    plugin = wpull_replay.load_plugin()
+    plugin_module = sys.modules[type(plugin).__module__]
+
+    url_type_dict = {
+        corpus.VALKYRIE_API_NAME: plugin_module.UrlType.VALKYRIE,
+        corpus.CHIHIRO_API_NAME: plugin_module.UrlType.CHIHIRO,
+    }
+
+    item_list = [(url_type_dict[x.api_name], wpull_replay.ReplayItemSession(x.url, x.body)) for x in document_list]
+
+    def _run():
+        for iter_url_type, iter_item_session in item_list:
+            plugin.process_result(iter_url_type, iter_item_session)
+
+    result = time_func(_run, 1, repeat)
+    result["documents"] = len(item_list)
+    result["seconds_per_document"] = result["best_seconds"] / len(item_list)
+    return result
+
+def bench_plugin_get_urls_replay(document_list, repeat:int) -> dict:
+
+    plugin = wpull_replay.load_plugin()
+
+    def _run():
+        wpull_replay.replay_item_sessions(plugin, (wpull_replay.ReplayItemSession(x.url, x.body) for x in document_list))
+
+    result = time_func(_run, 1, repeat)
+    result["documents"] = len(document_list)
+    result["seconds_per_document"] = result["best_seconds"] / len(document_list)
+    return result
+
+def bench_plugin_accept_url(document_list, repeat:int) -> dict:
+
+    plugin = wpull_replay.load_plugin()
+    plugin_module = sys.modules[type(plugin).__module__]
+
+    item_session_list = [wpull_replay.ReplayItemSession(x.url, x.body) for x in document_list]
+    wpull_replay.replay_item_sessions(plugin, item_session_list)
+
+    # every url wpull would ask about: the api urls, the media urls they queued, and some that get skipped
+    url_list = [x.request.url for x in item_session_list] + [y for x in item_session_list for y in x.child_url_list]
+    url_list += [
+        "http://json/",
+        "https://cdn.sp-int.ac.playstation.net/UP4235/CUSA06154_00/0njVKtt3dBGfRXDZWLzjhOSRGcqOl21Z.png",
+        "https://npmt.mgmt.tools.playstation.net/s3.action?mgmt-aws/EP0001/CUSA05264_00/jpKmTVGn_PREVIEW_SCREENSHOT1_508698.jpg",
+    ] * max(1, len(url_list) // 100)
+    accept_item_session_list = [wpull_replay.ReplayItemSession(x, b"") for x in url_list]
+
+    def _run():
+        for iter_item_session in accept_item_session_list:
+            plugin.my_accept_url(iter_item_session, True, {})
+
+    result = time_func(_run, 1, repeat)
+    result["urls"] = len(accept_item_session_list)
+    result["seconds_per_url"] = result["best_seconds"] / len(accept_item_session_list)
+    return result
+
+def bench_warcio_extract_media_urls(document_list, repeat:int) -> dict:
+
+    item_list = [(WARCIO_MEDIA_URL_FUNC_DICT[x.api_name], x.body) for x in document_list]
+
+    # what `download_api_url()` does with a response, and `ApiEntryResult.get_media_url_list()` after it
+    def _run():
+        for iter_func, iter_body in item_list:
+            media_extractor.get_media_url_list(iter_func(json.loads(iter_body)), warcio_scrape.WARCIO_MEDIA_URL_KIND_SET)
+
+    result = time_func(_run, 1, repeat)
+    result["documents"] = len(item_list)
+    result["seconds_per_document"] = result["best_seconds"] / len(item_list)
+    return result
+
+def bench_get_errored_items_from_log(log_path:pathlib.Path, temp_dir:pathlib.Path, repeat:int) -> dict:
+
+    parsed_args = argparse.Namespace(
+        source_log_list=[log_path],
+        source_log_glob_list=None,
+        event_log_list=None,
+        error_item_output_file=temp_dir / "errored_items.txt",
+        error_item_output_folder=None,
+        output_as_URLs=False,
+        only_dual_failures=False,
+        only_valkyrie_failures=False,
+        only_chihiro_failures=False,
+        jobs=1)
+
+    with open(log_path, "rb") as f:
+        line_count = sum(1 for _ in f)
+
+    result = time_func(lambda: get_errored_items_from_log.run(parsed_args), 1, repeat)
+    result["lines"] = line_count
+    result["lines_per_second"] = line_count / result["best_seconds"]
+    return result
+
+def bench_generate_wpull_urls(content_ids_path:pathlib.Path, temp_dir:pathlib.Path, repeat:int) -> dict:
+
+    parsed_args = argparse.Namespace(
+        content_ids_file=content_ids_path,
+        output_file=temp_dir / "wpull_urls.txt",
+        region_lang="en",
+        region_country="us",
+        dead_skus_file=None,
+        output_database=None,
+        base_url=None)
+
+    result = time_func(lambda: generate_wpull_urls_from_content_ids.run(parsed_args), 1, repeat)
+
+    content_id_count = sum(1 for _ in warcio_scrape.file_utils.iter_content_ids(content_ids_path))
+    result["content_ids"] = content_id_count
+    result["content_ids_per_second"] = content_id_count / result["best_seconds"]
+    return result
+
+def bench_generate_wpull_urls_for_regions(content_ids_path:pathlib.Path, temp_dir:pathlib.Path, repeat:int) -> dict:
+
+    regions_folder = temp_dir / "regions"
+    regions_folder.mkdir(exist_ok=True)
+    output_folder = temp_dir / "region_urls"
+    output_folder.mkdir(exist_ok=True)
+
+    region_content_ids_path = regions_folder / "en-us{}".format(generate_wpull_urls_from_content_ids.REGION_CONTENT_IDS_FILE_SUFFIX)
+    if not region_content_ids_path.exists():
+        region_content_ids_path.symlink_to(content_ids_path.resolve())
+
+    parsed_args = argparse.Namespace(
+        regions_folder=regions_folder,
+        language_tag=None,
+        output_folder=output_folder,
+        compression=generate_wpull_urls_from_content_ids.COMPRESSION_NONE,
+        counts_file=None,
+        jobs=1,
+        base_url=None)
+
+    result = time_func(lambda: generate_wpull_urls_from_content_ids.run_batch(parsed_args), 1, repeat)
+
+    content_id_count = sum(1 for _ in warcio_scrape.file_utils.iter_content_ids(content_ids_path))
+    result["content_ids"] = content_id_count
+    result["content_ids_per_second"] = content_id_count / result["best_seconds"]
+    return result
+
+def bench_dedupe_content_ids(content_ids_path:pathlib.Path, temp_dir:pathlib.Path, repeat:int) -> dict:
+
+    content_id_count = sum(1 for _ in warcio_scrape.file_utils.iter_content_ids(content_ids_path))
+
+    # a second snapshot of the same region (the same name, so they go to the same output list), every id overlaps
+    other_content_ids_path = temp_dir / "snapshot" / content_ids_path.name
+    other_content_ids_path.parent.mkdir(exist_ok=True)
+    if not other_content_ids_path.exists():
+        other_content_ids_path.symlink_to(content_ids_path.resolve())
+
+    output_folder = temp_dir / "deduped"
+    output_folder.mkdir(exist_ok=True)
+
+    parsed_args = argparse.Namespace(
+        content_ids_file_list=[content_ids_path, other_content_ids_path],
+        output_folder=output_folder,
+        output_file=None,
+        compression="xz",
+        report_file=None,
+        max_ids_in_memory=max(1, content_id_count // 4),
+        temp_dir=temp_dir)
+
+    result = time_func(lambda: dedupe_content_ids.run(parsed_args), 1, repeat)
+
+    result["content_ids"] = content_id_count * 2
+    result["content_ids_per_second"] = content_id_count * 2 / result["best_seconds"]
+    return result
+
+
+def compare_results(result_dict:dict, old_result_path:pathlib.Path):
+
+    with open(old_result_path, "r", encoding="utf-8") as f:
+        old_result_dict = json.load(f)
+
+    logger.info("comparing against `%s` (revision `%s`)", old_result_path, old_result_dict.get("git_revision"))
+
+    for iter_name, iter_result in result_dict["results"].items():
+
+        old_result = old_result_dict["results"].get(iter_name)
+
+        if old_result is None:
+            logger.info("%-28s no older result", iter_name)
+            continue
+
+        ratio = iter_result["best_seconds"] / old_result["best_seconds"]
+        logger.info("%-28s `%.4f` seconds, was `%.4f` seconds, `%.2fx`%s", iter_name, iter_result["best_seconds"],
+            old_result["best_seconds"], ratio, " <-- REGRESSION" if ratio > REGRESSION_THRESHOLD else "")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="run the benchmark suite")
+    parser.add_argument("--corpus-dir", dest="corpus_dir", type=pathlib.Path,
+        help="the recorded api responses (see `corpus.py`), without it made up documents are used")
+    parser.add_argument("--synthetic-sku-count", dest="synthetic_sku_count", type=int, default=500,
+        help="how many skus worth of made up documents to use without `--corpus-dir`")
+    parser.add_argument("--log-file", dest="log_file", type=pathlib.Path, help="a real warcio_scrape log, otherwise one is made up")
+    parser.add_argument("--log-lines", dest="log_lines", type=int, default=3000000, help="how many lines the made up log has")
+    parser.add_argument("--content-ids-file", dest="content_ids_file", type=pathlib.Path,
+        help="a real (`.xz`) content id list, otherwise one is made up")
+    parser.add_argument("--content-id-count", dest="content_id_count", type=int, default=1000000,
+        help="how many content ids the made up list has")
+    parser.add_argument("--repeat", type=int, default=3, help="how many times to run every benchmark, the best run counts")
+    parser.add_argument("--only", action="append", help="only run the benchmarks with this name, can be repeated")
+    parser.add_argument("--output", type=pathlib.Path, help="where to save the results, defaults to `benchmarks/results/<time>_<revision>.json`")
+    parser.add_argument("--compare", type=pathlib.Path, help="a older results file to compare against")
+    args = parser.parse_args()
+
+    logging.basicConfig(level="INFO", format="%(asctime)s %(name)s %(levelname)s: %(message)s")
+
+    # the code being timed logs a lot, which would just be timing the logging
+    for iter_logger_name in ("playstation_store_2020_oct_scrape", "ps_store_json_api_wpull_plugin"):
+        logging.getLogger(iter_logger_name).setLevel("WARNING")
+
+    def _should_run(name:str) -> bool:
+        return not args.only or name in args.only
+
+    if args.corpus_dir is not None:
+        document_list = corpus.load_corpus(args.corpus_dir)
+        corpus_description = str(args.corpus_dir)
+    else:
+        document_list = corpus.get_synthetic_corpus(args.synthetic_sku_count)
+        corpus_description = "synthetic, {} skus".format(args.synthetic_sku_count)
+
+    logger.info("using `%s` api responses from `%s`", len(document_list), corpus_description)
+
+    result_dict = {
+        "timestamp": arrow.utcnow().isoformat(),
+        "git_revision": get_git_revision(),
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": corpus_description,
+        "results": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="psstore_bench_") as temp_dir_str:
+
+        temp_dir = pathlib.Path(temp_dir_str)
+
+        benchmark_list = [
+            ("plugin_process_result", lambda: bench_plugin_process_result(document_list, args.repeat)),
+            ("plugin_get_urls_replay", lambda: bench_plugin_get_urls_replay(document_list, args.repeat)),
+            ("plugin_accept_url", lambda: bench_plugin_accept_url(document_list, args.repeat)),
+            ("warcio_extract_media_urls", lambda: bench_warcio_extract_media_urls(document_list, args.repeat)),
+        ]
+
+        if _should_run("get_errored_items_from_log"):
+
+            log_path = args.log_file
+            if log_path is None:
+                log_path = temp_dir / "warcio_scrape.log"
+                logger.info("writing a made up log of `%s` lines to `%s`", args.log_lines, log_path)
+                corpus.write_synthetic_log(log_path, args.log_lines)
+
+            benchmark_list.append(("get_errored_items_from_log", lambda: bench_get_errored_items_from_log(log_path, temp_dir, args.repeat)))
+
+        if _should_run("generate_wpull_urls_xz") or _should_run("generate_wpull_urls_for_regions") or _should_run("dedupe_content_ids"):
+
+            content_ids_path = args.content_ids_file
+            if content_ids_path is None:
+                content_ids_path = temp_dir / "content_ids.txt.xz"
+                logger.info("writing a made up list of `%s` content ids to `%s`", args.content_id_count, content_ids_path)
+                corpus.write_synthetic_content_id_list(content_ids_path, args.content_id_count)
+
+            benchmark_list.append(("generate_wpull_urls_xz", lambda: bench_generate_wpull_urls(content_ids_path, temp_dir, args.repeat)))
+            benchmark_list.append(("generate_wpull_urls_for_regions", lambda: bench_generate_wpull_urls_for_regions(content_ids_path, temp_dir, args.repeat)))
+            benchmark_list.append(("dedupe_content_ids", lambda: bench_dedupe_content_ids(content_ids_path, temp_dir, args.repeat)))
+
+        for iter_name, iter_bench_func in benchmark_list:
+
+            if not _should_run(iter_name):
+                continue
+
+            logger.info("running `%s`", iter_name)
+            result_dict["results"][iter_name] = iter_bench_func()
+            logger.info("%-28s best of `%s`: `%.4f` seconds", iter_name, args.repeat, result_dict["results"][iter_name]["best_seconds"])
+
+    output_path = args.output
+    if output_path is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        output_path = RESULTS_DIR / "{}_{}.json".format(arrow.utcnow().format("YYYY-MM-DDTHH-mm-ss"), result_dict["git_revision"] or "unknown")
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(result_dict, f, indent=4)
+
+    logger.info("wrote the results to `%s`", output_path)
+
+    if args.compare is not None:
+        compare_results(result_dict, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+'''
+replays WARC response records through the wpull plugin's `get_urls` hook, without running wpull
+
+this is for checking (and timing) what the plugin would have queued up for a scrape that already happened,
+like after changing how it finds media urls:
+
+    python benchmarks/wpull_replay.py ja-jp.warc.gz --output child_urls.txt
+
+the plugin only touches `item_session.request.url`, `item_session.response` (the status code and the body) and
+`item_session.add_child_url()`, so that is all `ReplayItemSession` has. wpull itself only runs on old
+pythons, so if it isn't installed, just enough of its plugin api is put in `sys.modules` for the plugin to import
+'''
+
+import argparse
+import enum
+import importlib
+import importlib.util
+import logging
+import os
+import pathlib
+import sys
+import time
+import types
+import typing
+
+from warcio.archiveiterator import ArchiveIterator
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+PLUGIN_PATH = REPO_ROOT / "wpull_plugins" / "ps_store_json_api_wpull_plugin.py"
+PLUGIN_MODULE_NAME = "ps_store_json_api_wpull_plugin"
+
+sys.path.insert(0, str(REPO_ROOT))
+
+logger = logging.getLogger(__name__)
+
+
+class _ReplayRequest:
+
+    def __init__(self, url:str):
+        self.url = url
+
+class _ReplayBody:
+
+    def __init__(self, content:bytes):
+        self._content = content
+
+    def content(self) -> bytes:
+        return self._content
+
+    def size(self) -> int:
+        return len(self._content)
+
+class _ReplayResponse:
+
+    def __init__(self, content:bytes):
+        self.body = _ReplayBody(content)
+        # only 200 responses get replayed
+        self.status_code = 200
+
+class ReplayItemSession:
+    ''' the parts of wpull's `ItemSession` that the plugin uses '''
+
+    def __init__(self, url:str, content:bytes):
+        self.request = _ReplayRequest(url)
+        self.response = _ReplayResponse(content)
+        self.child_url_list = []
+
+    def add_child_url(self, url:str, **kwargs):
+        self.child_url_list.append(url)
+
+
+def _install_wpull_plugin_api_stand_in():
+    ''' the names `ps_store_json_api_wpull_plugin.py` imports from wpull, for when wpull isn't installed '''
+
+    class PluginFunctions(enum.Enum):
+        accept_url = "accept_url"
+        get_urls = "get_urls"
+        handle_response = "handle_response"
+        handle_error = "handle_error"
+
+    class Actions(enum.Enum):
+        NORMAL = "normal"
+        RETRY = "retry"
+        FINISH = "finish"
+        STOP = "stop"
+
+    class WpullPlugin:
+
+        def activate(self):
+            pass
+
+        def deactivate(self):
+            pass
+
+    def _passthrough_decorator(name):
+        return lambda func: func
+
+    plugin_module = types.ModuleType("wpull.application.plugin")
+    plugin_module.WpullPlugin = WpullPlugin
+    plugin_module.PluginFunctions = PluginFunctions
+    plugin_module.hook = _passthrough_decorator
+    plugin_module.event = _passthrough_decorator
+
+    hook_module = types.ModuleType("wpull.application.hook")
+    hook_module.Actions = Actions
+
+    session_module = types.ModuleType("wpull.pipeline.session")
+    session_module.ItemSession = ReplayItemSession
+
+    for iter_name in ("wpull", "wpull.application", "wpull.pipeline"):
+        sys.modules.setdefault(iter_name, types.ModuleType(iter_name))
+
+    sys.modules["wpull.application.plugin"] = plugin_module
+    sys.modules["wpull.application.hook"] = hook_module
+    sys.modules["wpull.pipeline.session"] = session_module
+
+def load_plugin(base_url:typing.Optional[str]=None):
+    '''
+    imports the plugin and activates it
+
+    @param base_url - if the WARC came from somewhere other then the real store (like the mock store), where,
+    it is passed to the plugin like `PSSTORE_BASE_URL` would be
+    @return the `PsStoreJsonApiWpullPlugin` instance
+    '''
+
+    if base_url is not None:
+        # the plugin reads this when it is imported
+        os.environ["PSSTORE_BASE_URL"] = base_url
+
+    try:
+        importlib.import_module("wpull.application.plugin")
+    except ImportError:
+        logger.info("wpull isn't installed, using a stand in for its plugin api")
+        _install_wpull_plugin_api_stand_in()
+
+    # the plugin isn't part of the package, wpull loads it by path too
+    plugin_module = sys.modules.get(PLUGIN_MODULE_NAME)
+
+    if plugin_module is None:
+        spec = importlib.util.spec_from_file_location(PLUGIN_MODULE_NAME, PLUGIN_PATH)
+        plugin_module = importlib.util.module_from_spec(spec)
+        sys.modules[PLUGIN_MODULE_NAME] = plugin_module
+        spec.loader.exec_module(plugin_module)
+
+    plugin = plugin_module.PsStoreJsonApiWpullPlugin()
+    plugin.activate()
+
+    return plugin
+
+def iter_warc_item_sessions(warc_path:pathlib.Path) -> typing.Iterator[ReplayItemSession]:
+    ''' a ReplayItemSession for every HTTP 200 response record in the WARC '''
+
+    with open(warc_path, "rb") as f:
+
+        for iter_record in ArchiveIterator(f):
+
+            if iter_record.rec_type != "response" or iter_record.http_headers is None:
+                continue
+
+            if iter_record.http_headers.get_statuscode() != "200":
+                continue
+
+            yield ReplayItemSession(iter_record.rec_headers.get_header("WARC-Target-URI"), iter_record.content_stream().read())
+
+def replay_item_sessions(plugin, item_session_iter:typing.Iterable[ReplayItemSession]) -> typing.Tuple[int, int, float]:
+    '''
+    runs every item session through the plugin's `get_urls` hook
+
+    @return a tuple of (how many item sessions, how many child urls were added, seconds spent in the plugin)
+    '''
+
+    item_count = 0
+    child_url_count = 0
+    plugin_seconds = 0.0
+
+    for iter_item_session in item_session_iter:
+
+        start = time.perf_counter()
+        plugin.my_get_urls(iter_item_session)
+        plugin_seconds += time.perf_counter() - start
+
+        item_count += 1
+        child_url_count += len(iter_item_session.child_url_list)
+
+    return item_count, child_url_count, plugin_seconds
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="replay the response records of a WARC through the wpull plugin's get_urls hook")
+    parser.add_argument("warc_file", type=pathlib.Path, help="the WARC to replay")
+    parser.add_argument("--base-url", dest="base_url", help="if the WARC is from the mock store, its base url")
+    parser.add_argument("--output", type=pathlib.Path, help="if given, write every child url the plugin added here")
+    parser.add_argument("--verbose", action="store_true", help="show the plugin's own logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(level="INFO", format="%(name)s %(levelname)s: %(message)s")
+
+    plugin = load_plugin(args.base_url)
+
+    # the plugin logs every url it finds at INFO
+    if not args.verbose:
+        logging.getLogger(PLUGIN_MODULE_NAME).setLevel("WARNING")
+
+    child_url_set = set()
+
+    def _iter_and_collect():
+        for iter_item_session in iter_warc_item_sessions(args.warc_file):
+            yield iter_item_session
+            child_url_set.update(iter_item_session.child_url_list)
+
+    item_count, child_url_count, plugin_seconds = replay_item_sessions(plugin, _iter_and_collect())
+
+    plugin.deactivate()
+
+    logger.info("replayed `%s` responses, the plugin added `%s` child urls (`%s` unique) in `%.3f` seconds (`%.1f` us per response)",
+        item_count, child_url_count, len(child_url_set), plugin_seconds, plugin_seconds / max(1, item_count) * 1e6)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="\n") as f:
+            for iter_url in sorted(child_url_set):
+                f.write("{}\n".format(iter_url))
+
+        logger.info("wrote the child urls to `%s`", args.output)
+
+if __name__ == "__main__":
+    main()
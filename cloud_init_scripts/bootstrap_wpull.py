@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import argparse
 import logging
+import os
 import sys
 import subprocess
 import pathlib
@@ -125,43 +126,96 @@ def main(args):
 
     logger.info("constructed the path to the SKU / content ID list to be `%s`", sku_list_path)
 
-    # for the arguments here, we use the normalized language / region strings, as the playstation api
-    # doesn't handle language tags with a script, so zh-hans-cn is just /zh/cn/ on the playstation api i guess
-    create_wpull_url_list_arguments = [
-        sys.executable,
-        psstore_oct_scrape_pex_path,
-        "generate_wpull_urls_from_content_ids",
-        "--content-ids-file",
-        sku_list_path,
-        "--output-file",
-        wpull_url_list_path,
-        "--region-lang",
-        normalized_lang,
-        "--region-country",
-        normalized_country ]
+    # if we are given a older snapshot of the content ids repo, then only scrape the content ids that were added since then
+    # instead of the whole region again
+    if args.previous_content_ids_zip_url:
+
+        logger.info("downloading the previous snapshot of the `playstation_content_ids` git repo")
+        previous_content_ids_zip_path = root_folder / "playstation_content_ids-previous.zip"
+        download_file(args.previous_content_ids_zip_url, previous_content_ids_zip_path)
+
+        new_sku_list_path = output_folder / f"new_content_ids_{lang}-{country}.txt.xz"
+
+        diff_content_ids_arguments = [
+            sys.executable,
+            psstore_oct_scrape_pex_path,
+            "diff_content_ids",
+            "--old-snapshot",
+            previous_content_ids_zip_path,
+            "--region",
+            f"{lang}-{country}",
+            "--new-snapshot",
+            sku_list_path,
+            "--added-output-file",
+            new_sku_list_path ]
+
+        logger.info("full arguments for finding the new content ids: `%s`", diff_content_ids_arguments)
+
+        try:
+            diff_content_ids_result = subprocess.run(diff_content_ids_arguments, capture_output=True)
+            check_completedprocess_for_acceptable_statuscodes(diff_content_ids_result, ACCEPTABLE_STATUS_CODES_NORMAL)
+        except subprocess.CalledProcessError as e:
+            logger.error("error finding the new content ids: Exception: `%s`, output: `%s`, stderr: `%s`",
+                e, e.output, e.stderr)
+            raise e
+        logger.info("finding the new content ids successful, output of running command: \n\n`%s`", diff_content_ids_result.stdout.decode("utf-8"))
+
+        sku_list_path = new_sku_list_path
+        logger.info("only scraping the new content ids in `%s`", sku_list_path)
 
-    logger.info("full arguments for generating the wpull url list: `%s`", create_wpull_url_list_arguments)
+    current_date = datetime.date.today()
+    cur_date_str = current_date.strftime("%Y-%m-%d")
+    lang_and_cur_date_str = f"{lang}-{country}_{cur_date_str}"
+    wpull_database_path = output_folder / f"wpull_database_{lang_and_cur_date_str}.sqlite3"
 
-    try:
-        # don't use `check=True` cause we need to check the status codes , and subprocess.run() doesn't have a built in
-        # mechanism to do that
-        create_wpull_url_list_result = subprocess.run(create_wpull_url_list_arguments, capture_output=True)
-        check_completedprocess_for_acceptable_statuscodes(create_wpull_url_list_result, ACCEPTABLE_STATUS_CODES_NORMAL)
-    except subprocess.CalledProcessError as e:
-        logger.error("error generating the wpull url list: Exception: `%s`, output: `%s`, stderr: `%s`",
-            e, e.output, e.stderr)
-        raise e
-    logger.info("creation of wpull url list successful, output of running command: \n\n`%s`", create_wpull_url_list_result.stdout.decode("utf-8"))
+    # the urls go straight into the wpull database, which is a lot faster then having wpull read them in from
+    # `--input-file` one at a time. If the database is already there then this is a restart and wpull picks up
+    # where it left off
+    if wpull_database_path.exists():
+        logger.info("the wpull database `%s` already exists, not generating the urls again", wpull_database_path)
+
+    else:
+        # for the arguments here, we use the normalized language / region strings, as the playstation api
+        # doesn't handle language tags with a script, so zh-hans-cn is just /zh/cn/ on the playstation api i guess
+        create_wpull_url_list_arguments = [
+            sys.executable,
+            psstore_oct_scrape_pex_path,
+            "generate_wpull_urls_from_content_ids",
+            "--content-ids-file",
+            sku_list_path,
+            "--output-database",
+            wpull_database_path,
+            "--region-lang",
+            normalized_lang,
+            "--region-country",
+            normalized_country ]
+
+        logger.info("full arguments for generating the wpull database: `%s`", create_wpull_url_list_arguments)
+
+        try:
+            # don't use `check=True` cause we need to check the status codes , and subprocess.run() doesn't have a built in
+            # mechanism to do that
+            create_wpull_url_list_result = subprocess.run(create_wpull_url_list_arguments, capture_output=True)
+            check_completedprocess_for_acceptable_statuscodes(create_wpull_url_list_result, ACCEPTABLE_STATUS_CODES_NORMAL)
+        except subprocess.CalledProcessError as e:
+            logger.error("error generating the wpull database: Exception: `%s`, output: `%s`, stderr: `%s`",
+                e, e.output, e.stderr)
+            raise e
+        logger.info("creation of wpull database successful, output of running command: \n\n`%s`", create_wpull_url_list_result.stdout.decode("utf-8"))
+
+    # wpull still wants a input file, so give it one with nothing in it, like `scrape_media.py` does
+    logger.info("writing the empty input urls file to `%s`", wpull_url_list_path)
+    with open(wpull_url_list_path, "w", encoding="utf-8") as f:
+        f.write("\n")
 
     # now generate the arguments file and run wpull
 
-    current_date = datetime.date.today()
-    cur_date_str = current_date.strftime("%Y-%m-%d")
-    lang_and_cur_date_str = f"{lang}-{country}_{cur_date_str}"
     wpull_plugin_path = root_folder / "wpull_plugin.py"
+    media_extractor_path = root_folder / "media_extractor.py"
+    event_log_module_path = root_folder / "event_log.py"
     wpull_arguments_list_file_path = output_folder / f"wpull_argument_list_{lang_and_cur_date_str}.txt"
-    wpull_database_path = output_folder / f"wpull_database_{lang_and_cur_date_str}.sqlite3"
     wpull_output_log_path = output_folder / f"wpull_output_{lang_and_cur_date_str}.log"
+    wpull_event_log_path = output_folder / f"wpull_events_{lang_and_cur_date_str}.jsonl"
     # don't add .warc or any other extension, wpull will add them
     wpull_warc_file_output_path = output_folder / f"psstore_json_{lang_and_cur_date_str}"
 
@@ -203,6 +257,26 @@ def main(args):
         text_to_write = wpull_plugin_path_inside_pex_zip.read_text(encoding="utf-8")
         f.write(text_to_write)
 
+    # the wpull plugin imports the media url extractor, which it expects to find right next to it
+    media_extractor_path_inside_pex_zip = found_psstore_oct_scrape_deps_path / "playstation_store_2020_oct_scrape" / "media_extractor.py"
+    if not media_extractor_path_inside_pex_zip.exists():
+        raise Exception("couldn't find the media extractor python script inside the pex zip: `%s`", media_extractor_path_inside_pex_zip)
+
+    logger.info("writing the media extractor from `%s` to `%s`", media_extractor_path_inside_pex_zip, media_extractor_path)
+    with open(media_extractor_path, "w", encoding="utf-8") as f:
+        text_to_write = media_extractor_path_inside_pex_zip.read_text(encoding="utf-8")
+        f.write(text_to_write)
+
+    # and the event log writer, same deal
+    event_log_module_path_inside_pex_zip = found_psstore_oct_scrape_deps_path / "playstation_store_2020_oct_scrape" / "event_log.py"
+    if not event_log_module_path_inside_pex_zip.exists():
+        raise Exception("couldn't find the event log python script inside the pex zip: `%s`", event_log_module_path_inside_pex_zip)
+
+    logger.info("writing the event log module from `%s` to `%s`", event_log_module_path_inside_pex_zip, event_log_module_path)
+    with open(event_log_module_path, "w", encoding="utf-8") as f:
+        text_to_write = event_log_module_path_inside_pex_zip.read_text(encoding="utf-8")
+        f.write(text_to_write)
+
     wpull_argument_list_to_write_to_file = [
         "--database",
         str(wpull_database_path),
@@ -255,7 +329,11 @@ def main(args):
     try:
         # don't use `check=True` cause we need to check the status codes , and subprocess.run() doesn't have a built in
         # mechanism to do that
-        wpull_result = subprocess.run(wpull_argument_list, capture_output=True)
+        # the plugin can't get command line arguments, so it is told where to write the event log this way
+        wpull_env = dict(os.environ, PSSTORE_EVENT_LOG=str(wpull_event_log_path))
+        logger.info("the wpull plugin will write its event log to `%s`", wpull_event_log_path)
+
+        wpull_result = subprocess.run(wpull_argument_list, capture_output=True, env=wpull_env)
         check_completedprocess_for_acceptable_statuscodes(wpull_result, ACCEPTABLE_STATUS_CODES_WPULL)
     except subprocess.CalledProcessError as e:
         logger.error("error running wpull: Exception: `%s`, output: `%s`, stderr: `%s`",
@@ -282,6 +360,10 @@ if __name__ == "__main__":
         dest="region_country",
         required=True,
         help="the second part of a region code, aka the `us` in `en-US`")
+    parser.add_argument("--previous-content-ids-zip-url",
+        dest="previous_content_ids_zip_url",
+        help="if set, the url of a older zip of the `playstation_content_ids` repo (like a zip of a older commit), "
+            + "and only the content ids that were added since then are scraped")
     parser.add_argument("--verbose", action="store_true", help="increase logger verbosity")
 
     parsed_args = parser.parse_args()
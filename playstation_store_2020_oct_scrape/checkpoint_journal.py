@@ -0,0 +1,113 @@
+import logging
+import os
+import pathlib
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_STATUS_DONE = "done"
+JOURNAL_STATUS_FAILED = "failed"
+JOURNAL_STATUS_NOT_FOUND = "not_found"
+
+# statuses that mean a sku's api url doesn't need to be downloaded again
+JOURNAL_FINISHED_STATUS_SET = frozenset([JOURNAL_STATUS_DONE, JOURNAL_STATUS_NOT_FOUND])
+
+# how often to actually commit the journal entries to disk
+JOURNAL_COMMIT_INTERVAL_SECONDS = 10
+
+class CheckpointJournal:
+    '''
+    a append only journal of which api urls of which skus have been finished, so a `warcio_scrape`
+    run that dies can be resumed without downloading everything that is already in the WARC again
+
+    each line is `<sku>\t<api name>\t<status>`, and a sku's api url is only done once it has a
+    `done` or `not_found` line, `failed` lines are just there for information and get retried on resume
+
+    entries are buffered and only written out every `JOURNAL_COMMIT_INTERVAL_SECONDS`, after the
+    files they describe (the WARC and the media list) have been fsync'd, so the journal never says
+    something is done when it didn't actually make it to disk
+    '''
+
+    def __init__(self, journal_path:pathlib.Path):
+
+        self.journal_path = journal_path
+        self.pending_line_list = []
+        self.last_commit_time = time.monotonic()
+        self.journal_fh = None
+
+    @staticmethod
+    def load_done_dict(journal_path:pathlib.Path) -> typing.Dict[str, typing.Set[str]]:
+        '''
+        reads a journal file
+
+        @param journal_path - the path to the journal
+        @return a dict of sku -> set of the api names that are done for that sku
+        '''
+
+        done_dict = {}
+        line_count = 0
+
+        with open(journal_path, "r", encoding="utf-8") as f:
+
+            for line in f:
+
+                # the last line might be cut off if we crashed while writing it
+                if not line.endswith("\n"):
+                    logger.warning("ignoring incomplete line at the end of the journal: `%s`", line)
+                    continue
+
+                split_line = line.rstrip("\n").split("\t")
+
+                if len(split_line) != 3:
+                    logger.warning("ignoring malformed journal line: `%s`", line.rstrip("\n"))
+                    continue
+
+                line_count += 1
+                sku, api_name, status = split_line
+
+                if status in JOURNAL_FINISHED_STATUS_SET:
+                    done_dict.setdefault(sku, set()).add(api_name)
+
+        logger.info("read `%s` lines from the journal `%s`, `%s` skus have at least one api url done",
+            line_count, journal_path, len(done_dict))
+
+        return done_dict
+
+    def open(self):
+        self.journal_fh = open(self.journal_path, "a", encoding="utf-8", newline="\n")
+
+    def close(self):
+        if self.journal_fh:
+            self.commit()
+            self.journal_fh.close()
+            self.journal_fh = None
+
+    def add(self, sku:str, api_name:str, status:str):
+        self.pending_line_list.append("{}\t{}\t{}\n".format(sku, api_name, status))
+
+    def commit_if_due(self, before_commit_func:typing.Callable):
+        '''
+        commits the pending entries if it has been long enough since the last commit
+
+        @param before_commit_func - called before the entries are written, this should fsync
+        every file that the pending entries describe
+        '''
+
+        if time.monotonic() - self.last_commit_time >= JOURNAL_COMMIT_INTERVAL_SECONDS:
+            before_commit_func()
+            self.commit()
+
+    def commit(self):
+
+        self.last_commit_time = time.monotonic()
+
+        if not self.pending_line_list:
+            return
+
+        self.journal_fh.writelines(self.pending_line_list)
+        self.journal_fh.flush()
+        os.fsync(self.journal_fh.fileno())
+
+        logger.debug("committed `%s` entries to the journal", len(self.pending_line_list))
+        self.pending_line_list = []
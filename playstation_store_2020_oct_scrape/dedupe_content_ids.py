@@ -0,0 +1,220 @@
+'''
+merges content id lists into sorted lists without duplicates, and reports how much the lists overlap
+
+the lists can be bigger then what fits in memory, so this is a external merge sort: the ids are read in runs of
+`--max-ids-in-memory`, each run is sorted and written to a temporary file, and then the runs are merged. Every id
+is kept along with the index of the list it came from, so the merge sees every list a id is in at once
+'''
+
+import heapq
+import itertools
+import json
+import logging
+import pathlib
+import tempfile
+import typing
+
+import attr
+
+from playstation_store_2020_oct_scrape import file_utils
+from playstation_store_2020_oct_scrape import generate_wpull_urls_from_content_ids
+
+logger = logging.getLogger(__name__)
+
+# sorts before every character that can be in a content id, so a id always sorts before a longer id that starts with it
+RUN_LINE_SEPARATOR = "\t"
+RUN_LINE_FORMAT = "{}\t{}\n"
+
+# the same names as the `regions/` folder of the `playstation_content_ids` repo, so the output folder can be given
+# to `generate_wpull_urls_for_regions --regions-folder`
+REGION_CONTENT_IDS_FILE_NAME_FORMAT = "{}.txt"
+
+# the default XZ preset (6) makes a sorted list about a third smaller then preset 1, but takes 40 times as long,
+# which is most of the time of the whole merge
+CONTENT_ID_LIST_COMPRESSION_LEVEL_DICT = {
+    file_utils.XZ_SUFFIX: 1,
+}
+
+
+@attr.s(auto_attribs=True, kw_only=True)
+class ContentIdListStats:
+    ''' what the merge found out about one of the input lists '''
+
+    path:pathlib.Path
+    region:str
+    # every line with a id, duplicates included
+    id_count:int = 0
+    # ids that were in this list more then once, counting every extra time
+    duplicate_id_count:int = 0
+    # unique ids of this list that are in at least one other list
+    shared_id_count:int = 0
+    # unique ids that no other list has
+    only_here_id_count:int = 0
+    # index of the other list -> how many ids this list shares with it
+    overlap_count_dict:dict = attr.ib(factory=dict)
+
+    def get_unique_id_count(self) -> int:
+        return self.shared_id_count + self.only_here_id_count
+
+
+def get_region_from_path(content_ids_path:pathlib.Path) -> str:
+    ''' @return the region a list is for, from its name, like `en-us` for `en-us.txt.xz` '''
+
+    return content_ids_path.name.split(".", 1)[0].lower()
+
+def _write_run(run_line_list:typing.List[str], temp_dir:pathlib.Path, run_idx:int) -> pathlib.Path:
+
+    run_line_list.sort()
+    run_path = temp_dir / "run_{:05d}.txt".format(run_idx)
+
+    with open(run_path, "w", encoding="utf-8", newline="\n") as f:
+        f.writelines(run_line_list)
+
+    return run_path
+
+def _iter_run_lines(run_path:pathlib.Path) -> typing.Iterator[str]:
+
+    # a big buffer, since a merge with a lot of runs reads from all of them at once
+    with open(run_path, "r", encoding="utf-8", buffering=1024 * 1024) as f:
+        yield from f
+
+def iter_merged_content_ids(content_ids_path_list:typing.Sequence[pathlib.Path], max_ids_in_memory:int,
+        temp_dir:pathlib.Path) -> typing.Iterator[typing.Tuple[str, typing.List[int]]]:
+    '''
+    the external merge sort
+
+    @param content_ids_path_list - the (maybe compressed) lists
+    @param max_ids_in_memory - how many ids are sorted in memory at once before they are written out as a run
+    @param temp_dir - where the runs go
+    @return a iterator of (content id, the indexes of the lists it is in, once for every time it is in them),
+    sorted by content id
+    '''
+
+    if max_ids_in_memory < 1:
+        raise Exception("`max_ids_in_memory` has to be at least 1, got `{}`".format(max_ids_in_memory))
+
+    run_path_list = []
+    run_line_list = []
+
+    for iter_path_idx, iter_path in enumerate(content_ids_path_list):
+
+        logger.info("reading `%s`", iter_path)
+
+        for iter_content_id in file_utils.iter_content_ids(iter_path):
+
+            run_line_list.append(RUN_LINE_FORMAT.format(iter_content_id, iter_path_idx))
+
+            if len(run_line_list) >= max_ids_in_memory:
+                run_path_list.append(_write_run(run_line_list, temp_dir, len(run_path_list)))
+                run_line_list = []
+
+    # the last run doesn't need to go through a file
+    run_line_list.sort()
+    run_iter_list = [_iter_run_lines(x) for x in run_path_list] + [iter(run_line_list)]
+
+    if run_path_list:
+        logger.info("merging `%s` sorted runs of up to `%s` ids", len(run_iter_list), max_ids_in_memory)
+
+    merged_line_iter = heapq.merge(*run_iter_list)
+
+    for iter_content_id, iter_line_group in itertools.groupby(merged_line_iter, key=lambda x: x.split(RUN_LINE_SEPARATOR, 1)[0]):
+        yield iter_content_id, [int(x.split(RUN_LINE_SEPARATOR, 1)[1]) for x in iter_line_group]
+
+def dedupe_content_id_lists(content_ids_path_list:typing.Sequence[pathlib.Path], output_path_dict:typing.Dict[str, pathlib.Path],
+        max_ids_in_memory:int, temp_dir:typing.Optional[pathlib.Path]=None) -> typing.List[ContentIdListStats]:
+    '''
+    @param content_ids_path_list - the (maybe compressed) lists
+    @param output_path_dict - region (see `get_region_from_path()`) -> where to write the sorted ids of the lists of that region,
+    or a single entry with the key None to write every id to one list
+    @param max_ids_in_memory - see `iter_merged_content_ids()`
+    @param temp_dir - where the temporary directory for the runs is made, defaults to the system one
+    @return a ContentIdListStats per list, in the same order
+    '''
+
+    stats_list = [ContentIdListStats(path=x, region=get_region_from_path(x)) for x in content_ids_path_list]
+    path_idx_region_list = [None if None in output_path_dict else x.region for x in stats_list]
+
+    output_fh_dict = {}
+
+    try:
+        for iter_region, iter_output_path in output_path_dict.items():
+            output_fh_dict[iter_region] = file_utils.open_text_file(iter_output_path, "wt",
+                CONTENT_ID_LIST_COMPRESSION_LEVEL_DICT.get(iter_output_path.suffix))
+
+        with tempfile.TemporaryDirectory(prefix="dedupe_content_ids_", dir=temp_dir) as temp_dir_str:
+
+            for iter_content_id, iter_path_idx_list in iter_merged_content_ids(content_ids_path_list, max_ids_in_memory, pathlib.Path(temp_dir_str)):
+
+                path_idx_set = set(iter_path_idx_list)
+
+                for iter_path_idx in iter_path_idx_list:
+                    stats_list[iter_path_idx].id_count += 1
+
+                for iter_path_idx in path_idx_set:
+
+                    iter_stats = stats_list[iter_path_idx]
+                    iter_stats.duplicate_id_count += iter_path_idx_list.count(iter_path_idx) - 1
+
+                    if len(path_idx_set) == 1:
+                        iter_stats.only_here_id_count += 1
+                        continue
+
+                    iter_stats.shared_id_count += 1
+                    for iter_other_path_idx in path_idx_set:
+                        if iter_other_path_idx != iter_path_idx:
+                            iter_stats.overlap_count_dict[iter_other_path_idx] = iter_stats.overlap_count_dict.get(iter_other_path_idx, 0) + 1
+
+                # once per output list, even if more then one of its lists has it
+                for iter_region in set(path_idx_region_list[x] for x in path_idx_set):
+                    output_fh_dict[iter_region].write("{}\n".format(iter_content_id))
+
+    finally:
+        for iter_output_fh in output_fh_dict.values():
+            iter_output_fh.close()
+
+    return stats_list
+
+def get_report_dict(stats_list:typing.Sequence[ContentIdListStats]) -> dict:
+    ''' @return the JSON for `--report-file` '''
+
+    return {"lists": [{
+        "path": str(x.path),
+        "region": x.region,
+        "ids": x.id_count,
+        "unique_ids": x.get_unique_id_count(),
+        "duplicate_ids": x.duplicate_id_count,
+        "shared_ids": x.shared_id_count,
+        "only_here_ids": x.only_here_id_count,
+        "overlap": {str(stats_list[k].path): v for k, v in sorted(x.overlap_count_dict.items())},
+    } for x in stats_list]}
+
+def run(parsed_args):
+
+    content_ids_path_list = list({x.resolve(): x for x in parsed_args.content_ids_file_list}.values())
+
+    if parsed_args.output_folder is not None:
+        suffix = generate_wpull_urls_from_content_ids.COMPRESSION_SUFFIX_DICT[parsed_args.compression]
+        output_path_dict = {x: parsed_args.output_folder / (REGION_CONTENT_IDS_FILE_NAME_FORMAT.format(x) + suffix)
+            for x in sorted(set(get_region_from_path(x) for x in content_ids_path_list))}
+    else:
+        output_path_dict = {None: parsed_args.output_file}
+
+    logger.info("merging `%s` content id lists into `%s` sorted lists", len(content_ids_path_list), len(output_path_dict))
+
+    stats_list = dedupe_content_id_lists(content_ids_path_list, output_path_dict, parsed_args.max_ids_in_memory, parsed_args.temp_dir)
+
+    for iter_stats in stats_list:
+        logger.info("-- `%s`: `%s` ids, `%s` unique, `%s` duplicates, `%s` in other lists too, `%s` only in this one", iter_stats.path,
+            iter_stats.id_count, iter_stats.get_unique_id_count(), iter_stats.duplicate_id_count, iter_stats.shared_id_count, iter_stats.only_here_id_count)
+
+    total_id_count = sum(x.id_count for x in stats_list)
+    logger.info("dropped `%s` duplicate ids within lists out of `%s` ids", sum(x.duplicate_id_count for x in stats_list), total_id_count)
+
+    for iter_output_path in output_path_dict.values():
+        logger.info("wrote `%s`", iter_output_path)
+
+    if parsed_args.report_file is not None:
+        logger.info("writing the overlap report to `%s`", parsed_args.report_file)
+
+        with open(parsed_args.report_file, "w", encoding="utf-8") as f:
+            json.dump(get_report_dict(stats_list), f, indent=4)
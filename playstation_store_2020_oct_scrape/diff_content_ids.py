@@ -0,0 +1,131 @@
+'''
+finds the content ids that were added to (or removed from) a region between two snapshots of its list, so a follow up
+scrape only has to get the new ones instead of the whole region again
+
+a snapshot is either a zip of the `playstation_content_ids` repo (like the `master.zip` that `bootstrap_wpull.py`
+downloads) or the list itself. Both lists go through the same external merge sort as `dedupe_content_ids`, so
+neither one has to fit in memory or be sorted already, and the merge sees every id of both lists in order
+'''
+
+import logging
+import pathlib
+import shutil
+import tempfile
+import typing
+import zipfile
+
+from playstation_store_2020_oct_scrape import dedupe_content_ids
+from playstation_store_2020_oct_scrape import file_utils
+from playstation_store_2020_oct_scrape import generate_wpull_urls_from_content_ids
+
+logger = logging.getLogger(__name__)
+
+ZIP_SUFFIX = ".zip"
+
+# the folder at the top of the zip is named after the branch or commit, like `playstation_content_ids-master`
+ZIP_REGION_CONTENT_IDS_PATH_FORMAT = "/regions/{}" + generate_wpull_urls_from_content_ids.REGION_CONTENT_IDS_FILE_SUFFIX
+
+# the index of each snapshot in the merge
+OLD_SNAPSHOT_IDX = 0
+NEW_SNAPSHOT_IDX = 1
+
+
+def get_content_ids_path(snapshot_path:pathlib.Path, region:typing.Optional[str], temp_dir:pathlib.Path) -> pathlib.Path:
+    '''
+    @param snapshot_path - a content id list, or a zip of the `playstation_content_ids` repo
+    @param region - like `en-us`, which list to use out of a zip
+    @param temp_dir - where the list out of a zip is extracted to
+    @return the path of the content id list
+    '''
+
+    if snapshot_path.suffix.lower() != ZIP_SUFFIX:
+        return snapshot_path
+
+    if region is None:
+        raise Exception("`{}` is a zip, so the region of the list to use out of it is needed".format(snapshot_path))
+
+    member_path_suffix = ZIP_REGION_CONTENT_IDS_PATH_FORMAT.format(region)
+
+    with zipfile.ZipFile(snapshot_path) as zip_file:
+
+        member_name_list = [x for x in zip_file.namelist() if ("/" + x).endswith(member_path_suffix)]
+
+        if len(member_name_list) != 1:
+            raise Exception("expected one `{}` in the zip `{}`, found `{}`".format(member_path_suffix.lstrip("/"), snapshot_path, member_name_list))
+
+        # the old and new zip have the same names in them, so each gets its own folder
+        extract_path = pathlib.Path(tempfile.mkdtemp(dir=temp_dir)) / member_name_list[0].rsplit("/", 1)[-1]
+        logger.info("extracting `%s` out of `%s`", member_name_list[0], snapshot_path)
+
+        with zip_file.open(member_name_list[0]) as member_fh, open(extract_path, "wb") as extract_fh:
+            shutil.copyfileobj(member_fh, extract_fh)
+
+    return extract_path
+
+def iter_content_id_diff(old_content_ids_path:pathlib.Path, new_content_ids_path:pathlib.Path, max_ids_in_memory:int,
+        temp_dir:pathlib.Path) -> typing.Iterator[typing.Tuple[str, bool]]:
+    '''
+    @param old_content_ids_path - the (maybe compressed) older list
+    @param new_content_ids_path - the (maybe compressed) newer list
+    @param max_ids_in_memory - see `dedupe_content_ids.iter_merged_content_ids()`
+    @param temp_dir - where the runs go
+    @return a iterator of (content id, True if it was added or False if it was removed), sorted by content id. Ids
+    that are in both lists are left out
+    '''
+
+    for iter_content_id, iter_path_idx_list in dedupe_content_ids.iter_merged_content_ids(
+            [old_content_ids_path, new_content_ids_path], max_ids_in_memory, temp_dir):
+
+        is_in_old = OLD_SNAPSHOT_IDX in iter_path_idx_list
+        is_in_new = NEW_SNAPSHOT_IDX in iter_path_idx_list
+
+        if is_in_old != is_in_new:
+            yield iter_content_id, is_in_new
+
+def run(parsed_args):
+
+    region = None if parsed_args.region is None else str(parsed_args.region).lower()
+
+    added_count = 0
+    removed_count = 0
+
+    with tempfile.TemporaryDirectory(prefix="diff_content_ids_", dir=parsed_args.temp_dir) as temp_dir_str:
+
+        temp_dir = pathlib.Path(temp_dir_str)
+
+        old_content_ids_path = get_content_ids_path(parsed_args.old_snapshot, region, temp_dir)
+        new_content_ids_path = get_content_ids_path(parsed_args.new_snapshot, region, temp_dir)
+
+        logger.info("comparing `%s` (old) to `%s` (new)", old_content_ids_path, new_content_ids_path)
+
+        added_fh = file_utils.open_text_file(parsed_args.added_output_file, "wt",
+            dedupe_content_ids.CONTENT_ID_LIST_COMPRESSION_LEVEL_DICT.get(parsed_args.added_output_file.suffix))
+        removed_fh = None
+
+        try:
+            if parsed_args.removed_output_file is not None:
+                removed_fh = file_utils.open_text_file(parsed_args.removed_output_file, "wt",
+                    dedupe_content_ids.CONTENT_ID_LIST_COMPRESSION_LEVEL_DICT.get(parsed_args.removed_output_file.suffix))
+
+            for iter_content_id, iter_is_added in iter_content_id_diff(old_content_ids_path, new_content_ids_path,
+                    parsed_args.max_ids_in_memory, temp_dir):
+
+                if iter_is_added:
+                    added_count += 1
+                    added_fh.write("{}\n".format(iter_content_id))
+
+                else:
+                    removed_count += 1
+                    if removed_fh is not None:
+                        removed_fh.write("{}\n".format(iter_content_id))
+
+        finally:
+            added_fh.close()
+            if removed_fh is not None:
+                removed_fh.close()
+
+    logger.info("`%s` content ids were added and `%s` were removed", added_count, removed_count)
+    logger.info("wrote the added content ids to `%s`", parsed_args.added_output_file)
+
+    if removed_fh is not None:
+        logger.info("wrote the removed content ids to `%s`", parsed_args.removed_output_file)
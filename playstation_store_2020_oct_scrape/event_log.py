@@ -0,0 +1,289 @@
+'''
+a JSONL event log with a line for every api url request a scraper finished, kept next to the human readable log
+
+`warcio_scrape --event-log` writes one (a line per url, once it is done being retried), and so does the wpull plugin
+when the `PSSTORE_EVENT_LOG` environment variable is set (a line per response, since wpull does the retrying). A line
+looks like:
+
+    {"sku":"UP0000-CUSA00000_00-GAME","region":"en-us","api":"valkyrie","status":"failed","http_status":503,"attempts":5,"latency":0.214,"bytes":0,"url":"...","time":1605106677.312}
+
+the same sku can be in more then one region, so the lines have the region too, and `EventIndex` keeps
+every (region, sku) apart. `EventIndex` reads them back, so `get_errored_items_from_log --event-log` doesn't depend on the wording of the log
+messages or the repr of `ApiEntry`
+
+the wpull plugin gets this file extracted next to it like `media_extractor.py`, so this should only ever import the
+standard library
+'''
+
+import json
+import logging
+import os
+import re
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+# the same as the `checkpoint_journal` statuses
+EVENT_STATUS_DONE = "done"
+EVENT_STATUS_FAILED = "failed"
+EVENT_STATUS_NOT_FOUND = "not_found"
+
+# when a url shows up more then once (wpull retrying it, retry rounds, a resumed run) the best status it ever had wins,
+# so a url that failed and then worked later counts as done
+EVENT_STATUS_RANK_DICT = {
+    EVENT_STATUS_FAILED: 0,
+    EVENT_STATUS_NOT_FOUND: 1,
+    EVENT_STATUS_DONE: 2,
+}
+
+# the HTTP statuses that mean the sku doesn't exist (anymore), like `warcio_scrape.NOT_FOUND_STATUS_CODE_SET`
+NOT_FOUND_HTTP_STATUS_SET = frozenset([404, 410])
+
+KEY_SKU = "sku"
+KEY_REGION = "region"
+KEY_API = "api"
+KEY_STATUS = "status"
+KEY_HTTP_STATUS = "http_status"
+KEY_ATTEMPTS = "attempts"
+KEY_LATENCY = "latency"
+KEY_BYTES = "bytes"
+KEY_URL = "url"
+KEY_TIME = "time"
+
+# nearly every line is a url that worked, and `get_event_line()` always writes the keys in the same order, so those lines
+# are matched with this instead of going through `json.loads()` (which is most of the time it takes to read a event log),
+# anything it doesn't match still goes through `json.loads()`
+DONE_EVENT_LINE_REGEX_OBJ = re.compile(r'\{"sku":"([^"\\]*)","region":"([^"\\]*)","api":"([a-z]+)","status":"done","http_status":([0-9]+|null),'
+    r'"attempts":([0-9]+),"latency":([0-9.e\-]+|null),"bytes":([0-9]+),"url":"([^"\\]*)"')
+
+REGION_FROM_VALKYRIE_URL_REGEX_OBJ = re.compile(r"/valkyrie-api/([a-zA-Z]+)/([a-zA-Z]+)/")
+# chihiro has the country first, `/container/us/en/`
+REGION_FROM_CHIHIRO_URL_REGEX_OBJ = re.compile(r"/store/api/chihiro/[^/]+/container/([a-zA-Z]+)/([a-zA-Z]+)/")
+UNKNOWN_REGION = "unknown"
+
+
+def get_region_from_url(url:str) -> str:
+    ''' @return the region of a valkyrie or chihiro url, like `ja-jp`, or `UNKNOWN_REGION` for any other url '''
+
+    region_match = REGION_FROM_VALKYRIE_URL_REGEX_OBJ.search(url)
+    if region_match is not None:
+        return "{}-{}".format(*region_match.groups()).lower()
+
+    region_match = REGION_FROM_CHIHIRO_URL_REGEX_OBJ.search(url)
+    if region_match is not None:
+        return "{}-{}".format(region_match.group(2), region_match.group(1)).lower()
+
+    return UNKNOWN_REGION
+
+def get_status_for_http_status(http_status:typing.Optional[int]) -> str:
+    ''' for when all there is to go on is the HTTP status, like in the wpull plugin '''
+
+    if http_status == 200:
+        return EVENT_STATUS_DONE
+    elif http_status in NOT_FOUND_HTTP_STATUS_SET:
+        return EVENT_STATUS_NOT_FOUND
+
+    return EVENT_STATUS_FAILED
+
+def get_event_line(sku:str, region:str, api_name:str, status:str, url:str, http_status:typing.Optional[int]=None, attempts:int=1,
+        latency_seconds:typing.Optional[float]=None, byte_count:int=0, event_time:typing.Optional[float]=None) -> str:
+    '''
+    @param sku - the sku the url is for
+    @param region - the region of the url, like `en-us`
+    @param api_name - `valkyrie` or `chihiro`
+    @param status - one of the `EVENT_STATUS_` constants
+    @param url - the url
+    @param http_status - the HTTP status of the (last) response, or None if there wasn't one
+    @param attempts - how many requests this line is for
+    @param latency_seconds - how long the (last) response took, if known
+    @param byte_count - the size of the (last) response body
+    @param event_time - when this happened, defaults to now
+    @return the line to write, with the newline
+    '''
+
+    return json.dumps({
+        KEY_SKU: sku,
+        KEY_REGION: region,
+        KEY_API: api_name,
+        KEY_STATUS: status,
+        KEY_HTTP_STATUS: http_status,
+        KEY_ATTEMPTS: attempts,
+        KEY_LATENCY: None if latency_seconds is None else round(latency_seconds, 4),
+        KEY_BYTES: byte_count,
+        KEY_URL: url,
+        KEY_TIME: round(time.time() if event_time is None else event_time, 3),
+    }, separators=(",", ":")) + "\n"
+
+
+class EventLogWriter:
+    '''
+    appends lines to a event log
+
+    lines are only guaranteed to be on disk after `sync()`, which `warcio_scrape` calls along with
+    the rest of its output files
+    '''
+
+    def __init__(self, event_log_path:typing.Union[str, os.PathLike]):
+
+        self.event_log_path = event_log_path
+        self.event_log_fh = None
+        self.lines_written = 0
+
+    def open(self):
+        self.event_log_fh = open(self.event_log_path, "a", encoding="utf-8", newline="\n")
+
+    def close(self):
+
+        if self.event_log_fh is not None:
+            self.event_log_fh.close()
+            self.event_log_fh = None
+
+    def add(self, sku:str, region:str, api_name:str, status:str, url:str, **kwargs):
+        ''' see `get_event_line()` for the arguments '''
+
+        self.event_log_fh.write(get_event_line(sku, region, api_name, status, url, **kwargs))
+        self.lines_written += 1
+
+    def flush(self):
+        self.event_log_fh.flush()
+
+    def sync(self):
+        self.event_log_fh.flush()
+        os.fsync(self.event_log_fh.fileno())
+
+
+class UrlOutcome(typing.NamedTuple):
+    ''' what the event logs say happened to a url in the end '''
+    status:str
+    url:str
+    # every attempt from every event for the url, added up
+    attempts:int
+    http_status:typing.Optional[int]
+
+
+class EventIndex:
+    '''
+    the events of one or more event logs, indexed by (region, sku) and by status
+
+    every (region, sku, api) ends up with a single UrlOutcome, with the best status it ever had (see `EVENT_STATUS_RANK_DICT`),
+    so looking up the failures of a api is just getting a set
+    '''
+
+    def __init__(self):
+
+        # (region, sku) -> api name -> UrlOutcome
+        self.item_dict = {}
+        # (api name, status) -> set of (region, sku)
+        self.status_item_set_dict = {}
+
+        self.event_count = 0
+        self.malformed_line_count = 0
+        self.total_attempts = 0
+        self.total_bytes = 0
+        self.total_latency_seconds = 0.0
+        self.latency_count = 0
+
+    def add_lines(self, line_iter:typing.Iterable[str]):
+        '''
+        @param line_iter - the lines of a event log
+        '''
+
+        done_event_match_func = DONE_EVENT_LINE_REGEX_OBJ.match
+
+        for line in line_iter:
+
+            done_match = done_event_match_func(line)
+            if done_match is not None:
+                sku, region, api_name, http_status, attempts, latency_seconds, byte_count, url = done_match.groups()
+                self.add_outcome(sku, region, api_name, EVENT_STATUS_DONE, url, int(attempts), None if http_status == "null" else int(http_status),
+                    int(byte_count), None if latency_seconds == "null" else float(latency_seconds))
+                continue
+
+            try:
+                self.add_event(json.loads(line))
+
+            except (ValueError, KeyError, TypeError):
+                # the last line might be cut off if the scraper crashed while writing it
+                self.malformed_line_count += 1
+                logger.debug("ignoring malformed event log line: `%s`", line.rstrip("\n"))
+
+    def add_event(self, event_dict:dict):
+        ''' adds a event that was already parsed out of its line '''
+
+        status = event_dict[KEY_STATUS]
+        if status not in EVENT_STATUS_RANK_DICT:
+            raise KeyError(status)
+
+        url = event_dict[KEY_URL]
+
+        # lines from before the region was written down still have it in the url
+        self.add_outcome(event_dict[KEY_SKU], event_dict.get(KEY_REGION) or get_region_from_url(url), event_dict[KEY_API], status, url,
+            event_dict.get(KEY_ATTEMPTS) or 0, event_dict.get(KEY_HTTP_STATUS), event_dict.get(KEY_BYTES) or 0,
+            event_dict.get(KEY_LATENCY))
+
+    def add_outcome(self, sku:str, region:str, api_name:str, status:str, url:str, attempts:int, http_status:typing.Optional[int],
+            byte_count:int, latency_seconds:typing.Optional[float]):
+        ''' see `get_event_line()` for the arguments '''
+
+        item_key = (region, sku)
+
+        api_dict = self.item_dict.get(item_key)
+        if api_dict is None:
+            api_dict = self.item_dict[item_key] = {}
+
+        old_outcome = api_dict.get(api_name)
+
+        if old_outcome is None:
+            new_outcome = UrlOutcome(status, url, attempts, http_status)
+
+        elif EVENT_STATUS_RANK_DICT[status] >= EVENT_STATUS_RANK_DICT[old_outcome.status]:
+            new_outcome = UrlOutcome(status, url, old_outcome.attempts + attempts, http_status)
+
+            if old_outcome.status != status:
+                self.status_item_set_dict[(api_name, old_outcome.status)].discard(item_key)
+
+        else:
+            new_outcome = old_outcome._replace(attempts=old_outcome.attempts + attempts)
+
+        api_dict[api_name] = new_outcome
+
+        status_item_set = self.status_item_set_dict.get((api_name, new_outcome.status))
+        if status_item_set is None:
+            status_item_set = self.status_item_set_dict[(api_name, new_outcome.status)] = set()
+        status_item_set.add(item_key)
+
+        self.event_count += 1
+        self.total_attempts += attempts
+        self.total_bytes += byte_count
+
+        if latency_seconds is not None:
+            self.total_latency_seconds += latency_seconds
+            self.latency_count += 1
+
+    def get_url_outcome(self, sku:str, region:str, api_name:str) -> typing.Optional[UrlOutcome]:
+        return self.item_dict.get((region, sku), {}).get(api_name)
+
+    def get_item_set(self, api_name:str, status:str) -> typing.Set[typing.Tuple[str, str]]:
+        ''' @return the (region, sku) tuples whose url for the api ended up with the status, don't modify it '''
+        return self.status_item_set_dict.get((api_name, status), set())
+
+    def get_status_count_dict(self) -> typing.Dict[str, typing.Dict[str, int]]:
+        ''' @return api name -> status -> how many urls ended up with it '''
+
+        status_count_dict = {}
+
+        for (iter_api_name, iter_status), iter_item_set in sorted(self.status_item_set_dict.items()):
+            if iter_item_set:
+                status_count_dict.setdefault(iter_api_name, {})[iter_status] = len(iter_item_set)
+
+        return status_count_dict
+
+    def log_stats(self):
+
+        logger.info("event index: `%s` events for `%s` (region, sku) items, `%s` attempts, `%s` bytes, mean latency `%.3f` seconds, `%s` malformed lines",
+            self.event_count, len(self.item_dict), self.total_attempts, self.total_bytes,
+            self.total_latency_seconds / max(1, self.latency_count), self.malformed_line_count)
+
+        for iter_api_name, iter_count_dict in self.get_status_count_dict().items():
+            logger.info("-- `%s`: %s", iter_api_name, ", ".join("`{}` {}".format(v, k) for k, v in iter_count_dict.items()))
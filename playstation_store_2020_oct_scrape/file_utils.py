@@ -0,0 +1,111 @@
+import gzip
+import logging
+import lzma
+import pathlib
+import typing
+
+logger = logging.getLogger(__name__)
+
+XZ_SUFFIX = ".xz"
+GZIP_SUFFIX = ".gz"
+ZSTD_SUFFIX = ".zst"
+
+def open_text_file(file_path:pathlib.Path, mode:str="rt", compression_level:typing.Optional[int]=None):
+    '''
+    opens a text file, transparently handling XZ, gzip or zstandard compression based
+    on the file extension
+
+    zstandard needs the optional `zstandard` package, which is only imported if we actually
+    come across a `.zst` file
+
+    @param file_path - the path to open
+    @param mode - `rt`, `wt` or `at`
+    @param compression_level - when writing, the XZ preset, gzip compresslevel or zstandard level to use
+    instead of the default one of each
+    @return a text mode file object
+    '''
+
+    suffix = file_path.suffix
+
+    # always write unix newlines, like the rest of the output files
+    newline = None if "r" in mode else "\n"
+
+    if suffix == XZ_SUFFIX:
+        logger.debug("opening `%s` as a XZ compressed text file", file_path)
+        return lzma.open(file_path, mode, encoding="utf-8", newline=newline, preset=compression_level)
+
+    elif suffix == GZIP_SUFFIX:
+        logger.debug("opening `%s` as a gzip compressed text file", file_path)
+        return gzip.open(file_path, mode, encoding="utf-8", newline=newline,
+            compresslevel=9 if compression_level is None else compression_level)
+
+    elif suffix == ZSTD_SUFFIX:
+        logger.debug("opening `%s` as a zstandard compressed text file", file_path)
+
+        try:
+            import zstandard
+        except ImportError as e:
+            raise Exception("the file `{}` is zstandard compressed, but the `zstandard` package is not installed".format(file_path)) from e
+
+        cctx = None if compression_level is None else zstandard.ZstdCompressor(level=compression_level)
+
+        return zstandard.open(file_path, mode, cctx=cctx, encoding="utf-8", newline=newline)
+
+    else:
+        logger.debug("opening `%s` as a text file", file_path)
+        return open(file_path, mode, encoding="utf-8", newline=newline)
+
+def iter_content_ids(file_path:pathlib.Path) -> typing.Iterator[str]:
+    '''
+    lazily reads a file of newline delimited content ids / skus, skipping blank lines
+
+    @param file_path - the (maybe compressed) file of content ids
+    @return a iterator of content id strings
+    '''
+
+    with open_text_file(file_path, "rt") as f:
+
+        for line in f:
+
+            content_id = line.strip()
+
+            if content_id:
+                yield content_id
+
+def count_content_ids(file_path:pathlib.Path) -> int:
+    '''
+    counts the content ids in a file without keeping any of them around
+
+    @param file_path - the (maybe compressed) file of content ids
+    @return how many content ids are in the file
+    '''
+
+    return sum(1 for _ in iter_content_ids(file_path))
+
+def load_content_id_set(file_path:pathlib.Path) -> typing.Set[str]:
+    '''
+    reads a file of content ids into a set, for checking if content ids are in it
+
+    @param file_path - the (maybe compressed) file of content ids
+    @return a set of content id strings
+    '''
+
+    return set(iter_content_ids(file_path))
+
+def add_name_suffix(file_path:pathlib.Path, name_suffix:str) -> pathlib.Path:
+    '''
+    adds something to the name of a file, before all of its extensions, so `foo.warc.gz` with
+    a suffix of `worker01` becomes `foo.worker01.warc.gz`
+
+    @param file_path - the path to change
+    @param name_suffix - what to add to the name
+    @return the new path
+    '''
+
+    name = file_path.name
+    extension_idx = name.find(".")
+
+    if extension_idx <= 0:
+        return file_path.with_name("{}.{}".format(name, name_suffix))
+
+    return file_path.with_name("{}.{}{}".format(name[:extension_idx], name_suffix, name[extension_idx:]))
@@ -1,57 +1,248 @@
 
+import concurrent.futures
+import json
 import logging
-import lzma
+import os
+import pathlib
+import time
+import typing
 
+import attr
+
+from playstation_store_2020_oct_scrape import file_utils
+from playstation_store_2020_oct_scrape import warcio_scrape
+from playstation_store_2020_oct_scrape import wpull_database
 
 logger = logging.getLogger(__name__)
 
-VALKYRIE_API_URL_FORMAT = "https://store.playstation.com/valkyrie-api/{}/{}/999/resolve/{}"
-CHIHIRO_API_URL_FORMAT = "https://store.playstation.com/store/api/chihiro/00_09_000/container/{}/{}/999/{}"
+# how the lists in the `regions/` folder of the `playstation_content_ids` repo are named, like `zh-hans-cn.txt.xz`
+REGION_CONTENT_IDS_FILE_SUFFIX = ".txt.xz"
+REGION_URL_LIST_FILE_NAME_FORMAT = "wpull_urls_{}.txt"
 
-def run(parsed_args):
+# how much of a content id list is read (and written out as urls) at once in the batch mode
+URL_LIST_CHUNK_SIZE = 4 * 1024 * 1024
 
+COMPRESSION_NONE = "none"
+COMPRESSION_SUFFIX_DICT = {
+    COMPRESSION_NONE: "",
+    "xz": file_utils.XZ_SUFFIX,
+    "zst": file_utils.ZSTD_SUFFIX,
+}
+# a url list is the same few prefixes over and over, the lowest XZ presets end up just as small as the default
+# one (6) while being over 10 times faster, and the zstandard default (3) is already fast
+URL_LIST_COMPRESSION_LEVEL_DICT = {
+    file_utils.XZ_SUFFIX: 1,
+}
 
-    region_lang = parsed_args.region_lang
-    region_country = parsed_args.region_country
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class RegionUrlList:
+    ''' one region for the batch mode '''
 
-    input_file_path = parsed_args.content_ids_file
-    output_file_path = parsed_args.output_file
+    # like `zh-hans-cn`, what the content id list is named after
+    region:str
+    content_ids_path:pathlib.Path
+    output_path:pathlib.Path
 
-    file_obj = None
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class RegionUrlListResult:
+    region:str
+    output_path:pathlib.Path
+    content_id_count:int
+    url_count:int
+    seconds:float
 
-    logger.info("region language: `%s`, region country: `%s`", region_lang, region_country)
 
-    if input_file_path.suffix == ".xz":
+def get_region_lang_and_country(region:str) -> typing.Tuple[str, str]:
+    '''
+    the store api doesn't handle language tags with a script, so `zh-hans-cn` is just `/zh/cn/`,
+    the same thing `bootstrap_wpull.py` does
 
-        logger.info("reading the file `%s` as a XZ compressed text file", input_file_path)
+    @param region - like `en-us` or `zh-hans-cn`
+    @return the (language, country) to put in the urls
+    '''
 
-        file_obj = lzma.open(input_file_path, "rt")
+    region_lang, _, region_country = region.lower().rpartition("-")
 
-    else:
+    if not region_lang or not region_country:
+        raise Exception("`{}` doesn't look like a `<language>-<country>` region".format(region))
 
-        logger.info("reading the file `%s` as a text file", input_file_path)
+    if region_lang.startswith("zh"):
+        region_lang = "zh"
 
-        file_obj = open(input_file_path, "r", encoding="utf-8")
+    return region_lang, region_country
 
+def write_region_url_list(region_url_list:RegionUrlList, base_url:typing.Optional[str]=None) -> RegionUrlListResult:
+    '''
+    writes the valkyrie and chihiro urls for every content id of a region, what the `--jobs` worker processes run
 
-    logger.info("writing to output file `%s`", output_file_path)
+    the list is read a few megabytes at a time and the urls for all of it are written with a single `write()`,
+    instead of going line by line
 
-    with open(output_file_path, "w", encoding="utf-8") as f:
+    @param region_url_list - the region
+    @param base_url - see `warcio_scrape.get_api_url_formats()`
+    @return a RegionUrlListResult
+    '''
+
+    start_time = time.perf_counter()
+
+    region_lang, region_country = get_region_lang_and_country(region_url_list.region)
+    valkyrie_url_format, chihiro_url_format = warcio_scrape.get_api_url_formats(base_url)
+
+    # the content id is always the end of the url
+    valkyrie_url_prefix = valkyrie_url_format.format(region_lang, region_country, "")
+    chihiro_url_prefix = chihiro_url_format.format(region_country, region_lang, "")
+
+    content_id_count = 0
+    partial_line = ""
+
+    with file_utils.open_text_file(region_url_list.content_ids_path, "rt") as input_fh, \
+            file_utils.open_text_file(region_url_list.output_path, "wt",
+                URL_LIST_COMPRESSION_LEVEL_DICT.get(region_url_list.output_path.suffix)) as output_fh:
 
         while True:
 
-            content_id = file_obj.readline().strip()
+            chunk = input_fh.read(URL_LIST_CHUNK_SIZE)
+            is_last_chunk = not chunk
+
+            chunk = partial_line + chunk
+            if not is_last_chunk:
+                # the last line might continue in the next chunk
+                chunk, _, partial_line = chunk.rpartition("\n")
+
+            content_id_list = [x for x in chunk.split() if x]
+            content_id_count += len(content_id_list)
 
-            if not content_id:
+            output_fh.write("".join(["{}{}\n{}{}\n".format(valkyrie_url_prefix, x, chihiro_url_prefix, x) for x in content_id_list]))
+
+            if is_last_chunk:
                 break
 
-            valkyrie_url = VALKYRIE_API_URL_FORMAT.format(region_lang, region_country, content_id)
-            chihiro_url = CHIHIRO_API_URL_FORMAT.format(region_country, region_lang, content_id)
+    return RegionUrlListResult(region=region_url_list.region, output_path=region_url_list.output_path,
+        content_id_count=content_id_count, url_count=content_id_count * 2, seconds=time.perf_counter() - start_time)
+
+def get_region_url_list_list(regions_folder:pathlib.Path, output_folder:pathlib.Path, region_list:typing.Optional[typing.Sequence[str]],
+        compression:str=COMPRESSION_NONE) -> typing.List[RegionUrlList]:
+    '''
+    @param regions_folder - the `regions/` folder of the `playstation_content_ids` repo
+    @param output_folder - where the url lists go
+    @param region_list - the regions to do, like `en-us`, or None for every list in the folder
+    @param compression - one of the keys of `COMPRESSION_SUFFIX_DICT`
+    @return a RegionUrlList per region, sorted by region
+    '''
+
+    if region_list is None:
+        region_list = [x.name[:-len(REGION_CONTENT_IDS_FILE_SUFFIX)] for x in regions_folder.iterdir()
+            if x.is_file() and x.name.endswith(REGION_CONTENT_IDS_FILE_SUFFIX)]
+
+    region_url_list_list = []
+
+    for iter_region in sorted(set(x.lower() for x in region_list)):
+
+        content_ids_path = regions_folder / "{}{}".format(iter_region, REGION_CONTENT_IDS_FILE_SUFFIX)
+        if not content_ids_path.is_file():
+            raise Exception("there is no content id list for the region `{}`, expected `{}`".format(iter_region, content_ids_path))
+
+        output_path = output_folder / (REGION_URL_LIST_FILE_NAME_FORMAT.format(iter_region) + COMPRESSION_SUFFIX_DICT[compression])
+        region_url_list_list.append(RegionUrlList(region=iter_region, content_ids_path=content_ids_path, output_path=output_path))
+
+    return region_url_list_list
 
-            f.write("{}\n".format(valkyrie_url))
-            f.write("{}\n".format(chihiro_url))
+def run_batch(parsed_args):
+    ''' the `generate_wpull_urls_for_regions` subcommand '''
 
-    file_obj.close()
+    region_list = None
+    if parsed_args.language_tag:
+        # `zh-Hans-CN` -> `zh-hans-cn`, the same as the file names
+        region_list = [str(x).lower() for x in parsed_args.language_tag]
+
+    region_url_list_list = get_region_url_list_list(parsed_args.regions_folder, parsed_args.output_folder, region_list, parsed_args.compression)
+
+    if not region_url_list_list:
+        raise Exception("no `*{}` content id lists found in `{}`".format(REGION_CONTENT_IDS_FILE_SUFFIX, parsed_args.regions_folder))
+
+    jobs = max(1, min(parsed_args.jobs or os.cpu_count() or 1, len(region_url_list_list)))
+    logger.info("writing the url lists of `%s` regions to `%s` with `%s` processes", len(region_url_list_list), parsed_args.output_folder, jobs)
+
+    start_time = time.perf_counter()
+
+    if jobs == 1:
+        result_list = [write_region_url_list(x, parsed_args.base_url) for x in region_url_list_list]
+
+    else:
+        # the biggest lists first, so one of them isn't left for last
+        region_url_list_list = sorted(region_url_list_list, key=lambda x: x.content_ids_path.stat().st_size, reverse=True)
 
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            result_list = list(executor.map(write_region_url_list, region_url_list_list, [parsed_args.base_url] * len(region_url_list_list)))
 
+        result_list.sort(key=lambda x: x.region)
+
+    for iter_result in result_list:
+        logger.info("-- `%s`: `%s` content ids, `%s` urls, `%.2f` seconds, wrote `%s`", iter_result.region, iter_result.content_id_count,
+            iter_result.url_count, iter_result.seconds, iter_result.output_path)
+
+    logger.info("wrote `%s` urls for `%s` content ids in `%.2f` seconds", sum(x.url_count for x in result_list),
+        sum(x.content_id_count for x in result_list), time.perf_counter() - start_time)
+
+    if parsed_args.counts_file is not None:
+        logger.info("writing the counts to `%s`", parsed_args.counts_file)
+
+        with open(parsed_args.counts_file, "w", encoding="utf-8") as f:
+            json.dump({x.region: {"content_ids": x.content_id_count, "urls": x.url_count, "output_file": x.output_path.name}
+                for x in result_list}, f, indent=4)
+
+def run(parsed_args):
+
+
+    region_lang = parsed_args.region_lang
+    region_country = parsed_args.region_country
+
+    input_file_path = parsed_args.content_ids_file
+    output_file_path = parsed_args.output_file
+    output_database_path = parsed_args.output_database
+
+    logger.info("region language: `%s`, region country: `%s`", region_lang, region_country)
+
+    logger.info("reading content ids from `%s`", input_file_path)
+
+    if output_database_path is not None:
+        logger.info("writing to a new wpull database `%s`", output_database_path)
+    else:
+        logger.info("writing to output file `%s`", output_file_path)
+
+    # for pointing wpull at the mock store
+    if parsed_args.base_url is not None:
+        logger.info("using `%s` instead of the real store", parsed_args.base_url)
+
+    valkyrie_url_format, chihiro_url_format = warcio_scrape.get_api_url_formats(parsed_args.base_url)
+
+    # skus that `warcio_scrape` found don't exist, no point giving them to wpull
+    dead_sku_set = set()
+    if parsed_args.dead_skus_file is not None:
+        dead_sku_set = file_utils.load_content_id_set(parsed_args.dead_skus_file)
+        logger.info("skipping the `%s` dead skus in `%s`", len(dead_sku_set), parsed_args.dead_skus_file)
+
+    skipped_dead_sku_count = 0
+
+    def _iter_urls() -> typing.Iterator[str]:
+        nonlocal skipped_dead_sku_count
+
+        for content_id in file_utils.iter_content_ids(input_file_path):
+
+            if content_id in dead_sku_set:
+                skipped_dead_sku_count += 1
+                continue
+
+            yield valkyrie_url_format.format(region_lang, region_country, content_id)
+            yield chihiro_url_format.format(region_country, region_lang, content_id)
+
+    if output_database_path is not None:
+        url_count = wpull_database.create_wpull_database(output_database_path, _iter_urls())
+        logger.info("queued `%s` urls in `%s`", url_count, output_database_path)
+
+    else:
+        with open(output_file_path, "w", encoding="utf-8") as f:
+            for iter_url in _iter_urls():
+                f.write("{}\n".format(iter_url))
 
+    logger.info("skipped `%s` dead skus", skipped_dead_sku_count)
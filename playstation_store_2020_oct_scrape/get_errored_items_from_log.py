@@ -1,87 +1,460 @@
-import time
+import concurrent.futures
+import glob
+import itertools
 import logging
-import attr
+import os
+import pathlib
 import re
-from playstation_store_2020_oct_scrape.warcio_scrape import ApiEntry
+import typing
+
+import attr
+
+from playstation_store_2020_oct_scrape import event_log
+from playstation_store_2020_oct_scrape import file_utils
+from playstation_store_2020_oct_scrape.warcio_scrape import ApiEntry, ApiType, get_api_name
 
 logger = logging.getLogger(__name__)
 
+# every line that starts an item has the `ApiEntry` repr in it, so that is checked before running any regex
+ITEM_START_MARKER = "ApiEntry("
+ITEM_START_REGEX_OBJ = re.compile(r"warcio_scrape INFO    \: \`[0-9]+ \/ (?:[0-9]+|\?)\`.*?"
+    r"sku='([0-9a-zA-Z\-\_]+)'.*?valkyrie_url='([0-9a-zA-Z\-\_\:\/\.]+)'.*?chihiro_url='([0-9a-zA-Z\-\_\:\/\.]+)'")
+
+ITEM_SKIPPED_MARKER = "` retries"
+ITEM_SKIPPED_REGEX_OBJ = re.compile(r"hit `[0-9]+` retries(?:.*?URL `(https?:\/\/[^`]+)`)?")
+
+# the path, not the host, so logs from a `--base-url` scrape work too
+VALKYRIE_URL_MARKER = "/valkyrie-api/"
+CHIHIRO_URL_MARKER = "/store/api/chihiro/"
+
+LOG_END_MARKER = ": start time: `"
+
+UNKNOWN_REGION = event_log.UNKNOWN_REGION
+ERRORED_ITEMS_FILE_NAME_FORMAT = "errored_items_{}.txt"
+
 @attr.s
 class ErrorItem:
     api:ApiEntry = attr.ib()
     valkyrie_failed:bool = attr.ib()
     chihiro_failed:bool = attr.ib()
 
-def run(parsed_args):
-    item_start_regex_obj = re.compile(r"warcio_scrape INFO    \: \`[0-9]+ \/ [0-9]+\`")
-    item_sku_regex_obj = re.compile(r"sku='([0-9a-zA-Z\-\_]+)'")
-    item_valkyrie_regex_obj = re.compile(r"valkyrie_url='([0-9a-zA-Z\-\_\:\/\.]+)'")
-    item_chihiro_regex_obj = re.compile(r"chihiro_url='([0-9a-zA-Z\-\_\:\/\.]+)'")
-    item_skipped_regex_obj = re.compile(r"hit `[0-9]+` retries")
-    old_valkyrie_skipped_regex_obj = re.compile(r"ApiEntry")
-    new_valkyrie_skipped_regex_obj = re.compile(r"URL `https:\/\/store\.playstation\.com\/valkyrie-api")
-    chihiro_skipped_regex_obj = re.compile(r"URL `https:\/\/store\.playstation\.com\/store\/api\/chihiro")
-    log_end_regex_obj = re.compile(r": start time: `")
+@attr.s(auto_attribs=True, kw_only=True)
+class LogParseResult:
+    ''' what one pass over the log (or a chunk of it, with `--jobs`) found '''
+
+    total_items_count:int = 0
+    # sku -> (valkyrie_url, chihiro_url), the first time the sku started, keyed by (region, sku) once merged
+    started_url_dict:dict = attr.ib(factory=dict)
+    # sku (or (region, sku)) -> [valkyrie_failed, chihiro_failed]
+    failed_flags_dict:dict = attr.ib(factory=dict)
+    # failures without a url that came before the first item that started, only happens at the start of a chunk
+    orphan_failed_flags_list:list = attr.ib(factory=list)
+    last_started_sku:typing.Optional[str] = None
+    hit_log_end:bool = False
 
+
+def parse_log_lines(line_iter:typing.Iterable[str]) -> LogParseResult:
+    '''
+    one pass over the lines of a warcio scrape log
+
+    with `--concurrency` the lines for different items are interleaved, so the failure lines
+    are matched up to the item using the sku at the end of the url, instead of assuming
+    that they belong to the last item that started
+
+    @param line_iter - the lines of the log
+    @return a LogParseResult
+    '''
+
+    result = LogParseResult()
+    started_url_dict = result.started_url_dict
+    failed_flags_dict = result.failed_flags_dict
+    current_sku = None
     total_items_count = 0
-    errored_item_list = []
-    valkyrie_failed = False
-    chihiro_failed = False
-    current_api_entry = None
-    logger.info("Opening log file: `%s`", parsed_args.source_log)
-    with open(parsed_args.source_log, "r", encoding="utf-8") as source_log_fh:
-        for line in source_log_fh:
-            if line != "\n":
-
-                if item_start_regex_obj.search(line) or log_end_regex_obj.search(line):
-                    total_items_count += 1
-                    # Previous item has now ended, so store
-                    # results if necessary
-                    if current_api_entry is not None and (valkyrie_failed or chihiro_failed):
-                        sku_list = [x.api.sku for x in errored_item_list]
-                        # Only add unique entries
-                        if current_api_entry.sku not in sku_list:
-                            errored_item_list.append(ErrorItem(current_api_entry, valkyrie_failed, chihiro_failed))
-
-                    if log_end_regex_obj.search(line):
-                        break
-
-                    # Setup for the next item
-                    valkyrie_failed = False
-                    chihiro_failed = False
-                    sku = item_sku_regex_obj.search(line).group(1)
-                    valkyrie_url = item_valkyrie_regex_obj.search(line).group(1)
-                    chihiro_url = item_chihiro_regex_obj.search(line).group(1)
-                    current_api_entry = ApiEntry(sku=sku,valkyrie_url=valkyrie_url, chihiro_url=chihiro_url)
-
-                if item_skipped_regex_obj.search(line):
-                    if old_valkyrie_skipped_regex_obj.search(line) or new_valkyrie_skipped_regex_obj.search(line):
-                        valkyrie_failed = True
-
-                    if chihiro_skipped_regex_obj.search(line):
-                        chihiro_failed = True
-
-    logger.info("found `%s` failed items out of %s total items for a failure rate of %1.2f%%", len(errored_item_list), total_items_count, len(errored_item_list)/total_items_count*100)
 
-    errored_valkyrie_list = [x.api for x in errored_item_list if x.valkyrie_failed and not x.chihiro_failed]
-    errored_chihiro_list = [x.api for x in errored_item_list if x.chihiro_failed and not x.valkyrie_failed]
-    errored_both_list = [x.api for x in errored_item_list if x.valkyrie_failed and x.chihiro_failed]
+    for line in line_iter:
 
-    logger.info("-- `%s` have failed valkyrie links only", len(errored_valkyrie_list))
-    logger.info("-- `%s` have failed chihiro links only", len(errored_chihiro_list))
-    logger.info("-- `%s` have both failed valkyrie and chihiro links", len(errored_both_list))
+        if ITEM_START_MARKER in line:
+            start_match = ITEM_START_REGEX_OBJ.search(line)
+            if start_match:
+                total_items_count += 1
+                current_sku, valkyrie_url, chihiro_url = start_match.groups()
+                if current_sku not in started_url_dict:
+                    started_url_dict[current_sku] = (valkyrie_url, chihiro_url)
+                continue
 
-    logger.info("Writing to %s", parsed_args.error_item_output_file)
-    if parsed_args.output_as_URLs:
-        logger.info("Writing out URLs instead of IDs")
-    if parsed_args.only_dual_failures:
-        logger.info("Writing only items with dual failures")
-    if parsed_args.only_valkyrie_failures:
-        logger.info("Writing only items with valkyrie failures and no chihiro failures")
-    if parsed_args.only_chihiro_failures:
-        logger.info("Writing only items with chihiro failures and no valkyrie failures")
+        if ITEM_SKIPPED_MARKER in line:
+            skipped_match = ITEM_SKIPPED_REGEX_OBJ.search(line)
+            if not skipped_match:
+                continue
+
+            failed_url = skipped_match.group(1)
+
+            if failed_url is not None:
+                failed_sku = failed_url.rsplit("/", 1)[-1]
+                # the old log format had the `ApiEntry` in the line for valkyrie failures
+                valkyrie_failed = VALKYRIE_URL_MARKER in failed_url or ITEM_START_MARKER in line
+                chihiro_failed = CHIHIRO_URL_MARKER in failed_url
+            else:
+                failed_sku = current_sku
+                valkyrie_failed = ITEM_START_MARKER in line
+                chihiro_failed = False
+
+            if failed_sku is None:
+                result.orphan_failed_flags_list.append([valkyrie_failed, chihiro_failed])
+                continue
+
+            # Only add unique entries, the flags are [valkyrie_failed, chihiro_failed]
+            failed_flags = failed_flags_dict.get(failed_sku)
+            if failed_flags is None:
+                failed_flags_dict[failed_sku] = [valkyrie_failed, chihiro_failed]
+            else:
+                failed_flags[0] = failed_flags[0] or valkyrie_failed
+                failed_flags[1] = failed_flags[1] or chihiro_failed
+
+        elif LOG_END_MARKER in line:
+            result.hit_log_end = True
+            break
+
+    result.total_items_count = total_items_count
+    result.last_started_sku = current_sku
+    return result
+
+def get_log_chunk_offset_list(log_path:pathlib.Path, chunk_count:int) -> typing.List[typing.Tuple[int, int]]:
+    '''
+    splits a (uncompressed) log into about `chunk_count` byte ranges that start and end on a line
+
+    @return a list of (start, end) byte offsets
+    '''
+
+    file_size = log_path.stat().st_size
+    offset_list = [0]
+
+    with open(log_path, "rb") as f:
+        for idx in range(1, chunk_count):
+            f.seek(file_size * idx // chunk_count)
+            f.readline()
+            offset = f.tell()
+            if offset_list[-1] < offset < file_size:
+                offset_list.append(offset)
+
+    offset_list.append(file_size)
+
+    return list(zip(offset_list, offset_list[1:]))
+
+def _iter_log_chunk_lines(log_path:pathlib.Path, start:int, end:int) -> typing.Iterator[str]:
+
+    with open(log_path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+
+        for line in f:
+            yield line.decode("utf-8")
+            remaining -= len(line)
+            if remaining <= 0:
+                break
+
+def parse_log_chunk(log_path:pathlib.Path, start:int, end:int) -> LogParseResult:
+    '''
+    what the `--jobs` worker processes run
+
+    only the urls of the skus that failed (and of the last sku to start, for `orphan_failed_flags_list`) are
+    kept, sending every started sku back to the main process would take longer then parsing the chunk did
+    '''
+
+    result = parse_log_lines(_iter_log_chunk_lines(log_path, start, end))
+
+    started_url_dict = result.started_url_dict
+    result.started_url_dict = {sku: started_url_dict[sku] for sku in result.failed_flags_dict if sku in started_url_dict}
+
+    if result.last_started_sku is not None:
+        result.started_url_dict[result.last_started_sku] = started_url_dict[result.last_started_sku]
+
+    return result
+
+def merge_log_parse_results(result_list:typing.Sequence[LogParseResult]) -> LogParseResult:
+    '''
+    merges the LogParseResults of the chunks of a log, in the order the chunks are in the log
+
+    @return a single LogParseResult, like one pass over the whole log would have returned
+    '''
+
+    merged_result = LogParseResult()
+
+    for iter_result in result_list:
+
+        merged_result.total_items_count += iter_result.total_items_count
+
+        for iter_sku, iter_urls in iter_result.started_url_dict.items():
+            merged_result.started_url_dict.setdefault(iter_sku, iter_urls)
+
+        # these belong to whatever item was the last to start in the chunks before
+        for iter_flags in iter_result.orphan_failed_flags_list:
+            if merged_result.last_started_sku is None:
+                merged_result.orphan_failed_flags_list.append(iter_flags)
+            else:
+                _merge_failed_flags(merged_result.failed_flags_dict, merged_result.last_started_sku, iter_flags)
+
+        for iter_sku, iter_flags in iter_result.failed_flags_dict.items():
+            _merge_failed_flags(merged_result.failed_flags_dict, iter_sku, iter_flags)
+
+        if iter_result.last_started_sku is not None:
+            merged_result.last_started_sku = iter_result.last_started_sku
+
+        # anything after the end of the log is from a later run appended to the same file
+        if iter_result.hit_log_end:
+            merged_result.hit_log_end = True
+            break
+
+    return merged_result
+
+def _merge_failed_flags(failed_flags_dict:dict, sku:str, flags:typing.List[bool]):
+
+    failed_flags = failed_flags_dict.setdefault(sku, [False, False])
+    failed_flags[0] = failed_flags[0] or flags[0]
+    failed_flags[1] = failed_flags[1] or flags[1]
+
+def parse_log(log_path:pathlib.Path, jobs:int=1) -> LogParseResult:
+    '''
+    parses a warcio scrape log, which can be XZ, gzip or zstandard compressed
+
+    @param log_path - the log
+    @param jobs - if more then 1, a uncompressed log is split into chunks that are parsed by this many processes
+    @return a LogParseResult
+    '''
+
+    is_compressed = log_path.suffix in (file_utils.XZ_SUFFIX, file_utils.GZIP_SUFFIX, file_utils.ZSTD_SUFFIX)
+
+    if jobs > 1 and is_compressed:
+        logger.warning("`%s` is compressed and can't be split up, parsing it with a single process", log_path)
+
+    if jobs <= 1 or is_compressed:
+        with file_utils.open_text_file(log_path) as source_log_fh:
+            return parse_log_lines(source_log_fh)
+
+    # a few chunks per process, so one slow chunk doesn't hold everything up
+    chunk_offset_list = get_log_chunk_offset_list(log_path, jobs * 4)
+    logger.info("parsing the log in `%s` chunks with `%s` processes", len(chunk_offset_list), jobs)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        result_list = list(executor.map(parse_log_chunk,
+            [log_path] * len(chunk_offset_list), *zip(*chunk_offset_list)))
+
+    # find the chunk that the failures of a sku that started in a earlier chunk are in, before merging
+    last_unresolved_chunk_idx = None
+    for idx, iter_result in enumerate(result_list):
+        if any(x not in iter_result.started_url_dict for x in iter_result.failed_flags_dict):
+            last_unresolved_chunk_idx = idx
+        if iter_result.hit_log_end:
+            break
+
+    merged_result = merge_log_parse_results(result_list)
+
+    if last_unresolved_chunk_idx is not None:
+        _resolve_started_urls(log_path, chunk_offset_list[:last_unresolved_chunk_idx], merged_result)
+
+    return merged_result
+
+def _resolve_started_urls(log_path:pathlib.Path, chunk_offset_list:typing.Sequence[typing.Tuple[int, int]], merged_result:LogParseResult):
+    '''
+    looks for the urls of the failed skus that started in a earlier chunk then they failed in, going backwards
+    through the chunks since with `--concurrency` the item almost always started shortly before
+
+    @param chunk_offset_list - the chunks before the last one that had a sku like that
+    @param merged_result - the result of `merge_log_parse_results()`, `started_url_dict` gets updated
+    '''
+
+    unresolved_sku_set = set(merged_result.failed_flags_dict.keys()) - merged_result.started_url_dict.keys()
+    logger.debug("looking for the urls of `%s` skus that started in an earlier chunk", len(unresolved_sku_set))
+
+    for iter_start, iter_end in reversed(chunk_offset_list):
+
+        if not unresolved_sku_set:
+            break
+
+        chunk_result = parse_log_lines(_iter_log_chunk_lines(log_path, iter_start, iter_end))
+
+        for iter_sku in unresolved_sku_set & chunk_result.started_url_dict.keys():
+            merged_result.started_url_dict[iter_sku] = chunk_result.started_url_dict[iter_sku]
+            unresolved_sku_set.discard(iter_sku)
+
+def get_source_log_path_list(source_log_list:typing.Optional[typing.List[pathlib.Path]],
+        source_log_glob_list:typing.Optional[typing.List[str]]) -> typing.List[pathlib.Path]:
+    '''
+    @param source_log_list - the `--source-log` paths
+    @param source_log_glob_list - the `--source-log-glob` patterns, `**` works
+    @return the logs without duplicates, in the order they were given, with the matches of a glob sorted
+    '''
+
+    path_list = list(source_log_list or [])
+
+    for iter_glob in source_log_glob_list or []:
+
+        glob_path_list = sorted(pathlib.Path(x) for x in glob.glob(iter_glob, recursive=True) if os.path.isfile(x))
+
+        if not glob_path_list:
+            logger.warning("the glob `%s` didn't match any logs", iter_glob)
+
+        path_list.extend(glob_path_list)
+
+    return list({x.resolve(): x for x in path_list}.values())
+
+def merge_log_round_results(result_list:typing.Sequence[LogParseResult]) -> LogParseResult:
+    '''
+    merges the LogParseResults of different logs, like the ones from each droplet and each retry round, and the ones
+    of different regions
+
+    the same sku can be in more then one region, so the items are told apart by (region, sku), with the region coming
+    from the urls the sku started with (see `get_region_from_urls()`). A item only counts as failed for an api if it
+    failed in every log it was attempted in, so a sku that failed in the first round but worked in a later one isn't
+    listed, no matter what order the logs are in
+
+    @param result_list - the LogParseResults of each log, keyed by sku
+    @return a single LogParseResult keyed by (region, sku) instead, where `total_items_count` is the number of unique
+    items, or the one of the only result if there is just one
+    '''
+
+    merged_result = LogParseResult()
+    merged_started_url_dict = merged_result.started_url_dict
+    # (region, sku) -> [valkyrie_succeeded, chihiro_succeeded]
+    succeeded_flags_dict = {}
+    not_failed_flags = (False, False)
+
+    for iter_result in result_list:
+
+        started_url_dict = iter_result.started_url_dict
+        merged_result.orphan_failed_flags_list.extend(iter_result.orphan_failed_flags_list)
+
+        # in the order the skus showed up, a failure without a start line still counts as a attempt
+        for iter_sku in itertools.chain(started_url_dict, (x for x in iter_result.failed_flags_dict if x not in started_url_dict)):
+
+            started_urls = started_url_dict.get(iter_sku)
+
+            if started_urls is None:
+                item_key = (UNKNOWN_REGION, iter_sku)
+
+            else:
+                item_key = (get_region_from_urls(*started_urls), iter_sku)
+
+                # a event log from a `--resume` run might only have one of the urls
+                old_started_urls = merged_started_url_dict.get(item_key)
+                if old_started_urls is None:
+                    merged_started_url_dict[item_key] = started_urls
+                elif None in old_started_urls:
+                    merged_started_url_dict[item_key] = tuple(x if x is not None else y for x, y in zip(old_started_urls, started_urls))
+
+            failed_flags = iter_result.failed_flags_dict.get(iter_sku, not_failed_flags)
+            succeeded_flags = succeeded_flags_dict.setdefault(item_key, [False, False])
+            succeeded_flags[0] = succeeded_flags[0] or not failed_flags[0]
+            succeeded_flags[1] = succeeded_flags[1] or not failed_flags[1]
+
+    merged_result.failed_flags_dict = {item_key: [not valkyrie_succeeded, not chihiro_succeeded]
+        for item_key, (valkyrie_succeeded, chihiro_succeeded) in succeeded_flags_dict.items() if not (valkyrie_succeeded and chihiro_succeeded)}
+    # a single log parsed with `--jobs` only keeps the urls of the failed skus, so it knows its count better
+    merged_result.total_items_count = result_list[0].total_items_count if len(result_list) == 1 else len(succeeded_flags_dict)
+
+    return merged_result
+
+def parse_log_list(log_path_list:typing.Sequence[pathlib.Path], jobs:int=1) -> typing.List[LogParseResult]:
+    '''
+    parses one or more warcio scrape logs
+
+    @param log_path_list - the logs
+    @param jobs - how many processes to use, for a single log see `parse_log()`, with more then one log each process parses a log
+    @return a LogParseResult per log, for `merge_log_round_results()`
+    '''
+
+    if len(log_path_list) == 1:
+        return [parse_log(log_path_list[0], jobs)]
+
+    if jobs <= 1:
+        result_list = [parse_log(x) for x in log_path_list]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            result_list = list(executor.map(parse_log, log_path_list))
+
+    for iter_log_path, iter_result in zip(log_path_list, result_list):
+        logger.info("-- `%s`: `%s` items, `%s` with failures", iter_log_path, iter_result.total_items_count, len(iter_result.failed_flags_dict))
+
+    return result_list
+
+def get_log_parse_result_list_from_event_index(event_index:event_log.EventIndex) -> typing.List[LogParseResult]:
+    '''
+    @param event_index - the EventIndex of the event logs
+    @return a LogParseResult per region, like parsing the log of each region would have given, except that the skus
+    that didn't fail are in `started_url_dict` too, so `merge_log_round_results()` knows that they worked
+    '''
+
+    valkyrie_api_name = get_api_name(ApiType.VALKYRIE)
+    chihiro_api_name = get_api_name(ApiType.CHIHIRO)
+
+    failed_item_set = event_index.get_item_set(valkyrie_api_name, event_log.EVENT_STATUS_FAILED) \
+        | event_index.get_item_set(chihiro_api_name, event_log.EVENT_STATUS_FAILED)
+
+    # region -> LogParseResult
+    region_result_dict = {}
+
+    # in the order the skus first showed up, like with the logs
+    for (iter_region, iter_sku), iter_api_dict in event_index.item_dict.items():
+
+        result = region_result_dict.get(iter_region)
+        if result is None:
+            result = region_result_dict[iter_region] = LogParseResult()
+
+        result.total_items_count += 1
+
+        valkyrie_outcome = iter_api_dict.get(valkyrie_api_name)
+        chihiro_outcome = iter_api_dict.get(chihiro_api_name)
+
+        # with `--resume` a event log might only have one of the urls of a sku
+        result.started_url_dict[iter_sku] = (None if valkyrie_outcome is None else valkyrie_outcome.url,
+            None if chihiro_outcome is None else chihiro_outcome.url)
+
+        if (iter_region, iter_sku) in failed_item_set:
+            result.failed_flags_dict[iter_sku] = [
+                valkyrie_outcome is not None and valkyrie_outcome.status == event_log.EVENT_STATUS_FAILED,
+                chihiro_outcome is not None and chihiro_outcome.status == event_log.EVENT_STATUS_FAILED]
+
+    return list(region_result_dict.values())
+
+def parse_event_log_list(event_log_path_list:typing.Sequence[pathlib.Path]) -> typing.List[LogParseResult]:
+    '''
+    reads event logs (see `event_log.py`) instead of scanning the text of the logs, they can be XZ, gzip or zstandard compressed
+
+    @return a LogParseResult per region, see `get_log_parse_result_list_from_event_index()`
+    '''
+
+    event_index = event_log.EventIndex()
+
+    for iter_event_log_path in event_log_path_list:
+
+        logger.info("reading the event log `%s`", iter_event_log_path)
+
+        with file_utils.open_text_file(iter_event_log_path) as f:
+            event_index.add_lines(f)
+
+    event_index.log_stats()
+
+    return get_log_parse_result_list_from_event_index(event_index)
+
+def get_region_from_urls(valkyrie_url:typing.Optional[str], chihiro_url:typing.Optional[str]) -> str:
+    ''' @return the region of the urls, like `ja-jp`, from the valkyrie url, or the chihiro url if there isn't one '''
+
+    for iter_url in (valkyrie_url, chihiro_url):
+
+        if iter_url is not None:
+            region = event_log.get_region_from_url(iter_url)
+            if region != UNKNOWN_REGION:
+                return region
+
+    return UNKNOWN_REGION
+
+def get_region(api_entry:ApiEntry) -> str:
+    ''' @return the region of the item, see `get_region_from_urls()` '''
+    return get_region_from_urls(api_entry.valkyrie_url, api_entry.chihiro_url)
+
+def get_print_item_list(errored_item_list:typing.Sequence[ErrorItem], parsed_args) -> typing.List[str]:
+    ''' @return the lines to write, based on the provided switches '''
 
-    # Prepare the output based on the provided switches
     if parsed_args.output_as_URLs:
         if parsed_args.only_dual_failures:
             print_item_list = [x for item in errored_item_list for x in (item.api.valkyrie_url, item.api.chihiro_url)
@@ -93,7 +466,7 @@ def run(parsed_args):
             print_item_list = [item.api.chihiro_url for item in errored_item_list
                                if not item.valkyrie_failed and item.chihiro_failed]
         else:
-            print_item_list = [x for item in errored_item_list for x in (item.api.valkyrie_url, item.api.chihiro_url)]
+            print_item_list = [x for item in errored_item_list for x in (item.api.valkyrie_url, item.api.chihiro_url) if x is not None]
     else:
         if parsed_args.only_dual_failures:
             print_item_list = [item.api.sku for item in errored_item_list
@@ -107,7 +480,88 @@ def run(parsed_args):
         else:
             print_item_list = [item.api.sku for item in errored_item_list]
 
+    return print_item_list
+
+def _write_print_item_list(output_path:pathlib.Path, print_item_list:typing.Sequence[str]):
 
-    with open(parsed_args.error_item_output_file, "w", encoding="utf-8", newline="\n") as f:
+    with open(output_path, "w", encoding="utf-8", newline="\n") as f:
         for item in print_item_list:
             f.write("{}\n".format(item))
+
+def run(parsed_args):
+
+    log_path_list = get_source_log_path_list(parsed_args.source_log_list, parsed_args.source_log_glob_list)
+    event_log_path_list = parsed_args.event_log_list or []
+
+    if not log_path_list and not event_log_path_list:
+        raise Exception("no logs to read, give at least one `--source-log`, `--event-log` or a `--source-log-glob` that matches something")
+
+    parse_result_list = []
+
+    if log_path_list:
+        logger.info("Opening `%s` log file(s): `%s`", len(log_path_list), ", ".join(str(x) for x in log_path_list))
+        parse_result_list.extend(parse_log_list(log_path_list, parsed_args.jobs))
+
+    if event_log_path_list:
+        parse_result_list.extend(parse_event_log_list(event_log_path_list))
+
+    parse_result = merge_log_round_results(parse_result_list)
+    total_items_count = parse_result.total_items_count
+
+    if parse_result.orphan_failed_flags_list:
+        logger.warning("found `%s` failures before any item started, skipping them", len(parse_result.orphan_failed_flags_list))
+
+    errored_item_list = []
+    for (region, sku), (valkyrie_failed, chihiro_failed) in parse_result.failed_flags_dict.items():
+
+        started_urls = parse_result.started_url_dict.get((region, sku))
+        if started_urls is None:
+            logger.warning("found a failure for the sku `%s` (region `%s`) that never started, skipping", sku, region)
+            continue
+
+        errored_item_list.append(ErrorItem(ApiEntry(sku=sku, valkyrie_url=started_urls[0], chihiro_url=started_urls[1]),
+            valkyrie_failed, chihiro_failed))
+
+    logger.info("found `%s` failed items out of %s total items for a failure rate of %1.2f%%", len(errored_item_list), total_items_count, len(errored_item_list)/max(1, total_items_count)*100)
+
+    write_errored_items(errored_item_list, parsed_args)
+
+def write_errored_items(errored_item_list:typing.Sequence[ErrorItem], parsed_args):
+    '''
+    writes the items out to `--output-file` or `--output-folder`, also used by `get_errored_items_from_wpull_db`
+
+    @param errored_item_list - the items
+    @param parsed_args - the `--output-*` and `--only-*` arguments
+    '''
+
+    errored_valkyrie_list = [x.api for x in errored_item_list if x.valkyrie_failed and not x.chihiro_failed]
+    errored_chihiro_list = [x.api for x in errored_item_list if x.chihiro_failed and not x.valkyrie_failed]
+    errored_both_list = [x.api for x in errored_item_list if x.valkyrie_failed and x.chihiro_failed]
+
+    logger.info("-- `%s` have failed valkyrie links only", len(errored_valkyrie_list))
+    logger.info("-- `%s` have failed chihiro links only", len(errored_chihiro_list))
+    logger.info("-- `%s` have both failed valkyrie and chihiro links", len(errored_both_list))
+
+    if parsed_args.output_as_URLs:
+        logger.info("Writing out URLs instead of IDs")
+    if parsed_args.only_dual_failures:
+        logger.info("Writing only items with dual failures")
+    if parsed_args.only_valkyrie_failures:
+        logger.info("Writing only items with valkyrie failures and no chihiro failures")
+    if parsed_args.only_chihiro_failures:
+        logger.info("Writing only items with chihiro failures and no valkyrie failures")
+
+    if parsed_args.error_item_output_folder is None:
+        logger.info("Writing to %s", parsed_args.error_item_output_file)
+        _write_print_item_list(parsed_args.error_item_output_file, get_print_item_list(errored_item_list, parsed_args))
+        return
+
+    # one file per region, in case the logs are from more then one
+    region_errored_item_dict = {}
+    for iter_errored_item in errored_item_list:
+        region_errored_item_dict.setdefault(get_region(iter_errored_item.api), []).append(iter_errored_item)
+
+    for iter_region, iter_errored_item_list in sorted(region_errored_item_dict.items()):
+        output_path = parsed_args.error_item_output_folder / ERRORED_ITEMS_FILE_NAME_FORMAT.format(iter_region)
+        logger.info("Writing `%s` failed items for the region `%s` to %s", len(iter_errored_item_list), iter_region, output_path)
+        _write_print_item_list(output_path, get_print_item_list(iter_errored_item_list, parsed_args))
@@ -0,0 +1,193 @@
+import logging
+import pathlib
+import sqlite3
+import typing
+
+from playstation_store_2020_oct_scrape import get_errored_items_from_log
+from playstation_store_2020_oct_scrape.get_errored_items_from_log import ErrorItem, VALKYRIE_URL_MARKER, CHIHIRO_URL_MARKER
+from playstation_store_2020_oct_scrape.warcio_scrape import ApiEntry
+
+logger = logging.getLogger(__name__)
+
+# the `status` column of wpull's `queued_urls` table
+WPULL_STATUS_TODO = "todo"
+WPULL_STATUS_IN_PROGRESS = "in_progress"
+WPULL_STATUS_DONE = "done"
+WPULL_STATUS_ERROR = "error"
+WPULL_STATUS_SKIPPED = "skipped"
+
+# a `done` url with one of these worked, or the sku doesn't exist, either way there is no point retrying it
+FINISHED_STATUS_CODE_TUPLE = (200, 404, 410)
+
+# wpull has a index on `queued_urls.status`, so sqlite gets the rows for each status through it instead of reading the
+# whole table, the `done` rows still all have to be read for the `status_code` check, since wpull marks urls `done` when
+# it gives up on a HTTP error that it doesn't retry (like a 403). `skipped` without a `status_code` means wpull never
+# tried it, see `scrape_media.py`. Sorted so the output is in the order the urls were queued
+UNFINISHED_URL_QUERY_FORMAT = '''
+    select url_strings.url, queued_urls.status, queued_urls.status_code, queued_urls.try_count
+    from queued_urls
+    join url_strings on url_strings.id = queued_urls.url_string_id
+    where queued_urls.status in ('{todo}', '{in_progress}', '{error}')
+        or (queued_urls.status = '{skipped}' and queued_urls.status_code is null)
+        or (queued_urls.status = '{done}' and (queued_urls.status_code is null or queued_urls.status_code not in {finished}))
+    order by queued_urls.id
+'''
+UNFINISHED_URL_QUERY = UNFINISHED_URL_QUERY_FORMAT.format(todo=WPULL_STATUS_TODO, in_progress=WPULL_STATUS_IN_PROGRESS,
+    error=WPULL_STATUS_ERROR, skipped=WPULL_STATUS_SKIPPED, done=WPULL_STATUS_DONE, finished=FINISHED_STATUS_CODE_TUPLE)
+
+# looks the urls up through the unique index on `url_strings.url`, for finding out if a url that didn't work in one
+# database worked in another one. `cross join` keeps sqlite from going through the status index instead, which it
+# picks once the `in` list gets long and is a lot slower
+FINISHED_URL_QUERY_FORMAT = '''
+    select url_strings.url
+    from url_strings
+    cross join queued_urls on queued_urls.url_string_id = url_strings.id
+    where url_strings.url in ({})
+        and queued_urls.status = '{done}' and queued_urls.status_code in {finished}
+'''
+
+# sqlite has a limit on how many `?` a statement can have, 999 in older versions
+FINISHED_URL_QUERY_BATCH_SIZE = 500
+
+
+def open_wpull_database(database_path:pathlib.Path) -> sqlite3.Connection:
+    ''' opens the database read only, so this can be run on the database of a wpull that is still going '''
+
+    return sqlite3.connect(database_path.resolve().as_uri() + "?mode=ro", uri=True)
+
+def get_sku_and_api_is_valkyrie(url:str) -> typing.Optional[typing.Tuple[str, bool]]:
+    '''
+    @param url - a url from the database
+    @return (sku, True if it is a valkyrie url), or None if it isn't a valkyrie or chihiro url (like the media urls)
+    '''
+
+    if VALKYRIE_URL_MARKER in url:
+        is_valkyrie = True
+    elif CHIHIRO_URL_MARKER in url:
+        is_valkyrie = False
+    else:
+        return None
+
+    # the sku is always the last part of the path
+    return url.split("?", 1)[0].rsplit("/", 1)[-1], is_valkyrie
+
+def get_unfinished_url_dict(connection:sqlite3.Connection) -> typing.Dict[str, str]:
+    '''
+    @return the valkyrie and chihiro urls in the database that didn't work or weren't tried yet, url -> wpull status
+    '''
+
+    unfinished_url_dict = {}
+
+    for url, status, status_code, try_count in connection.execute(UNFINISHED_URL_QUERY):
+
+        if get_sku_and_api_is_valkyrie(url) is None:
+            continue
+
+        # wpull got a response, but not one we wanted, so it counts as a error
+        if status == WPULL_STATUS_DONE:
+            logger.debug("url `%s` is done with HTTP `%s` after `%s` tries", url, status_code, try_count)
+            status = WPULL_STATUS_ERROR
+
+        unfinished_url_dict[url] = status
+
+    return unfinished_url_dict
+
+def get_finished_url_set(connection:sqlite3.Connection, url_list:typing.Sequence[str]) -> typing.Set[str]:
+    ''' @return the urls out of `url_list` that worked in this database '''
+
+    finished_url_set = set()
+
+    for idx in range(0, len(url_list), FINISHED_URL_QUERY_BATCH_SIZE):
+
+        batch_url_list = url_list[idx:idx + FINISHED_URL_QUERY_BATCH_SIZE]
+        query = FINISHED_URL_QUERY_FORMAT.format(", ".join("?" * len(batch_url_list)),
+            done=WPULL_STATUS_DONE, finished=FINISHED_STATUS_CODE_TUPLE)
+
+        finished_url_set.update(x[0] for x in connection.execute(query, batch_url_list))
+
+    return finished_url_set
+
+def get_unfinished_url_dict_from_database_list(database_path_list:typing.Sequence[pathlib.Path]) -> typing.Dict[str, str]:
+    '''
+    with more then one database (every droplet and retry round), a url only counts if it didn't work in any of them
+
+    @return url -> wpull status, see `get_unfinished_url_dict()`
+    '''
+
+    unfinished_url_dict = {}
+
+    for iter_database_path in database_path_list:
+
+        logger.info("querying the wpull database `%s`", iter_database_path)
+
+        connection = open_wpull_database(iter_database_path)
+        try:
+            iter_unfinished_url_dict = get_unfinished_url_dict(connection)
+        finally:
+            connection.close()
+
+        logger.info("-- `%s` valkyrie and chihiro urls didn't work or weren't tried", len(iter_unfinished_url_dict))
+
+        for iter_url, iter_status in iter_unfinished_url_dict.items():
+            # a error beats never being tried
+            if unfinished_url_dict.get(iter_url) != WPULL_STATUS_ERROR:
+                unfinished_url_dict[iter_url] = iter_status
+
+    if len(database_path_list) > 1 and unfinished_url_dict:
+
+        for iter_database_path in database_path_list:
+
+            connection = open_wpull_database(iter_database_path)
+            try:
+                finished_url_set = get_finished_url_set(connection, list(unfinished_url_dict.keys()))
+            finally:
+                connection.close()
+
+            if finished_url_set:
+                logger.info("-- `%s` of those worked in `%s`", len(finished_url_set), iter_database_path)
+
+            for iter_url in finished_url_set:
+                del unfinished_url_dict[iter_url]
+
+    return unfinished_url_dict
+
+def get_errored_item_list(unfinished_url_dict:typing.Dict[str, str]) -> typing.List[ErrorItem]:
+    '''
+    groups the urls by sku
+
+    @param unfinished_url_dict - see `get_unfinished_url_dict()`
+    @return a ErrorItem per sku, the url for a api that didn't fail is None
+    '''
+
+    sku_url_dict = {}
+
+    for iter_url in unfinished_url_dict.keys():
+
+        sku, is_valkyrie = get_sku_and_api_is_valkyrie(iter_url)
+        url_list = sku_url_dict.setdefault(sku, [None, None])
+        url_list[0 if is_valkyrie else 1] = iter_url
+
+    return [ErrorItem(ApiEntry(sku=sku, valkyrie_url=valkyrie_url, chihiro_url=chihiro_url), valkyrie_url is not None, chihiro_url is not None)
+        for sku, (valkyrie_url, chihiro_url) in sku_url_dict.items()]
+
+def run(parsed_args):
+
+    database_path_list = get_errored_items_from_log.get_source_log_path_list(parsed_args.wpull_database_list, parsed_args.wpull_database_glob_list)
+
+    if not database_path_list:
+        raise Exception("no databases to read, give at least one `--database` or a `--database-glob` that matches something")
+
+    unfinished_url_dict = get_unfinished_url_dict_from_database_list(database_path_list)
+
+    error_count = sum(1 for x in unfinished_url_dict.values() if x == WPULL_STATUS_ERROR)
+    logger.info("`%s` urls had errors and `%s` were never tried (or wpull was stopped while it was getting them)",
+        error_count, len(unfinished_url_dict) - error_count)
+
+    if parsed_args.exclude_never_attempted:
+        logger.info("leaving out the urls that were never tried")
+        unfinished_url_dict = {k: v for k, v in unfinished_url_dict.items() if v == WPULL_STATUS_ERROR}
+
+    errored_item_list = get_errored_item_list(unfinished_url_dict)
+    logger.info("found `%s` failed items", len(errored_item_list))
+
+    get_errored_items_from_log.write_errored_items(errored_item_list, parsed_args)
@@ -18,10 +18,14 @@ from playstation_store_2020_oct_scrape import scrape
 from playstation_store_2020_oct_scrape import warcio_scrape
 from playstation_store_2020_oct_scrape import get_cloudinit_files
 from playstation_store_2020_oct_scrape import create_config_and_instances
+from playstation_store_2020_oct_scrape import dedupe_content_ids
+from playstation_store_2020_oct_scrape import diff_content_ids
 from playstation_store_2020_oct_scrape import rsync_files_from_droplets
 from playstation_store_2020_oct_scrape import get_errored_items_from_log
+from playstation_store_2020_oct_scrape import get_errored_items_from_wpull_db
 from playstation_store_2020_oct_scrape import generate_wpull_urls_from_content_ids
 from playstation_store_2020_oct_scrape import scrape_media
+from playstation_store_2020_oct_scrape import mock_store_server
 
 
 class ArrowLoggingFormatter(logging.Formatter):
@@ -145,6 +149,8 @@ def main():
 
     scrape_urls_parser = subparsers.add_parser("scrape_urls", help="Scrape URLs to JSON")
     scrape_urls_parser.add_argument('--outfile', dest="outfile", required=True, type=isValidNewFileLocation, help="where to save the JSON file containing the URLs")
+    scrape_urls_parser.add_argument("--base-url", dest="base_url",
+        help="use this instead of `https://store.playstation.com`, like the `mock_store_server` (`http://127.0.0.1:8080`)")
     scrape_urls_parser.set_defaults(func_to_run=scrape.get_games_list)
 
 
@@ -156,13 +162,73 @@ def main():
 
 
     warcio_parser = subparsers.add_parser("warcio_scrape", help="download urls via warcio")
-    warcio_parser.add_argument("--sku-list", dest="sku_list", required=True, type=isFileType(), help="the list of skus to download")
+    warcio_parser.add_argument("--sku-list", dest="sku_list", required=True, type=isFileType(),
+        help="the list of skus to download, can be a plain text file or compressed with XZ (`.xz`), gzip (`.gz`) or zstandard (`.zst`)")
     warcio_parser.add_argument("--region-lang", dest="region_lang", required=True, help="the first part of a region code, aka the `en` in `en-US`")
     warcio_parser.add_argument("--region-country", dest="region_country", required=True, help="the second part of a region code, aka the `us` in `en-US`")
     warcio_parser.add_argument("--warc-output-file", dest="warc_output_file", type=isFileType(False),
         help="where to save the warc file, include 'warc.gz' in this name please")
     warcio_parser.add_argument("--media-files-output-file", dest="media_files_output_file", type=isFileType(False),
         help="where to save the list of media urls we discovered")
+    warcio_parser.add_argument("--no-media-dedup", dest="media_dedup", action="store_false",
+        help="write every media url that is found, instead of dropping ones that were already written")
+    warcio_parser.add_argument("--media-dedup-capacity", dest="media_dedup_capacity", type=int, default=10000000,
+        help="how many unique media urls the dedup filter is sized for, it uses more memory the bigger this is")
+    warcio_parser.add_argument("--media-dedup-false-positive-rate", dest="media_dedup_false_positive_rate", type=float, default=0.0001,
+        help="the chance of a new media url being dropped as a duplicate by mistake, once the filter is full")
+    warcio_parser.add_argument("--warc-max-size", dest="warc_max_size", type=int,
+        help="if set, start a new numbered WARC segment once the current one is this many bytes, like wpull's `--warc-max-size`")
+    warcio_parser.add_argument("--concurrency", dest="concurrency", type=int, default=1,
+        help="how many skus to download at the same time, each one uses two threads (one for valkyrie and one for chihiro)")
+    warcio_parser.add_argument("--adaptive-concurrency", dest="adaptive_concurrency", action="store_true",
+        help="start at --concurrency, and keep raising it while the store responds quickly, cutting it in half (and pausing) " +
+            "when the store returns HTTP 429 / 503 or a Retry-After header")
+    warcio_parser.add_argument("--min-concurrency", dest="min_concurrency", type=int, default=1,
+        help="with --adaptive-concurrency, the concurrency never goes below this")
+    warcio_parser.add_argument("--max-concurrency", dest="max_concurrency", type=int, default=16,
+        help="with --adaptive-concurrency, the concurrency never goes above this")
+    warcio_parser.add_argument("--workers", dest="workers", type=int, default=1,
+        help="split the skus between this many processes, each with their own WARC, media list and journal (named like " +
+            "`foo.worker01.warc.gz`), that get merged into a media list and a `.manifest.json` of the WARCs at the end. " +
+            "Use the same number of workers when using --resume")
+    warcio_parser.add_argument("--writer-queue-size", dest="writer_queue_size", type=int, default=100,
+        help="how many finished skus can be waiting for the WARC writer thread before we stop starting new ones")
+    warcio_parser.add_argument("--max-retries", dest="max_retries", type=int, default=5,
+        help="how many times to try a url before giving up on it")
+    warcio_parser.add_argument("--retry-base-delay", dest="retry_base_delay", type=float, default=5.0,
+        help="seconds to wait before the first retry of a url, doubling (with jitter) for every retry after that")
+    warcio_parser.add_argument("--retry-max-delay", dest="retry_max_delay", type=float, default=120.0,
+        help="the most seconds to ever wait before retrying a url")
+    warcio_parser.add_argument("--no-final-retry-sweep", dest="final_retry_sweep", action="store_false",
+        help="if set, urls that run out of retries are not tried again at the end of the run")
+    warcio_parser.add_argument("--dead-skus-file", dest="dead_skus_file", type=isFileType(False),
+        help="a list of skus that don't exist (the api returned HTTP 404), skus in it are skipped, and newly found ones are added to it")
+    warcio_parser.add_argument("--valkyrie-first", dest="valkyrie_first", action="store_true",
+        help="only make the chihiro request for a sku once the valkyrie request shows the sku exists, " +
+            "rather then making both at the same time")
+    warcio_parser.add_argument("--validator-cache", dest="validator_cache", type=isFileType(False),
+        help="a sqlite database of the ETag / Last-Modified / payload digest of every url from earlier runs, urls in it are " +
+            "requested conditionally and saved as revisit records if they haven't changed, it is created if it doesn't exist")
+    warcio_parser.add_argument("--journal-file", dest="journal_file", type=isFileType(False),
+        help="where to save the checkpoint journal of which skus are done, defaults to the warc output file with `.journal` added on the end")
+    warcio_parser.add_argument("--event-log", dest="event_log_file", type=isFileType(False),
+        help="if set, append a JSONL line (sku, region, api, status, HTTP status, attempts, latency, bytes) for every finished url here, " +
+            "`get_errored_items_from_log --event-log` reads these instead of the log, with `--workers` every worker gets its own")
+    warcio_parser.add_argument("--resume", dest="resume", action="store_true",
+        help="if set, skip the skus that the checkpoint journal says are done, and write to a new numbered WARC segment")
+    warcio_parser.add_argument("--no-sku-count", dest="count_skus", action="store_false",
+        help="if set, don't read through the sku list first to count it, the progress log will just show `?` as the total")
+    warcio_parser.add_argument("--metrics-port", dest="metrics_port", type=int,
+        help="if set, serve live metrics on this port on localhost, at `/metrics` (prometheus) and `/status.json`, " +
+            "with `--workers` every worker gets the next port up")
+    warcio_parser.add_argument("--metrics-json-file", dest="metrics_json_file", type=isFileType(False),
+        help="if set, the metrics (requests per second, latency percentiles, status codes, ETA and so on) are written here as JSON every `--metrics-interval` seconds")
+    warcio_parser.add_argument("--metrics-prometheus-file", dest="metrics_prometheus_file", type=isFileType(False),
+        help="if set, the metrics are written here for the prometheus node_exporter textfile collector every `--metrics-interval` seconds")
+    warcio_parser.add_argument("--metrics-interval", dest="metrics_interval", type=float, default=30.0,
+        help="how many seconds between rewriting the metrics files and logging the metrics")
+    warcio_parser.add_argument("--base-url", dest="base_url",
+        help="use this instead of `https://store.playstation.com`, like the `mock_store_server` (`http://127.0.0.1:8080`)")
     warcio_parser.set_defaults(func_to_run=warcio_scrape.do_warcio_scrape)
 
     create_config_and_instances_parser = subparsers.add_parser("create_config_and_instances", help="given a list of content-id files , create the config and then create DO instances")
@@ -205,8 +271,18 @@ def main():
     rsync_files_parser.set_defaults(func_to_run=rsync_files_from_droplets.run)
 
     log_reader_parser = subparsers.add_parser("get_errored_items_from_log", help="Given a warcio scrape log file, output the IDs that failed to download")
-    log_reader_parser.add_argument("--source-log", dest="source_log", required=True, type=isFileType(), help="path to the warcio scrape log that you want to extract from")
-    log_reader_parser.add_argument("--output-file", dest="error_item_output_file", required=True, type=isFileType(False), help="newline-delmited output will be written to this file")
+    log_reader_parser.add_argument("--source-log", dest="source_log_list", action="append", type=isFileType(),
+        help="path to the warcio scrape log that you want to extract from, can be XZ, gzip or zstandard compressed. Can be specified "
+            + "multiple times, like for the logs of every droplet and retry round, then a item is only output if it failed in every log it is in")
+    log_reader_parser.add_argument("--source-log-glob", dest="source_log_glob_list", action="append",
+        help="a glob of more logs to extract from, like `droplets/*/*ja-jp*.log*` (`**` works too). Can be specified multiple times")
+    log_reader_parser.add_argument("--event-log", dest="event_log_list", action="append", type=isFileType(),
+        help="a event log written by `warcio_scrape --event-log` or the wpull plugin, instead of or as well as the logs, can be "
+            + "compressed and specified multiple times. Looking things up in these doesn't depend on what the log messages look like")
+    log_reader_output_group = log_reader_parser.add_mutually_exclusive_group(required=True)
+    log_reader_output_group.add_argument("--output-file", dest="error_item_output_file", type=isFileType(False), help="newline-delmited output will be written to this file")
+    log_reader_output_group.add_argument("--output-folder", dest="error_item_output_folder", type=isDirectoryType,
+        help="instead of `--output-file`, write a `errored_items_<region>.txt` file per region (like `ja-jp`) to this folder")
     log_reader_parser.add_argument("--output-as-URLs", dest="output_as_URLs", action="store_true", help="if set, output the exact URLs that failed instead of the associated IDs")
     log_reader_parser_group = log_reader_parser.add_mutually_exclusive_group()
     log_reader_parser_group.add_argument("--only-dual-failures", dest="only_dual_failures", action="store_true", help="if set, only output the items that failed for both chihiro and valkyrie")
@@ -214,16 +290,106 @@ def main():
                                    help="if set, only output the items that failed for valkyrie and not chihiro")
     log_reader_parser_group.add_argument("--only-chihiro-failures", dest="only_chihiro_failures", action="store_true",
                                    help="if set, only output the items that failed for chihiro and not valkyrie")
+    log_reader_parser.add_argument("--jobs", dest="jobs", type=int, default=1,
+        help="if more then 1, parse the logs with this many processes, a single (uncompressed) log gets split into chunks for this")
     log_reader_parser.set_defaults(func_to_run=get_errored_items_from_log.run)
 
+    wpull_db_reader_parser = subparsers.add_parser("get_errored_items_from_wpull_db",
+        help="Given wpull databases, output the IDs whose valkyrie or chihiro urls failed or were never tried")
+    wpull_db_reader_parser.add_argument("--database", dest="wpull_database_list", action="append", type=isFileType(),
+        help="a `wpull_database_*.sqlite3` from `bootstrap_wpull.py`, it is only read from, so wpull can still be running. Can be specified "
+            + "multiple times, like for every droplet and retry round, then a url is only output if it didn't work in any of them")
+    wpull_db_reader_parser.add_argument("--database-glob", dest="wpull_database_glob_list", action="append",
+        help="a glob of more databases, like `droplets/*/wpull_database_*.sqlite3` (`**` works too). Can be specified multiple times")
+    wpull_db_reader_output_group = wpull_db_reader_parser.add_mutually_exclusive_group(required=True)
+    wpull_db_reader_output_group.add_argument("--output-file", dest="error_item_output_file", type=isFileType(False), help="newline-delmited output will be written to this file")
+    wpull_db_reader_output_group.add_argument("--output-folder", dest="error_item_output_folder", type=isDirectoryType,
+        help="instead of `--output-file`, write a `errored_items_<region>.txt` file per region (like `ja-jp`) to this folder")
+    wpull_db_reader_parser.add_argument("--output-as-URLs", dest="output_as_URLs", action="store_true", help="if set, output the exact URLs that failed instead of the associated IDs")
+    wpull_db_reader_parser.add_argument("--exclude-never-attempted", dest="exclude_never_attempted", action="store_true",
+        help="if set, only output the urls that wpull got a error for, not the ones it never got to")
+    wpull_db_reader_parser_group = wpull_db_reader_parser.add_mutually_exclusive_group()
+    wpull_db_reader_parser_group.add_argument("--only-dual-failures", dest="only_dual_failures", action="store_true", help="if set, only output the items that failed for both chihiro and valkyrie")
+    wpull_db_reader_parser_group.add_argument("--only-valkyrie-failures", dest="only_valkyrie_failures", action="store_true",
+                                   help="if set, only output the items that failed for valkyrie and not chihiro")
+    wpull_db_reader_parser_group.add_argument("--only-chihiro-failures", dest="only_chihiro_failures", action="store_true",
+                                   help="if set, only output the items that failed for chihiro and not valkyrie")
+    wpull_db_reader_parser.set_defaults(func_to_run=get_errored_items_from_wpull_db.run)
+
 
     wpull_urls_parser = subparsers.add_parser("generate_wpull_urls_from_content_ids", help="generate urls for wpull given a list of content ids")
     wpull_urls_parser.add_argument("--content-ids-file", dest="content_ids_file", required=True, type=isFileType(), help="the file of content ids")
-    wpull_urls_parser.add_argument("--output-file", dest="output_file",  required=True, type=isFileType(False), help="where to store the output")
+    wpull_urls_output_group = wpull_urls_parser.add_mutually_exclusive_group(required=True)
+    wpull_urls_output_group.add_argument("--output-file", dest="output_file", type=isFileType(False), help="where to store the output")
+    wpull_urls_output_group.add_argument("--output-database", dest="output_database", type=isFileType(False),
+        help="instead of `--output-file`, create a new wpull database with the urls already queued in it, to give to wpull as "
+            + "`--database` (with a empty `--input-file`), which is a lot faster then wpull reading a big `--input-file` itself")
     wpull_urls_parser.add_argument("--region-lang", dest="region_lang", required=True, help="the first part of a region code, aka the `en` in `en-US`")
     wpull_urls_parser.add_argument("--region-country", dest="region_country", required=True, help="the second part of a region code, aka the `us` in `en-US`")
+    wpull_urls_parser.add_argument("--dead-skus-file", dest="dead_skus_file", type=isFileType(),
+        help="a list of skus (written by `warcio_scrape --dead-skus-file`) that don't exist and should be left out")
+    wpull_urls_parser.add_argument("--base-url", dest="base_url",
+        help="use this instead of `https://store.playstation.com`, like the `mock_store_server` (`http://127.0.0.1:8080`)")
     wpull_urls_parser.set_defaults(func_to_run=generate_wpull_urls_from_content_ids.run)
 
+    wpull_urls_batch_parser = subparsers.add_parser("generate_wpull_urls_for_regions",
+        help="generate the urls for wpull for many regions at once, from the `regions/` folder of the `playstation_content_ids` repo")
+    wpull_urls_batch_parser.add_argument("--regions-folder", dest="regions_folder", required=True, type=isDirectoryType,
+        help="the folder with the `<language>-<country>.txt.xz` content id lists, like `playstation_content_ids-master/regions`")
+    wpull_urls_batch_parser.add_argument("--language-tag", dest="language_tag", type=ietf_language_tag_type, action="append",
+        help="the IETF language tag of a region to do, like `en-us` or `zh-hans-cn`. Can be repeated, if not given every list in `--regions-folder` is done")
+    wpull_urls_batch_parser.add_argument("--output-folder", dest="output_folder", required=True, type=isDirectoryType,
+        help="where to write a `wpull_urls_<region>.txt` per region")
+    wpull_urls_batch_parser.add_argument("--compression", dest="compression", choices=sorted(generate_wpull_urls_from_content_ids.COMPRESSION_SUFFIX_DICT.keys()),
+        default=generate_wpull_urls_from_content_ids.COMPRESSION_NONE,
+        help="compress the url lists, `zst` needs the `zstandard` package. wpull can only read uncompressed lists")
+    wpull_urls_batch_parser.add_argument("--counts-file", dest="counts_file", type=isFileType(False),
+        help="if set, write how many content ids and urls every region has to this JSON file")
+    wpull_urls_batch_parser.add_argument("--jobs", dest="jobs", type=int,
+        help="how many regions to do at once in separate processes, defaults to the number of CPUs")
+    wpull_urls_batch_parser.add_argument("--base-url", dest="base_url",
+        help="use this instead of `https://store.playstation.com`, like the `mock_store_server` (`http://127.0.0.1:8080`)")
+    wpull_urls_batch_parser.set_defaults(func_to_run=generate_wpull_urls_from_content_ids.run_batch)
+
+    dedupe_parser = subparsers.add_parser("dedupe_content_ids",
+        help="merge content id lists into sorted lists without duplicates, and report how much they overlap")
+    dedupe_parser.add_argument("--content-ids-file", dest="content_ids_file_list", required=True, action="append", type=isFileType(),
+        help="a list of content ids, can be XZ, gzip or zstandard compressed. Can be specified multiple times")
+    dedupe_output_group = dedupe_parser.add_mutually_exclusive_group(required=True)
+    dedupe_output_group.add_argument("--output-file", dest="output_file", type=isFileType(False),
+        help="write every id of every list to this one sorted list, compressed if it ends in `.xz`, `.gz` or `.zst`")
+    dedupe_output_group.add_argument("--output-folder", dest="output_folder", type=isDirectoryType,
+        help="instead of `--output-file`, write a sorted `<region>.txt` per region, the region is the start of the name of the "
+            + "list, so `old/en-us.txt` and `new/en-us.txt.xz` end up in the same one")
+    dedupe_parser.add_argument("--compression", dest="compression", choices=sorted(generate_wpull_urls_from_content_ids.COMPRESSION_SUFFIX_DICT.keys()),
+        default="xz", help="how to compress the lists in `--output-folder`, `zst` needs the `zstandard` package")
+    dedupe_parser.add_argument("--report-file", dest="report_file", type=isFileType(False),
+        help="if set, write how many ids every list has, how many are duplicates and how many it shares with every other list to this JSON file")
+    dedupe_parser.add_argument("--max-ids-in-memory", dest="max_ids_in_memory", type=int, default=2000000,
+        help="how many ids to sort in memory at once, more then this are sorted in runs in temporary files that are merged afterwards")
+    dedupe_parser.add_argument("--temp-dir", dest="temp_dir", type=isDirectoryType,
+        help="where to put the temporary files, defaults to the system temporary folder")
+    dedupe_parser.set_defaults(func_to_run=dedupe_content_ids.run)
+
+    diff_parser = subparsers.add_parser("diff_content_ids",
+        help="find the content ids that were added to or removed from a region between two snapshots of its list")
+    diff_parser.add_argument("--old-snapshot", dest="old_snapshot", required=True, type=isFileType(),
+        help="the older content id list, or a zip of the `playstation_content_ids` repo (like `master.zip`)")
+    diff_parser.add_argument("--new-snapshot", dest="new_snapshot", required=True, type=isFileType(),
+        help="the newer content id list, or a zip of the `playstation_content_ids` repo")
+    diff_parser.add_argument("--region", dest="region", type=ietf_language_tag_type,
+        help="the IETF language tag of the list to use out of a zip snapshot, like `en-us` or `zh-hans-cn`")
+    diff_parser.add_argument("--added-output-file", dest="added_output_file", required=True, type=isFileType(False),
+        help="where to write the content ids that are only in the new snapshot, this can be given to " +
+            "`generate_wpull_urls_from_content_ids --content-ids-file` or `warcio_scrape --sku-list`")
+    diff_parser.add_argument("--removed-output-file", dest="removed_output_file", type=isFileType(False),
+        help="if set, write the content ids that are only in the old snapshot here")
+    diff_parser.add_argument("--max-ids-in-memory", dest="max_ids_in_memory", type=int, default=2000000,
+        help="see `dedupe_content_ids --max-ids-in-memory`")
+    diff_parser.add_argument("--temp-dir", dest="temp_dir", type=isDirectoryType,
+        help="where to put the temporary files, defaults to the system temporary folder")
+    diff_parser.set_defaults(func_to_run=diff_content_ids.run)
+
     scrape_media_parser = subparsers.add_parser("scrape_media", help="scrapes media using a database that already did the JSON urls")
     scrape_media_parser.add_argument("--region-lang", dest="region_lang", required=True, help="")
     scrape_media_parser.add_argument("--region-country", dest="region_country", required=True, help="")
@@ -235,6 +401,28 @@ def main():
 
     scrape_media_parser.set_defaults(func_to_run=scrape_media.run)
 
+    mock_store_parser = subparsers.add_parser("mock_store_server",
+        help="run a local stand in for the playstation store api and grid pages, for testing the scrapers offline")
+    mock_store_parser.add_argument("--fixture-dir", dest="fixture_dir", type=isDirectoryType,
+        help="a folder with `valkyrie/<sku>.json`, `chihiro/<sku>.json` and `grid/<page number>.html` files to serve")
+    mock_store_parser.add_argument("--warc-file", dest="warc_file", type=isFileType(),
+        help="a WARC from a earlier scrape to serve the api and grid responses out of")
+    mock_store_parser.add_argument("--synthetic", action="store_true",
+        help="if set, make up api responses for any sku (and grid pages for the skus we know about) that aren't in the fixtures or the WARC")
+    mock_store_parser.add_argument("--host", default="127.0.0.1", help="the address to listen on")
+    mock_store_parser.add_argument("--port", type=int, default=8080, help="the port to listen on")
+    mock_store_parser.add_argument("--latency", type=float, default=0.0, help="how many seconds every response takes at least")
+    mock_store_parser.add_argument("--latency-jitter", dest="latency_jitter", type=float, default=0.0,
+        help="up to this many more seconds are added to every response at random")
+    mock_store_parser.add_argument("--error-rate", dest="error_rate", type=float, default=0.0,
+        help="the fraction (0 to 1) of requests that get a HTTP 500")
+    mock_store_parser.add_argument("--throttle-rate", dest="throttle_rate", type=float, default=0.0,
+        help="the fraction (0 to 1) of requests that get a HTTP 429")
+    mock_store_parser.add_argument("--retry-after", dest="retry_after", type=float, default=1.0,
+        help="the `Retry-After` seconds to send with the HTTP 429s")
+    mock_store_parser.add_argument("--seed", type=int, help="seed the random latency and errors, for repeatable runs")
+    mock_store_parser.set_defaults(func_to_run=mock_store_server.run)
+
 
     try:
 
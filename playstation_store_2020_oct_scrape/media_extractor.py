@@ -0,0 +1,178 @@
+'''
+gets the media urls out of valkyrie and chihiro api json, walking the document only once
+
+this is used by both `warcio_scrape` and the wpull plugin, and the wpull plugin gets this file extracted
+next to it rather then importing it from the package, so this should only ever import the standard library
+
+this runs for every api response wpull gets, so it avoids the nicer but slower stuff (attrs classes, a
+generator per list), see `benchmarks/bench_media_extractor.py`
+'''
+
+import enum
+import logging
+import typing
+
+logger = logging.getLogger(__name__)
+
+KEY_INCLUDED = "included"
+KEY_ATTRIBUTES = "attributes"
+KEY_CONTENT_RATING_VALKYRIE = "content-rating"
+KEY_THUMBNAIL_BASE = "thumbnail-url-base"
+KEY_PARENT = "parent"
+KEY_THUMBNAIL = "thumbnail"
+KEY_MEDIA_LIST = "media-list"
+KEY_PREVIEW = "preview"
+KEY_PROMO = "promo"
+KEY_IMAGES = "images"
+KEY_VIDEOS = "videos"
+KEY_SCREENSHOTS = "screenshots"
+KEY_URL = "url"
+
+KEY_CONTENT_RATING_CHIHIRO = "content_rating"
+KEY_PROMOMEDIA = "promomedia"
+KEY_MATERIALS = "materials"
+KEY_URLS = "urls"
+KEY_SKU_LINKS = "sku_links"
+
+_EMPTY_DICT = {}
+
+
+class MediaUrlKind(enum.Enum):
+    CONTENT_RATING = 1
+    THUMBNAIL = 2
+    PARENT_THUMBNAIL = 3
+    PREVIEW = 4
+    PROMO_IMAGE = 5
+    PROMO_VIDEO = 6
+    SCREENSHOT = 7
+    IMAGE = 8
+    PROMO_MATERIAL = 9
+    SKU_LINK = 10
+
+
+class MediaUrl(typing.NamedTuple):
+    kind:MediaUrlKind
+    url:str
+
+
+def _get_dict(maybe_dict:dict, key:str) -> dict:
+    ''' like jmespath, quietly treat anything that isn't the type we expect as missing rather then raising '''
+
+    result = maybe_dict.get(key)
+    return result if type(result) is dict else _EMPTY_DICT
+
+def _add_urls_in_list(result_list:list, kind:MediaUrlKind, maybe_list):
+
+    if type(maybe_list) is list:
+        for iter_dict in maybe_list:
+            if type(iter_dict) is dict:
+                url = iter_dict.get(KEY_URL)
+
+                if url:
+                    result_list.append(MediaUrl(kind, url))
+
+def get_valkyrie_media_urls(response_json) -> typing.List[MediaUrl]:
+    '''
+    go through the valkyrie api json and get media urls
+
+    @param response_json - the parsed json of a valkyrie api response
+    @return a list of MediaUrl objects, in the order they appear in the document
+    '''
+
+    result_list = []
+
+    if type(response_json) is not dict:
+        return result_list
+
+    included_list = response_json.get(KEY_INCLUDED)
+
+    if type(included_list) is not list:
+        return result_list
+
+    for iter_included_dict in included_list:
+
+        if type(iter_included_dict) is not dict:
+            continue
+
+        attribute_dict = _get_dict(iter_included_dict, KEY_ATTRIBUTES)
+
+        if not attribute_dict:
+            continue
+
+        content_rating_url = _get_dict(attribute_dict, KEY_CONTENT_RATING_VALKYRIE).get(KEY_URL)
+        if content_rating_url:
+            result_list.append(MediaUrl(MediaUrlKind.CONTENT_RATING, content_rating_url))
+
+        # not all of the attribute dicts have a thumbnail, like if there is a bundle, one will have it,
+        # the other won't
+        thumbnail_url = attribute_dict.get(KEY_THUMBNAIL_BASE)
+        if thumbnail_url:
+            result_list.append(MediaUrl(MediaUrlKind.THUMBNAIL, thumbnail_url))
+
+        parent_thumbnail_url = _get_dict(attribute_dict, KEY_PARENT).get(KEY_THUMBNAIL)
+        if parent_thumbnail_url:
+            result_list.append(MediaUrl(MediaUrlKind.PARENT_THUMBNAIL, parent_thumbnail_url))
+
+        media_list_dict = _get_dict(attribute_dict, KEY_MEDIA_LIST)
+
+        if media_list_dict:
+
+            promo_dict = _get_dict(media_list_dict, KEY_PROMO)
+
+            _add_urls_in_list(result_list, MediaUrlKind.PREVIEW, media_list_dict.get(KEY_PREVIEW))
+            _add_urls_in_list(result_list, MediaUrlKind.PROMO_IMAGE, promo_dict.get(KEY_IMAGES))
+            _add_urls_in_list(result_list, MediaUrlKind.PROMO_VIDEO, promo_dict.get(KEY_VIDEOS))
+            _add_urls_in_list(result_list, MediaUrlKind.SCREENSHOT, media_list_dict.get(KEY_SCREENSHOTS))
+
+    return result_list
+
+def get_chihiro_media_urls(response_json) -> typing.List[MediaUrl]:
+    '''
+    go through the chihiro api json and get media urls
+
+    @param response_json - the parsed json of a chihiro api response
+    @return a list of MediaUrl objects, in the order they appear in the document
+    '''
+
+    result_list = []
+
+    if type(response_json) is not dict:
+        return result_list
+
+    content_rating_url = _get_dict(response_json, KEY_CONTENT_RATING_CHIHIRO).get(KEY_URL)
+    if content_rating_url:
+        result_list.append(MediaUrl(MediaUrlKind.CONTENT_RATING, content_rating_url))
+
+    _add_urls_in_list(result_list, MediaUrlKind.IMAGE, response_json.get(KEY_IMAGES))
+
+    promomedia_list = response_json.get(KEY_PROMOMEDIA)
+
+    if type(promomedia_list) is list:
+        for iter_promomedia_dict in promomedia_list:
+            if type(iter_promomedia_dict) is dict:
+
+                material_list = iter_promomedia_dict.get(KEY_MATERIALS)
+
+                if type(material_list) is list:
+                    for iter_material_dict in material_list:
+                        if type(iter_material_dict) is dict:
+                            _add_urls_in_list(result_list, MediaUrlKind.PROMO_MATERIAL, iter_material_dict.get(KEY_URLS))
+
+    _add_urls_in_list(result_list, MediaUrlKind.SKU_LINK, response_json.get(KEY_SKU_LINKS))
+
+    return result_list
+
+def get_media_url_list(media_url_list:typing.Iterable[MediaUrl],
+    kind_set:typing.Optional[typing.AbstractSet[MediaUrlKind]]=None) -> typing.List[str]:
+    '''
+    helper to turn the MediaUrl objects into a plain list of urls
+
+    @param media_url_list - the MediaUrl objects, from `get_valkyrie_media_urls()` or `get_chihiro_media_urls()`
+    @param kind_set - if given, only urls of these kinds are returned
+    @return a list of url strings, in the order they were found
+    '''
+
+    if kind_set is None:
+        return [x.url for x in media_url_list]
+
+    return [x.url for x in media_url_list if x.kind in kind_set]
@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import math
+import os
+import pathlib
+import typing
+
+logger = logging.getLogger(__name__)
+
+# how many new urls to buffer before writing them out to the media file
+MEDIA_URL_BATCH_SIZE = 1000
+
+class BloomFilter:
+    '''
+    a fixed size set that uses a bounded amount of memory no matter how many items get added to it,
+    in exchange for sometimes saying it has seen a item that it hasn't (but never the other way around)
+
+    the size is picked from how many items we expect and what false positive rate we are ok with,
+    once more items then that are added, the false positive rate goes up
+    '''
+
+    def __init__(self, capacity:int, false_positive_rate:float):
+        '''
+        @param capacity - how many items we expect to add
+        @param false_positive_rate - the chance (0 to 1) of a item we haven't seen being reported as seen,
+        once `capacity` items have been added
+        '''
+
+        if capacity < 1:
+            raise Exception("the bloom filter capacity must be at least 1, got `{}`".format(capacity))
+
+        if not 0 < false_positive_rate < 1:
+            raise Exception("the bloom filter false positive rate must be between 0 and 1, got `{}`".format(false_positive_rate))
+
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+
+        self.num_bits = max(8, math.ceil(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bit_array = bytearray((self.num_bits + 7) // 8)
+
+    def _get_bit_indexes(self, item:str) -> typing.Iterator[int]:
+
+        # double hashing, the two halves of one digest stand in for `num_hashes` independent hashes
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        hash_one = int.from_bytes(digest[:8], "little")
+        hash_two = int.from_bytes(digest[8:], "little") | 1
+
+        for i in range(self.num_hashes):
+            yield (hash_one + i * hash_two) % self.num_bits
+
+    def add(self, item:str) -> bool:
+        '''
+        adds a item to the filter
+
+        @param item - the item to add
+        @return True if the item was (probably) already in the filter, False if it definitely wasn't
+        '''
+
+        already_present = True
+
+        for bit_index in self._get_bit_indexes(item):
+
+            byte_index, bit_mask = bit_index >> 3, 1 << (bit_index & 7)
+
+            if not self.bit_array[byte_index] & bit_mask:
+                already_present = False
+                self.bit_array[byte_index] |= bit_mask
+
+        return already_present
+
+    def __contains__(self, item:str) -> bool:
+        return all(self.bit_array[x >> 3] & (1 << (x & 7)) for x in self._get_bit_indexes(item))
+
+class MediaUrlSink:
+    '''
+    the output file for the media urls that `warcio_scrape` discovers
+
+    the same thumbnails show up for a lot of skus (bundles, parent products, etc), so urls that were already
+    written are dropped, using a `BloomFilter` so the memory used stays the same no matter how long the list gets.
+    New urls are buffered and written out in batches, and only fsync'd when `sync()` is called
+
+    NOTE: because of the bloom filter, a small number of urls (`false_positive_rate` of them) that were never
+    seen before can get dropped as well
+    '''
+
+    def __init__(self, media_file_path:pathlib.Path, bloom_filter:typing.Optional[BloomFilter]):
+        '''
+        @param media_file_path - the file to append the media urls to
+        @param bloom_filter - the filter to deduplicate with, or None to write every url
+        '''
+
+        self.media_file_path = media_file_path
+        self.bloom_filter = bloom_filter
+        self.pending_line_list = []
+        self.media_fh = None
+
+        self.urls_seen = 0
+        self.urls_written = 0
+        self.urls_deduplicated = 0
+
+    def open(self):
+
+        # urls that are already in the file from a earlier run shouldn't be written again
+        if self.bloom_filter is not None and self.media_file_path.exists():
+
+            seeded_url_count = 0
+
+            with open(self.media_file_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    media_url = line.strip()
+
+                    if media_url:
+                        self.bloom_filter.add(media_url)
+                        seeded_url_count += 1
+
+            logger.info("seeded the media url filter with `%s` urls that were already in `%s`", seeded_url_count, self.media_file_path)
+
+        self.media_fh = open(self.media_file_path, "a", encoding="utf-8", newline="\n")
+
+    def close(self):
+
+        if self.media_fh:
+            self.sync()
+            self.media_fh.close()
+            self.media_fh = None
+
+    def add(self, media_url_list:typing.Iterable[str]):
+        '''
+        @param media_url_list - the media urls to write out, if they haven't been already
+        '''
+
+        for iter_media_url in media_url_list:
+
+            self.urls_seen += 1
+
+            if self.bloom_filter is not None and self.bloom_filter.add(iter_media_url):
+                self.urls_deduplicated += 1
+                continue
+
+            self.pending_line_list.append("{}\n".format(iter_media_url))
+
+        if len(self.pending_line_list) >= MEDIA_URL_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+
+        if not self.pending_line_list:
+            return
+
+        self.media_fh.writelines(self.pending_line_list)
+        self.media_fh.flush()
+        self.urls_written += len(self.pending_line_list)
+        self.pending_line_list = []
+
+    def sync(self):
+
+        self.flush()
+        os.fsync(self.media_fh.fileno())
+
+    def log_stats(self):
+
+        logger.info("media urls: `%s` seen, `%s` written, `%s` dropped as duplicates", self.urls_seen, self.urls_written, self.urls_deduplicated)
@@ -0,0 +1,463 @@
+'''
+a local stand in for the playstation store, so `warcio_scrape`, `scrape_urls` and the wpull plugin can be
+tested (and timed) without hitting the real store
+
+it serves the valkyrie `/resolve/` and chihiro `/container/` api endpoints and the grid html pages, out of a
+fixture directory, the response records of a WARC from a earlier scrape, or documents made up on the spot
+for any sku (`--synthetic`), with as much latency, errors and HTTP 429s as you want to throw at the scraper
+
+the fixture directory looks like:
+
+    valkyrie/<sku>.json
+    chihiro/<sku>.json
+    grid/<page number>.html
+'''
+
+import collections
+import enum
+import hashlib
+import html
+import http.server
+import json
+import logging
+import pathlib
+import random
+import re
+import threading
+import time
+import typing
+import urllib.parse
+
+import attr
+from warcio.archiveiterator import ArchiveIterator
+
+logger = logging.getLogger(__name__)
+
+VALKYRIE_PATH_REGEX = re.compile(r"^/valkyrie-api/[^/]+/[^/]+/\d+/resolve/(?P<key>[^/]+)$")
+CHIHIRO_PATH_REGEX = re.compile(r"^/store/api/chihiro/[^/]+/container/[^/]+/[^/]+/\d+/(?P<key>[^/]+)$")
+GRID_PATH_REGEX = re.compile(r"^/[^/]+/grid/[^/]+/(?P<key>\d+)$")
+
+JSON_CONTENT_TYPE = "application/json"
+HTML_CONTENT_TYPE = "text/html; charset=utf-8"
+
+# how many games are on a grid page made up by `--synthetic`
+SYNTHETIC_GRID_PAGE_SIZE = 24
+
+
+class MockResourceKind(enum.Enum):
+    VALKYRIE = 1
+    CHIHIRO = 2
+    GRID = 3
+
+
+FIXTURE_FOLDER_DICT = {
+    MockResourceKind.VALKYRIE: ("valkyrie", ".json"),
+    MockResourceKind.CHIHIRO: ("chihiro", ".json"),
+    MockResourceKind.GRID: ("grid", ".html"),
+}
+
+PATH_REGEX_DICT = {
+    MockResourceKind.VALKYRIE: VALKYRIE_PATH_REGEX,
+    MockResourceKind.CHIHIRO: CHIHIRO_PATH_REGEX,
+    MockResourceKind.GRID: GRID_PATH_REGEX,
+}
+
+
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class MockResponse:
+    status_code:int = attr.ib()
+    content_type:str = attr.ib()
+    body:bytes = attr.ib(repr=False)
+
+
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class MockStoreConfig:
+    ''' how badly the mock store should behave '''
+
+    # every response takes at least this long, plus a random amount up to `latency_jitter_seconds`
+    latency_seconds:float = attr.ib(default=0.0)
+    latency_jitter_seconds:float = attr.ib(default=0.0)
+    # the fraction of requests that get a HTTP 500
+    error_rate:float = attr.ib(default=0.0)
+    # the fraction of requests that get a HTTP 429, with a `Retry-After` of `retry_after_seconds`
+    throttle_rate:float = attr.ib(default=0.0)
+    retry_after_seconds:float = attr.ib(default=1.0)
+    seed:typing.Optional[int] = attr.ib(default=None)
+
+
+def get_resource_kind_and_key(path:str) -> typing.Optional[typing.Tuple[MockResourceKind, str]]:
+    '''
+    works out what a request (or a url in a WARC) is asking for
+
+    @param path - the path of the url, without the query string
+    @return a tuple of (MockResourceKind, the sku or grid page number), or None if it isn't something the mock store serves
+    '''
+
+    for iter_kind, iter_regex in PATH_REGEX_DICT.items():
+
+        maybe_match = iter_regex.match(path)
+
+        if maybe_match:
+            return iter_kind, urllib.parse.unquote(maybe_match.group("key"))
+
+    return None
+
+
+def get_synthetic_valkyrie_json(sku:str) -> dict:
+
+    return {
+        "data": {"id": sku, "type": "game", "relationships": {}},
+        "included": [{
+            "id": sku,
+            "type": "game",
+            "attributes": {
+                "name": "Mock game {}".format(sku),
+                "default-sku-id": sku,
+                "thumbnail-url-base": "http://mock-media.invalid/{}/thumbnail.png".format(sku),
+                "media-list": {
+                    "preview": [],
+                    "promo": {
+                        "images": [{"url": "http://mock-media.invalid/{}/promo.png".format(sku)}],
+                        "videos": [],
+                    },
+                    "screenshots": [{"url": "http://mock-media.invalid/{}/screenshot1.jpg".format(sku)}],
+                },
+            },
+        }],
+    }
+
+def get_synthetic_chihiro_json(sku:str) -> dict:
+
+    return {
+        "id": sku,
+        "name": "Mock game {}".format(sku),
+        "images": [{"type": 1, "url": "http://mock-media.invalid/{}/image1.png".format(sku)}],
+        "promomedia": [],
+        "sku_links": [],
+    }
+
+def get_synthetic_grid_html(page_number:int, page_count:int, sku_list:typing.Sequence[str]) -> str:
+    '''
+    a grid page with just enough of the real markup for `scrape.get_games_list()`, past the last page
+    it shows the last page, like the real store does
+
+    @param page_number - the page that was asked for
+    @param page_count - how many pages there are
+    @param sku_list - the skus on this page
+    '''
+
+    page_number = min(page_number, page_count)
+
+    cell_list = []
+
+    for iter_sku in sku_list:
+        cell_list.append('''
+<div class="grid-cell">
+  <div class="grid-cell__title"><span>Mock game {sku}</span></div>
+  <a class="internal-app-link" href="/de-de/product/{sku}">link</a>
+  <div class="grid-cell__left-detail--detail-1">PS4</div>
+  <div class="grid-cell__left-detail--detail-2">Full Game</div>
+  <div class="grid-cell__left-detail--detail-3"></div>
+  <div class="grid-cell__left-detail--detail-4"></div>
+  <h3 class="price-display__price">0,00 €</h3>
+</div>'''.format(sku=html.escape(iter_sku)))
+
+    return '''<!DOCTYPE html>
+<html>
+<body>
+<a class="paginator-control__page-number--selected">{page_number}</a>
+{cells}
+<script class="ember-view" type="application/json">{{"page": {page_number}}}</script>
+</body>
+</html>
+'''.format(page_number=page_number, cells="".join(cell_list))
+
+
+class MockStoreData:
+    '''
+    the responses the mock store knows about, keyed by (MockResourceKind, sku or grid page number)
+    '''
+
+    def __init__(self, synthetic:bool=False):
+        '''
+        @param synthetic - if True, make up documents for skus (and grid pages) that we don't have a response for
+        '''
+
+        self.synthetic = synthetic
+        self.response_dict = {}
+
+    def add(self, kind:MockResourceKind, key:str, mock_response:MockResponse):
+        self.response_dict[(kind, key)] = mock_response
+
+    def get_sku_list(self) -> typing.List[str]:
+        return sorted({key for kind, key in self.response_dict if kind != MockResourceKind.GRID})
+
+    def load_fixture_dir(self, fixture_dir:pathlib.Path):
+
+        loaded_count = 0
+
+        for iter_kind, (iter_folder_name, iter_extension) in FIXTURE_FOLDER_DICT.items():
+
+            content_type = HTML_CONTENT_TYPE if iter_kind == MockResourceKind.GRID else JSON_CONTENT_TYPE
+
+            for iter_path in sorted((fixture_dir / iter_folder_name).glob("*" + iter_extension)):
+                self.add(iter_kind, iter_path.stem, MockResponse(status_code=200, content_type=content_type, body=iter_path.read_bytes()))
+                loaded_count += 1
+
+        logger.info("loaded `%s` responses from the fixture directory `%s`", loaded_count, fixture_dir)
+
+    def save_fixture_dir(self, fixture_dir:pathlib.Path):
+        ''' the opposite of `load_fixture_dir()`, only the HTTP 200 responses are saved since the fixtures don't have a status '''
+
+        saved_count = 0
+
+        for (iter_kind, iter_key), iter_mock_response in sorted(self.response_dict.items(), key=lambda x: (x[0][0].value, x[0][1])):
+
+            if iter_mock_response.status_code != 200:
+                continue
+
+            folder_name, extension = FIXTURE_FOLDER_DICT[iter_kind]
+            folder_path = fixture_dir / folder_name
+            folder_path.mkdir(parents=True, exist_ok=True)
+
+            (folder_path / (iter_key + extension)).write_bytes(iter_mock_response.body)
+            saved_count += 1
+
+        logger.info("saved `%s` responses to the fixture directory `%s`", saved_count, fixture_dir)
+
+    def load_warc(self, warc_path:pathlib.Path):
+        ''' loads the response records of a WARC, the last response for a url wins '''
+
+        loaded_count = 0
+
+        with open(warc_path, "rb") as f:
+
+            for iter_record in ArchiveIterator(f):
+
+                if iter_record.rec_type != "response" or iter_record.http_headers is None:
+                    continue
+
+                target_uri = iter_record.rec_headers.get_header("WARC-Target-URI")
+                kind_and_key = get_resource_kind_and_key(urllib.parse.urlsplit(target_uri).path)
+
+                if kind_and_key is None:
+                    continue
+
+                status_code = int(iter_record.http_headers.get_statuscode())
+                content_type = iter_record.http_headers.get_header("Content-Type") or JSON_CONTENT_TYPE
+
+                # `content_stream()` undoes the chunking and gzip, the mock store sends the body as is
+                self.add(kind_and_key[0], kind_and_key[1],
+                    MockResponse(status_code=status_code, content_type=content_type, body=iter_record.content_stream().read()))
+                loaded_count += 1
+
+        logger.info("loaded `%s` responses from the WARC `%s`", loaded_count, warc_path)
+
+    def get_response(self, kind:MockResourceKind, key:str) -> typing.Optional[MockResponse]:
+
+        mock_response = self.response_dict.get((kind, key))
+
+        if mock_response is not None:
+            return mock_response
+
+        if kind == MockResourceKind.GRID and not self.synthetic:
+            # past the last page, the real store shows the last page, which is how `scrape_urls` knows to stop
+            grid_page_list = [int(x[1]) for x in self.response_dict if x[0] == MockResourceKind.GRID]
+
+            if grid_page_list and int(key) > max(grid_page_list):
+                return self.response_dict[(MockResourceKind.GRID, str(max(grid_page_list)))]
+
+        if not self.synthetic:
+            return None
+
+        if kind == MockResourceKind.VALKYRIE:
+            return MockResponse(status_code=200, content_type=JSON_CONTENT_TYPE, body=json.dumps(get_synthetic_valkyrie_json(key)).encode("utf-8"))
+
+        if kind == MockResourceKind.CHIHIRO:
+            return MockResponse(status_code=200, content_type=JSON_CONTENT_TYPE, body=json.dumps(get_synthetic_chihiro_json(key)).encode("utf-8"))
+
+        sku_list = self.get_sku_list()
+        page_count = max(1, -(-len(sku_list) // SYNTHETIC_GRID_PAGE_SIZE))
+        page_number = min(int(key), page_count)
+        page_sku_list = sku_list[(page_number - 1) * SYNTHETIC_GRID_PAGE_SIZE:page_number * SYNTHETIC_GRID_PAGE_SIZE]
+
+        return MockResponse(status_code=200, content_type=HTML_CONTENT_TYPE,
+            body=get_synthetic_grid_html(page_number, page_count, page_sku_list).encode("utf-8"))
+
+
+class MockStoreServer:
+    '''
+    serves a `MockStoreData` over HTTP on a thread, with the misbehaviour from a `MockStoreConfig`
+    '''
+
+    def __init__(self, store_data:MockStoreData, config:MockStoreConfig, host:str="127.0.0.1", port:int=0):
+        '''
+        @param store_data - the responses to serve
+        @param config - the MockStoreConfig
+        @param host - the address to listen on
+        @param port - the port to listen on, 0 picks a free one (see `get_base_url()`)
+        '''
+
+        self.store_data = store_data
+        self.config = config
+        self.host = host
+        self.port = port
+
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        # (kind name, status code) -> count
+        self.served_count_dict = collections.Counter()
+
+        self.http_server = None
+        self.http_thread = None
+
+    def get_base_url(self) -> str:
+        ''' what to give to `--base-url` to point a scraper at this server '''
+        return "http://{}:{}".format(self.host, self.http_server.server_address[1])
+
+    def _get_injected_status_code(self) -> typing.Optional[int]:
+
+        with self.lock:
+            roll = self.random.random()
+            jitter_seconds = self.random.uniform(0, self.config.latency_jitter_seconds)
+
+        time.sleep(self.config.latency_seconds + jitter_seconds)
+
+        if roll < self.config.throttle_rate:
+            return 429
+
+        if roll < self.config.throttle_rate + self.config.error_rate:
+            return 500
+
+        return None
+
+    def handle_request(self, path:str, if_none_match:typing.Optional[str]) -> typing.Tuple[str, int, typing.Dict[str, str], bytes]:
+        '''
+        @param path - the request path, with the query string
+        @param if_none_match - the `If-None-Match` header of the request, if there was one
+        @return a tuple of (kind name for the stats, status code, header dict, body)
+        '''
+
+        kind_and_key = get_resource_kind_and_key(urllib.parse.urlsplit(path).path)
+
+        if kind_and_key is None:
+            return "unknown", 404, {}, b""
+
+        kind, key = kind_and_key
+        kind_name = kind.name.lower()
+
+        injected_status_code = self._get_injected_status_code()
+
+        if injected_status_code == 429:
+            return kind_name, 429, {"Retry-After": "{:g}".format(self.config.retry_after_seconds)}, b""
+
+        if injected_status_code is not None:
+            return kind_name, injected_status_code, {}, b""
+
+        mock_response = self.store_data.get_response(kind, key)
+
+        if mock_response is None:
+            return kind_name, 404, {"Content-Type": JSON_CONTENT_TYPE}, b'{"errors": [{"status": 404}]}'
+
+        header_dict = {"Content-Type": mock_response.content_type}
+
+        # lets the validator cache of `warcio_scrape` get some use
+        if mock_response.status_code == 200:
+            etag = '"{}"'.format(hashlib.sha1(mock_response.body).hexdigest())
+            header_dict["ETag"] = etag
+
+            if if_none_match == etag:
+                return kind_name, 304, header_dict, b""
+
+        return kind_name, mock_response.status_code, header_dict, mock_response.body
+
+    def start(self):
+
+        mock_server = self
+
+        class _MockStoreRequestHandler(http.server.BaseHTTPRequestHandler):
+
+            # keep-alive, like the real store
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+
+                kind_name, status_code, header_dict, body = mock_server.handle_request(self.path, self.headers.get("If-None-Match"))
+
+                with mock_server.lock:
+                    mock_server.served_count_dict[(kind_name, status_code)] += 1
+
+                self.send_response(status_code)
+
+                for iter_name, iter_value in header_dict.items():
+                    self.send_header(iter_name, iter_value)
+
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("mock store: %s", format % args)
+
+        self.http_server = http.server.ThreadingHTTPServer((self.host, self.port), _MockStoreRequestHandler)
+        self.http_server.daemon_threads = True
+        self.http_thread = threading.Thread(target=self.http_server.serve_forever, name="mock-store", daemon=True)
+        self.http_thread.start()
+
+        logger.info("mock store listening on `%s` with `%s`", self.get_base_url(), self.config)
+
+    def stop(self):
+
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+
+        self.log_stats()
+
+    def log_stats(self):
+
+        with self.lock:
+            served_item_list = sorted(self.served_count_dict.items(), key=lambda x: (x[0][0], x[0][1]))
+
+        for (iter_kind_name, iter_status_code), iter_count in served_item_list:
+            logger.info("mock store: served `%s` `%s` responses with HTTP `%s`", iter_count, iter_kind_name, iter_status_code)
+
+
+def run(parsed_args):
+
+    if parsed_args.fixture_dir is None and parsed_args.warc_file is None and not parsed_args.synthetic:
+        raise Exception("the mock store needs something to serve, give it --fixture-dir, --warc-file and/or --synthetic")
+
+    store_data = MockStoreData(synthetic=parsed_args.synthetic)
+
+    if parsed_args.fixture_dir is not None:
+        store_data.load_fixture_dir(parsed_args.fixture_dir)
+
+    if parsed_args.warc_file is not None:
+        store_data.load_warc(parsed_args.warc_file)
+
+    config = MockStoreConfig(
+        latency_seconds=parsed_args.latency,
+        latency_jitter_seconds=parsed_args.latency_jitter,
+        error_rate=parsed_args.error_rate,
+        throttle_rate=parsed_args.throttle_rate,
+        retry_after_seconds=parsed_args.retry_after,
+        seed=parsed_args.seed)
+
+    mock_server = MockStoreServer(store_data, config, host=parsed_args.host, port=parsed_args.port)
+    mock_server.start()
+
+    logger.info("point the scrapers at it with `--base-url %s`, or the wpull plugin with the `%s` environment variable, ctrl+c to stop",
+        mock_server.get_base_url(), "PSSTORE_BASE_URL")
+
+    try:
+        while True:
+            time.sleep(60)
+            mock_server.log_stats()
+
+    except KeyboardInterrupt:
+        logger.info("stopping the mock store")
+
+    finally:
+        mock_server.stop()
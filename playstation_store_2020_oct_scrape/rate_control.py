@@ -0,0 +1,185 @@
+import email.utils
+import logging
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+# statuses that mean the store wants us to slow down
+THROTTLE_STATUS_CODE_SET = frozenset([429, 503])
+
+def get_retry_after_seconds(response) -> typing.Optional[float]:
+    '''
+    gets the `Retry-After` header of a response in seconds, it can either be a number of seconds or a HTTP date
+
+    @param response - a `requests.Response`
+    @return the number of seconds, or None if the header isn't there (or we can't make sense of it)
+    '''
+
+    retry_after = response.headers.get("Retry-After")
+
+    if retry_after is None:
+        return None
+
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+
+    try:
+        retry_after_time = email.utils.parsedate_to_datetime(retry_after)
+        return max(0.0, retry_after_time.timestamp() - time.time())
+
+    except (TypeError, ValueError):
+        logger.warning("couldn't parse the Retry-After header `%s`", retry_after)
+        return None
+
+class AimdController:
+    '''
+    a additive increase / multiplicative decrease controller (like TCP congestion control) for how many requests
+    we have in flight at once
+
+    every time a full "window" of requests (as many as the current limit) comes back healthy, the limit goes up by
+    `increase_step`, as long as the latency hasn't grown to more then `latency_factor` times the best latency we
+    have seen. When the store throttles us (HTTP 429 / 503, or a `Retry-After` header) or too many requests in the
+    window fail, the limit is multiplied by `decrease_factor`, and with a `Retry-After` (or a throttle status without
+    one) we stop sending anything at all for a while
+
+    this isn't thread safe, it should only be called from one thread
+    '''
+
+    def __init__(self, initial_limit:int, min_limit:int, max_limit:int, increase_step:float=1.0,
+        decrease_factor:float=0.5, latency_factor:float=2.0, error_rate_threshold:float=0.1, throttle_pause_seconds:float=5.0):
+        '''
+        @param initial_limit - the limit to start at
+        @param min_limit - the limit never goes below this
+        @param max_limit - the limit never goes above this
+        @param increase_step - how much to raise the limit by after a healthy window
+        @param decrease_factor - what to multiply the limit by when we get throttled
+        @param latency_factor - don't raise the limit if the average latency is more then this many times the best we have seen
+        @param error_rate_threshold - lower the limit if more then this fraction of a window's requests failed
+        @param throttle_pause_seconds - how long to stop sending requests when throttled without a `Retry-After` header
+        '''
+
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise Exception("the concurrency limits must be 1 <= min (`{}`) <= initial (`{}`) <= max (`{}`)".format(
+                min_limit, initial_limit, max_limit))
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_factor = latency_factor
+        self.error_rate_threshold = error_rate_threshold
+        self.throttle_pause_seconds = throttle_pause_seconds
+
+        self.limit = float(initial_limit)
+
+        self.window_response_count = 0
+        self.window_error_count = 0
+
+        self.latency_ewma = None
+        self.best_latency_ewma = None
+
+        self.paused_until = 0.0
+        # requests that were sent before the last decrease shouldn't cause another one
+        self.last_decrease_time = 0.0
+
+        self.throttle_count = 0
+        self.increase_count = 0
+        self.decrease_count = 0
+
+    def get_limit(self) -> int:
+        return int(self.limit)
+
+    def get_wait_seconds(self) -> float:
+        ''' how long to wait before sending any more requests, 0 if we can send now '''
+        return max(0.0, self.paused_until - time.monotonic())
+
+    def on_response(self, status_code:typing.Optional[int], latency_seconds:typing.Optional[float],
+        retry_after_seconds:typing.Optional[float]=None, sent_time:typing.Optional[float]=None):
+        '''
+        tells the controller how a request went
+
+        @param status_code - the HTTP status, or None if the request failed without one (connection errors and such)
+        @param latency_seconds - how long the request took, or None if we don't know
+        @param retry_after_seconds - the `Retry-After` header of the response, if there was one
+        @param sent_time - the `time.monotonic()` of when the request was sent, if given, a request that was sent
+        before the last decrease won't cause another one
+        '''
+
+        now = time.monotonic()
+        sent_before_last_decrease = sent_time is not None and sent_time < self.last_decrease_time
+
+        if status_code in THROTTLE_STATUS_CODE_SET or retry_after_seconds is not None:
+
+            self.throttle_count += 1
+
+            pause_seconds = retry_after_seconds if retry_after_seconds is not None else self.throttle_pause_seconds
+            self.paused_until = max(self.paused_until, now + pause_seconds)
+
+            if not sent_before_last_decrease:
+                self._decrease(now, "got HTTP `{}` (Retry-After: `{}`), pausing for `{:.1f}` seconds".format(
+                    status_code, retry_after_seconds, pause_seconds))
+
+            return
+
+        is_error = status_code is None or status_code >= 500
+
+        if not is_error and latency_seconds is not None:
+
+            self.latency_ewma = latency_seconds if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency_seconds
+
+            if self.best_latency_ewma is None or self.latency_ewma < self.best_latency_ewma:
+                self.best_latency_ewma = self.latency_ewma
+
+        self.window_response_count += 1
+        if is_error:
+            self.window_error_count += 1
+
+        if self.window_response_count < max(1, self.get_limit()):
+            return
+
+        error_rate = self.window_error_count / self.window_response_count
+        self.window_response_count = 0
+        self.window_error_count = 0
+
+        if error_rate > self.error_rate_threshold:
+
+            if not sent_before_last_decrease:
+                self._decrease(now, "`{:.0%}` of the last requests failed".format(error_rate))
+
+            return
+
+        if self.latency_ewma is not None and self.latency_ewma > self.best_latency_ewma * self.latency_factor:
+            logger.debug("rate control: not raising the limit, latency `%.3f` seconds is more then `%s`x the best of `%.3f` seconds",
+                self.latency_ewma, self.latency_factor, self.best_latency_ewma)
+            return
+
+        self._increase()
+
+    def _increase(self):
+
+        old_limit = self.get_limit()
+        self.limit = min(float(self.max_limit), self.limit + self.increase_step)
+
+        if self.get_limit() != old_limit:
+            self.increase_count += 1
+            logger.info("rate control: requests are healthy (latency `%.3f` seconds), raising the concurrency from `%s` to `%s`",
+                self.latency_ewma or 0.0, old_limit, self.get_limit())
+
+    def _decrease(self, now:float, reason:str):
+
+        old_limit = self.get_limit()
+        self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+        self.last_decrease_time = now
+        self.window_response_count = 0
+        self.window_error_count = 0
+        self.decrease_count += 1
+
+        logger.info("rate control: %s, lowering the concurrency from `%s` to `%s`", reason, old_limit, self.get_limit())
+
+    def log_stats(self):
+
+        logger.info("rate control: ended at a concurrency of `%s`, got throttled `%s` times, raised the concurrency `%s` times and lowered it `%s` times",
+            self.get_limit(), self.throttle_count, self.increase_count, self.decrease_count)
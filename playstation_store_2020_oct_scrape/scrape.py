@@ -5,6 +5,7 @@ import pprint
 import typing
 import json
 import subprocess
+import time
 import urllib.parse
 
 import arrow
@@ -12,12 +13,15 @@ import requests
 import attr
 from bs4 import BeautifulSoup
 
+from playstation_store_2020_oct_scrape import rate_control
+
 logger = logging.getLogger(__name__)
 
 
 # https://store.playstation.com/en-us/grid/STORE-MSF77008-ALLGAMES/1?PlatformPrivacyWs1=exempt&direction=asc&psappver=19.15.0&scope=sceapp&smcid=psapp%3Alink%20menu%3Astore&sort=release_date
 URL_ROOT = "https://store.playstation.com"
-URL_FORMAT_TEMPLATE = "{}/de-de/grid/STORE-MSF75508-FULLGAMES/{}".format(URL_ROOT, "{}")
+GRID_PATH_FORMAT_TEMPLATE = "/de-de/grid/STORE-MSF75508-FULLGAMES/{}"
+URL_FORMAT_TEMPLATE = "{}{}".format(URL_ROOT, GRID_PATH_FORMAT_TEMPLATE)
 # URL_FORMAT_TEMPLATE = "{}/en-us/grid/STORE-MSF77008-ALLGAMES/{}".format(URL_ROOT, "{}")
 
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:84.0) Gecko/20100101 Firefox/84.0"
@@ -30,6 +34,7 @@ GET_PARAMS = {
     "sort":"release_date"
 }
 
+# no `Host`, requests sets it from the url, so it is right for `--base-url` too
 HEADERS = {
     "Accept": "application/json",
     "Accept-Encoding": "gzip, deflate",
@@ -37,12 +42,12 @@ HEADERS = {
     "Cache-Control": "no-cache",
     "Cookie": "cookie: akacd_valkyrie-storefront-to-gotham=2177452799~rv=65~id=110c5e7ff3de9d1edff3accaba985101; last_locale=de-DE; s_fid=0DE0FF05F43AB423-361B2AFF495657B2; s_cc=true; s_sq=%5B%5BB%5D%5D; JSESSIONID=8F41E5877F1128181AC08E3AD2BD3A91-n1",
     "Dnt": "1",
-    "Host": "store.playstation.com",
     "User-Agent": USER_AGENT,
     "Referer": "https://store.playstation.com/de-de/grid/STORE-MSF75508-ALLGAMES/1?PlatformPrivacyWs1=exempt&direction=asc&psappver=19.15.0&scope=sceapp&smcid=psapp%3Alink%20menu%3Astore&sort=release_date"
   }
 
-
+# how many times to try a page that the store keeps throttling before giving up
+MAX_THROTTLED_ATTEMPTS = 10
 
 
 session = requests.Session()
@@ -101,6 +106,36 @@ def get_string_or_none(tag):
     else:
         return None
 
+def get_page_with_rate_control(url:str, rate_controller:rate_control.AimdController) -> requests.Response:
+    '''
+    gets a page, waiting (and trying again) whenever the store tells us to slow down with a HTTP 429 / 503 or a
+    `Retry-After` header
+
+    @param url - the url to get
+    @param rate_controller - the AimdController that keeps track of how long to wait
+    @return the `requests.Response`, which might still be a throttled one if we ran out of attempts
+    '''
+
+    for attempt in range(MAX_THROTTLED_ATTEMPTS):
+
+        wait_seconds = rate_controller.get_wait_seconds()
+        if wait_seconds:
+            logger.info("waiting `%.1f` seconds before getting `%s`, the store asked us to slow down", wait_seconds, url)
+            time.sleep(wait_seconds)
+
+        sent_time = time.monotonic()
+        res = session.get(url, params=GET_PARAMS)
+
+        rate_controller.on_response(res.status_code, time.monotonic() - sent_time,
+            rate_control.get_retry_after_seconds(res), sent_time)
+
+        if res.status_code not in rate_control.THROTTLE_STATUS_CODE_SET:
+            return res
+
+        logger.warning("attempt `%s` of `%s`: url `%s` was throttled with HTTP `%s`", attempt + 1, MAX_THROTTLED_ATTEMPTS, url, res.status_code)
+
+    return res
+
 def wpull_games_list(parsed_args):
 
     logger.info("Beginning wpull of urls")
@@ -157,13 +192,24 @@ def get_games_list(parsed_args):
 
     game_url_collection = GameUrlCollection(date_collected=arrow.utcnow().isoformat())
 
+    # `--base-url` is for pointing this at the mock store
+    url_root = URL_ROOT
+    url_format_template = URL_FORMAT_TEMPLATE
+    if parsed_args.base_url is not None:
+        url_root = parsed_args.base_url.rstrip("/")
+        url_format_template = "{}{}".format(url_root, GRID_PATH_FORMAT_TEMPLATE)
+        logger.info("getting the grid pages from `%s` instead of the real store", url_root)
+
+    # the pages are gotten one at a time, so this is only used for how long to back off when throttled
+    rate_controller = rate_control.AimdController(initial_limit=1, min_limit=1, max_limit=1)
+
     page_counter = 1
     while True:
 
-        current_url = URL_FORMAT_TEMPLATE.format(page_counter)
+        current_url = url_format_template.format(page_counter)
 
         logger.info("on url page index `%s`", page_counter)
-        res = session.get(current_url, params=GET_PARAMS)
+        res = get_page_with_rate_control(current_url, rate_controller)
 
         if res.status_code != 200:
             logger.error("url `%s` did not return a good status code, it returned `%s`", current_url, res)
@@ -217,7 +263,7 @@ def get_games_list(parsed_args):
             url_tag = get_tag_by_class_or_raise(iter_grid_cell_div_tag, "a", "internal-app-link", current_url, idx)
             url = url_tag["href"]
 
-            full_url = "{}{}".format(URL_ROOT, url)
+            full_url = "{}{}".format(url_root, url)
 
             # https://store.playstation.com/en-us/product/UP9000-NPUA80001_00-FLOW_BUNDLE_____?scope=sceapp
             parsed_url = urllib.parse.urlparse(full_url)
@@ -279,6 +325,7 @@ def get_games_list(parsed_args):
     # logger.info("final collection: `%s`", x)
 
     logger.info("got `%s` games", len(game_url_collection.game_urls))
+    rate_controller.log_stats()
 
     with open(parsed_args.outfile, "w", encoding="utf-8") as f:
 
@@ -0,0 +1,414 @@
+import bisect
+import collections
+import http.server
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds, the last bucket is everything above the last bound (prometheus' `+Inf`)
+LATENCY_BUCKET_BOUND_LIST = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+# the "recent" requests per second are over this many seconds
+RECENT_RATE_WINDOW_SECONDS = 60
+
+METRIC_NAME_PREFIX = "psstore_scrape"
+
+METRICS_HTTP_HOST = "127.0.0.1"
+
+
+class LatencyHistogram:
+    '''
+    a fixed bucket histogram of request latencies, so it takes the same memory no matter how long the scrape runs
+
+    this isn't thread safe, `ScrapeMetrics` takes care of that
+    '''
+
+    def __init__(self, bucket_bound_list:typing.Sequence[float]=LATENCY_BUCKET_BOUND_LIST):
+
+        self.bucket_bound_list = list(bucket_bound_list)
+        self.bucket_count_list = [0] * (len(self.bucket_bound_list) + 1)
+        self.count = 0
+        self.total_seconds = 0.0
+
+    def observe(self, seconds:float):
+
+        self.bucket_count_list[bisect.bisect_left(self.bucket_bound_list, seconds)] += 1
+        self.count += 1
+        self.total_seconds += seconds
+
+    def get_percentile(self, percentile:float) -> typing.Optional[float]:
+        '''
+        estimates a percentile the same way prometheus' `histogram_quantile()` does, by assuming the
+        latencies are spread out evenly inside the bucket the percentile lands in
+
+        @param percentile - from 0 to 1
+        @return the estimated latency in seconds, or None if nothing was observed yet
+        '''
+
+        if not self.count:
+            return None
+
+        rank = percentile * self.count
+        seen_count = 0
+
+        for idx, iter_bucket_count in enumerate(self.bucket_count_list):
+
+            if seen_count + iter_bucket_count >= rank and iter_bucket_count:
+
+                if idx == len(self.bucket_bound_list):
+                    # can't interpolate into `+Inf`
+                    return self.bucket_bound_list[-1]
+
+                lower_bound = 0.0 if idx == 0 else self.bucket_bound_list[idx - 1]
+                upper_bound = self.bucket_bound_list[idx]
+
+                return lower_bound + (upper_bound - lower_bound) * ((rank - seen_count) / iter_bucket_count)
+
+            seen_count += iter_bucket_count
+
+        return self.bucket_bound_list[-1]
+
+    def get_cumulative_bucket_list(self) -> typing.List[typing.Tuple[str, int]]:
+        ''' the (upper bound, count) pairs the way prometheus wants them, every bucket includes the ones below it '''
+
+        result_list = []
+        cumulative_count = 0
+
+        for iter_bound, iter_bucket_count in zip(self.bucket_bound_list + ["+Inf"], self.bucket_count_list):
+            cumulative_count += iter_bucket_count
+            result_list.append((str(iter_bound), cumulative_count))
+
+        return result_list
+
+
+class ScrapeMetrics:
+    '''
+    counters for a long scrape: how many requests per second, how long they take (split by api), how many bytes
+    came in, how many retries, which status codes and how many media urls were found, along with how many skus
+    are done and when the rest should be
+
+    the fetch scheduler and the writer thread both update it, and the metrics server / textfile writer read it,
+    so everything goes through a lock
+    '''
+
+    def __init__(self, sku_total:typing.Optional[int]=None, worker_index:typing.Optional[int]=None):
+        '''
+        @param sku_total - how many skus this run has to go through, or None if we don't know (no ETA then)
+        @param worker_index - which `--workers` worker this is, if any, it is added as a label
+        '''
+
+        self.sku_total = sku_total
+        self.worker_index = worker_index
+
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.start_timestamp = time.time()
+
+        self.request_count = 0
+        # api name -> LatencyHistogram
+        self.latency_histogram_dict = collections.defaultdict(LatencyHistogram)
+        # (api name, status code or "error") -> count
+        self.status_code_count_dict = collections.Counter()
+        self.bytes_in = 0
+        self.retry_count = 0
+        self.media_url_count = 0
+        self.sku_done_count = 0
+        self.sku_skipped_count = 0
+
+        # monotonic times of the requests in the last `RECENT_RATE_WINDOW_SECONDS`
+        self.recent_request_time_deque = collections.deque()
+
+    def on_response(self, api_name:str, status_code:typing.Optional[int], latency_seconds:typing.Optional[float], byte_count:int):
+        '''
+        @param api_name - `valkyrie` or `chihiro`
+        @param status_code - the HTTP status, or None if the request failed without one
+        @param latency_seconds - how long the request took, if we know
+        @param byte_count - the size of the response body
+        '''
+
+        now = time.monotonic()
+
+        with self.lock:
+
+            self.request_count += 1
+            self.bytes_in += byte_count
+            self.status_code_count_dict[(api_name, "error" if status_code is None else str(status_code))] += 1
+
+            if latency_seconds is not None:
+                self.latency_histogram_dict[api_name].observe(latency_seconds)
+
+            self.recent_request_time_deque.append(now)
+            self._drop_old_request_times(now)
+
+    def on_retry(self):
+
+        with self.lock:
+            self.retry_count += 1
+
+    def on_sku_done(self, media_url_count:int):
+
+        with self.lock:
+            self.sku_done_count += 1
+            self.media_url_count += media_url_count
+
+    def on_sku_skipped(self):
+        ''' for skus that the journal or the dead sku list say don't need to be downloaded '''
+
+        with self.lock:
+            self.sku_skipped_count += 1
+
+    def _drop_old_request_times(self, now:float):
+
+        while self.recent_request_time_deque and self.recent_request_time_deque[0] < now - RECENT_RATE_WINDOW_SECONDS:
+            self.recent_request_time_deque.popleft()
+
+    def get_snapshot(self) -> dict:
+        ''' all of the metrics as a json friendly dict '''
+
+        now = time.monotonic()
+
+        with self.lock:
+
+            self._drop_old_request_times(now)
+
+            elapsed_seconds = max(now - self.start_time, 1e-9)
+            recent_window_seconds = min(elapsed_seconds, RECENT_RATE_WINDOW_SECONDS)
+
+            eta_seconds = None
+            if self.sku_total is not None and self.sku_done_count:
+                remaining_sku_count = max(0, self.sku_total - self.sku_done_count - self.sku_skipped_count)
+                eta_seconds = remaining_sku_count / (self.sku_done_count / elapsed_seconds)
+
+            latency_dict = {}
+            for iter_api_name, iter_histogram in sorted(self.latency_histogram_dict.items()):
+                latency_dict[iter_api_name] = {
+                    "count": iter_histogram.count,
+                    "mean_seconds": iter_histogram.total_seconds / iter_histogram.count if iter_histogram.count else None,
+                    "p50_seconds": iter_histogram.get_percentile(0.5),
+                    "p90_seconds": iter_histogram.get_percentile(0.9),
+                    "p99_seconds": iter_histogram.get_percentile(0.99),
+                }
+
+            status_code_dict = {}
+            for (iter_api_name, iter_status), iter_count in sorted(self.status_code_count_dict.items()):
+                status_code_dict.setdefault(iter_api_name, {})[iter_status] = iter_count
+
+            return {
+                "worker": self.worker_index,
+                "start_timestamp": self.start_timestamp,
+                "elapsed_seconds": elapsed_seconds,
+                "request_count": self.request_count,
+                "requests_per_second": self.request_count / elapsed_seconds,
+                "recent_requests_per_second": len(self.recent_request_time_deque) / recent_window_seconds,
+                "bytes_in": self.bytes_in,
+                "retry_count": self.retry_count,
+                "status_codes": status_code_dict,
+                "latency": latency_dict,
+                "media_url_count": self.media_url_count,
+                "sku_total": self.sku_total,
+                "sku_done_count": self.sku_done_count,
+                "sku_skipped_count": self.sku_skipped_count,
+                "eta_seconds": eta_seconds,
+            }
+
+    def get_prometheus_text(self) -> str:
+        ''' all of the metrics in the prometheus text exposition format, for node_exporter's textfile collector or a scrape '''
+
+        snapshot = self.get_snapshot()
+
+        label_str = ""
+        if self.worker_index is not None:
+            label_str = 'worker="{}"'.format(self.worker_index)
+
+        def _labels(*extra_label_list) -> str:
+            label_list = [x for x in (label_str,) + extra_label_list if x]
+            return "{{{}}}".format(",".join(label_list)) if label_list else ""
+
+        line_list = []
+
+        def _add_metric(name:str, metric_type:str, help_str:str, value_list:typing.Sequence[typing.Tuple[str, typing.Any]]):
+            full_name = "{}_{}".format(METRIC_NAME_PREFIX, name)
+            line_list.append("# HELP {} {}".format(full_name, help_str))
+            line_list.append("# TYPE {} {}".format(full_name, metric_type))
+
+            for iter_suffix_and_labels, iter_value in value_list:
+                line_list.append("{}{} {}".format(full_name, iter_suffix_and_labels, iter_value))
+
+        _add_metric("requests_total", "counter", "api requests made", [(_labels(), snapshot["request_count"])])
+        _add_metric("recent_requests_per_second", "gauge", "api requests per second over the last minute",
+            [(_labels(), snapshot["recent_requests_per_second"])])
+        _add_metric("bytes_in_total", "counter", "bytes of api responses downloaded", [(_labels(), snapshot["bytes_in"])])
+        _add_metric("retries_total", "counter", "api requests that were retried", [(_labels(), snapshot["retry_count"])])
+        _add_metric("media_urls_total", "counter", "media urls found", [(_labels(), snapshot["media_url_count"])])
+        _add_metric("skus_done_total", "counter", "skus that were downloaded", [(_labels(), snapshot["sku_done_count"])])
+        _add_metric("skus_skipped_total", "counter", "skus that were skipped because they were done or dead",
+            [(_labels(), snapshot["sku_skipped_count"])])
+
+        if snapshot["sku_total"] is not None:
+            _add_metric("skus", "gauge", "skus in this run", [(_labels(), snapshot["sku_total"])])
+
+        if snapshot["eta_seconds"] is not None:
+            _add_metric("eta_seconds", "gauge", "estimated seconds until every sku is done", [(_labels(), snapshot["eta_seconds"])])
+
+        status_value_list = []
+        for iter_api_name, iter_status_dict in snapshot["status_codes"].items():
+            for iter_status, iter_count in iter_status_dict.items():
+                status_value_list.append((_labels('api="{}"'.format(iter_api_name), 'status="{}"'.format(iter_status)), iter_count))
+        _add_metric("responses_total", "counter", "api responses by status code", status_value_list)
+
+        with self.lock:
+            histogram_item_list = sorted(self.latency_histogram_dict.items())
+            histogram_value_list = []
+
+            for iter_api_name, iter_histogram in histogram_item_list:
+                api_label = 'api="{}"'.format(iter_api_name)
+
+                for iter_bound, iter_count in iter_histogram.get_cumulative_bucket_list():
+                    histogram_value_list.append(("_bucket" + _labels(api_label, 'le="{}"'.format(iter_bound)), iter_count))
+
+                histogram_value_list.append(("_sum" + _labels(api_label), iter_histogram.total_seconds))
+                histogram_value_list.append(("_count" + _labels(api_label), iter_histogram.count))
+
+        _add_metric("request_latency_seconds", "histogram", "api request latency", histogram_value_list)
+
+        return "\n".join(line_list) + "\n"
+
+    def log_stats(self):
+
+        snapshot = self.get_snapshot()
+
+        eta_str = "?" if snapshot["eta_seconds"] is None else "{:.0f} seconds".format(snapshot["eta_seconds"])
+
+        logger.info("metrics: `%s` skus done (`%s` skipped) out of `%s`, `%.1f` requests per second (`%.1f` over the last minute), " +
+            "`%s` bytes in, `%s` retries, ETA: `%s`",
+            snapshot["sku_done_count"], snapshot["sku_skipped_count"], "?" if snapshot["sku_total"] is None else snapshot["sku_total"],
+            snapshot["requests_per_second"], snapshot["recent_requests_per_second"], snapshot["bytes_in"], snapshot["retry_count"], eta_str)
+
+        for iter_api_name, iter_latency_dict in snapshot["latency"].items():
+            logger.info("metrics: `%s` latency p50: `%.3f`, p90: `%.3f`, p99: `%.3f` seconds, status codes: `%s`",
+                iter_api_name, iter_latency_dict["p50_seconds"], iter_latency_dict["p90_seconds"], iter_latency_dict["p99_seconds"],
+                snapshot["status_codes"].get(iter_api_name, {}))
+
+
+def _write_file_atomically(path:pathlib.Path, text:str):
+    ''' so whatever reads the file (like node_exporter) never sees half of it '''
+
+    temp_path = path.with_name(path.name + ".tmp")
+
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+    os.replace(temp_path, path)
+
+
+class MetricsReporter:
+    '''
+    shares a `ScrapeMetrics` with the outside world while the scrape runs: a localhost HTTP endpoint
+    (`/metrics` for prometheus, `/status.json` for everything else), and/or JSON and prometheus textfiles
+    that get rewritten every `interval_seconds` (which also logs the metrics)
+    '''
+
+    def __init__(self, metrics:ScrapeMetrics, http_port:typing.Optional[int]=None,
+        json_file:typing.Optional[pathlib.Path]=None, prometheus_file:typing.Optional[pathlib.Path]=None,
+        interval_seconds:float=15.0):
+        '''
+        @param metrics - the ScrapeMetrics to report
+        @param http_port - the port to serve the metrics on (on localhost only), or None to not serve them
+        @param json_file - where to write the metrics as JSON, if anywhere
+        @param prometheus_file - where to write the metrics for the prometheus node_exporter textfile collector, if anywhere
+        @param interval_seconds - how often to rewrite the files
+        '''
+
+        self.metrics = metrics
+        self.http_port = http_port
+        self.json_file = json_file
+        self.prometheus_file = prometheus_file
+        self.interval_seconds = interval_seconds
+
+        self.http_server = None
+        self.http_thread = None
+        self.file_thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+
+        if self.http_port is not None:
+
+            metrics = self.metrics
+
+            class _MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+
+                def do_GET(self):
+
+                    if self.path == "/metrics":
+                        body = metrics.get_prometheus_text().encode("utf-8")
+                        content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+                    elif self.path in ("/", "/status.json"):
+                        body = json.dumps(metrics.get_snapshot(), indent=4).encode("utf-8")
+                        content_type = "application/json"
+
+                    else:
+                        self.send_error(404)
+                        return
+
+                    self.send_response(200)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    logger.debug("metrics server: %s", format % args)
+
+            self.http_server = http.server.ThreadingHTTPServer((METRICS_HTTP_HOST, self.http_port), _MetricsRequestHandler)
+            self.http_thread = threading.Thread(target=self.http_server.serve_forever, name="metrics-http", daemon=True)
+            self.http_thread.start()
+
+            logger.info("serving metrics on `http://%s:%s/metrics` and `http://%s:%s/status.json`",
+                METRICS_HTTP_HOST, self.http_server.server_address[1], METRICS_HTTP_HOST, self.http_server.server_address[1])
+
+        self.file_thread = threading.Thread(target=self._file_thread_main, name="metrics-file", daemon=True)
+        self.file_thread.start()
+
+    def _file_thread_main(self):
+
+        while not self.stop_event.wait(self.interval_seconds):
+            self._report()
+
+    def _report(self):
+
+        try:
+            if self.json_file is not None:
+                _write_file_atomically(self.json_file, json.dumps(self.metrics.get_snapshot(), indent=4))
+
+            if self.prometheus_file is not None:
+                _write_file_atomically(self.prometheus_file, self.metrics.get_prometheus_text())
+
+        except Exception as e:
+            # not worth stopping the scrape over
+            logger.warning("couldn't write the metrics files: `%s`", e)
+
+        self.metrics.log_stats()
+
+    def stop(self):
+        ''' writes the files one last time, and stops the HTTP server '''
+
+        self.stop_event.set()
+
+        if self.file_thread is not None:
+            self.file_thread.join()
+            self.file_thread = None
+
+        self._report()
+
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
@@ -0,0 +1,151 @@
+import logging
+import pathlib
+import sqlite3
+import threading
+import typing
+
+import attr
+
+logger = logging.getLogger(__name__)
+
+CREATE_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS validators (
+    url TEXT PRIMARY KEY NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    payload_digest TEXT NOT NULL,
+    warc_date TEXT NOT NULL
+) WITHOUT ROWID
+'''
+
+# the `--workers` processes all read the same earlier cache, so wait for the others rather then failing
+SQLITE_TIMEOUT_SECONDS = 120
+
+# what a earlier cache is attached as, see `ValidatorCache`
+PREVIOUS_SCHEMA_NAME = "previous"
+MERGE_SCHEMA_NAME = "merge_source"
+
+
+@attr.s(auto_attribs=True, kw_only=True, frozen=True)
+class UrlValidators:
+    '''
+    what we know about the last full response we saved for a url
+    '''
+    url:str = attr.ib()
+    etag:typing.Optional[str] = attr.ib()
+    last_modified:typing.Optional[str] = attr.ib()
+    # the `WARC-Payload-Digest` and `WARC-Date` of the response record that has the full payload,
+    # which is what a revisit record refers back to
+    payload_digest:str = attr.ib()
+    warc_date:str = attr.ib()
+
+    def get_conditional_headers(self) -> typing.Dict[str, str]:
+        ''' the headers to send so the server can answer with a `304 Not Modified` if nothing changed '''
+
+        header_dict = {}
+
+        if self.etag:
+            header_dict["If-None-Match"] = self.etag
+
+        if self.last_modified:
+            header_dict["If-Modified-Since"] = self.last_modified
+
+        return header_dict
+
+
+class ValidatorCache:
+    '''
+    a sqlite database of the `UrlValidators` of every url from earlier runs, so a re-scrape can send
+    conditional requests, and write small revisit records for responses that didn't change
+
+    lookups and updates can happen from different threads, but updates only hit the disk on `commit()`
+
+    with `--workers` every worker writes to a cache of its own, and only reads the one from earlier runs (given as
+    `previous_cache_path`), so the workers never wait on each other for the write lock. `merge()` then puts them
+    all back into the one cache once the workers are finished
+    '''
+
+    def __init__(self, cache_path:pathlib.Path, previous_cache_path:typing.Optional[pathlib.Path]=None):
+
+        self.cache_path = cache_path
+        self.previous_cache_path = previous_cache_path
+        self.connection = None
+        self.lock = threading.Lock()
+        self.pending_count = 0
+
+    def open(self):
+
+        logger.info("opening the validator cache `%s`", self.cache_path)
+
+        self.connection = sqlite3.connect(str(self.cache_path), timeout=SQLITE_TIMEOUT_SECONDS, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(CREATE_TABLE_SQL)
+        self.connection.commit()
+
+        url_count = self.connection.execute("SELECT COUNT(*) FROM validators").fetchone()[0]
+        logger.info("the validator cache has `%s` urls", url_count)
+
+        if self.previous_cache_path is not None:
+            # only ever read, it has to exist already so the workers don't all try to create it at once
+            logger.info("looking up urls in the earlier validator cache `%s` too", self.previous_cache_path)
+            self.connection.execute("ATTACH DATABASE ? AS {}".format(PREVIOUS_SCHEMA_NAME), (str(self.previous_cache_path),))
+
+    def close(self):
+
+        if self.connection:
+            self.commit()
+            self.connection.close()
+            self.connection = None
+
+    def get(self, url:str) -> typing.Optional[UrlValidators]:
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT etag, last_modified, payload_digest, warc_date FROM validators WHERE url = ?", (url,)).fetchone()
+
+            if row is None and self.previous_cache_path is not None:
+                row = self.connection.execute("SELECT etag, last_modified, payload_digest, warc_date FROM {}.validators WHERE url = ?".format(
+                    PREVIOUS_SCHEMA_NAME), (url,)).fetchone()
+
+        if row is None:
+            return None
+
+        return UrlValidators(url=url, etag=row[0], last_modified=row[1], payload_digest=row[2], warc_date=row[3])
+
+    def put(self, url_validators:UrlValidators):
+
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO validators (url, etag, last_modified, payload_digest, warc_date) VALUES (?, ?, ?, ?, ?)",
+                (url_validators.url, url_validators.etag, url_validators.last_modified, url_validators.payload_digest, url_validators.warc_date))
+            self.pending_count += 1
+
+    def merge(self, other_cache_path:pathlib.Path) -> int:
+        '''
+        copies every url of another cache into this one, replacing what this one had for them
+
+        @param other_cache_path - the cache to copy from, like the one of a `--workers` worker
+        @return how many urls were copied
+        '''
+
+        with self.lock:
+            self.connection.execute("ATTACH DATABASE ? AS {}".format(MERGE_SCHEMA_NAME), (str(other_cache_path),))
+
+            try:
+                url_count = self.connection.execute("INSERT OR REPLACE INTO validators (url, etag, last_modified, payload_digest, warc_date) "
+                    "SELECT url, etag, last_modified, payload_digest, warc_date FROM {}.validators".format(MERGE_SCHEMA_NAME)).rowcount
+                self.connection.commit()
+
+            finally:
+                self.connection.execute("DETACH DATABASE {}".format(MERGE_SCHEMA_NAME))
+
+        return url_count
+
+    def commit(self):
+
+        with self.lock:
+            self.connection.commit()
+
+            if self.pending_count:
+                logger.debug("committed `%s` updates to the validator cache", self.pending_count)
+
+            self.pending_count = 0
@@ -0,0 +1,320 @@
+import io
+import logging
+import os
+import pathlib
+import queue
+import re
+import threading
+import time
+import typing
+
+from warcio.warcwriter import BaseWARCWriter, WARCWriter
+
+logger = logging.getLogger(__name__)
+
+WARC_VERSION = "1.1"
+# warcio only knows about the identical payload digest profile
+REVISIT_PROFILE_SERVER_NOT_MODIFIED = "http://netpreserve.org/warc/1.1/revisit/server-not-modified"
+WARC_EXTENSION_START = ".warc"
+SEGMENT_CLOSED_MARKER_SUFFIX = ".closed"
+
+# how often the writer thread logs how backed up its queue is
+WRITER_STATS_LOG_INTERVAL_SECONDS = 60
+
+def _split_warc_name(base_path:pathlib.Path) -> typing.Tuple[str, str]:
+    ''' splits `foo.warc.gz` into (`foo`, `.warc.gz`) '''
+
+    name = base_path.name
+    extension_idx = name.find(WARC_EXTENSION_START)
+
+    if extension_idx == -1:
+        return name, ""
+
+    return name[:extension_idx], name[extension_idx:]
+
+def get_warc_segment_path(base_path:pathlib.Path, segment_number:int) -> pathlib.Path:
+    '''
+    gets the path of a numbered WARC segment, segment 0 is the base path itself, and the
+    rest get the number added before the `.warc` part of the name, so
+    `foo.warc.gz` becomes `foo-00001.warc.gz`
+
+    @param base_path - the path given with `--warc-output-file`
+    @param segment_number - the number of the segment
+    @return the path of the segment
+    '''
+
+    if segment_number == 0:
+        return base_path
+
+    stem, extension = _split_warc_name(base_path)
+
+    return base_path.with_name("{}-{:05d}{}".format(stem, segment_number, extension))
+
+def get_next_free_warc_segment_number(base_path:pathlib.Path) -> int:
+    '''
+    finds the segment number after the highest one that exists (or has a closed marker), so we never append
+    to a WARC that a previous run might have left half written, and never reuse the name of a segment that
+    was already synced off the machine and deleted
+
+    @param base_path - the path given with `--warc-output-file`
+    @return the next segment number to use
+    '''
+
+    stem, extension = _split_warc_name(base_path)
+    segment_name_regex = re.compile(r"^{}-([0-9]+){}({})?$".format(
+        re.escape(stem), re.escape(extension), re.escape(SEGMENT_CLOSED_MARKER_SUFFIX)))
+
+    highest_segment_number = None
+
+    if base_path.exists() or get_segment_closed_marker_path(base_path).exists():
+        highest_segment_number = 0
+
+    for iter_path in base_path.parent.iterdir():
+
+        maybe_match = segment_name_regex.match(iter_path.name)
+
+        if maybe_match:
+            iter_segment_number = int(maybe_match.group(1))
+
+            if highest_segment_number is None or iter_segment_number > highest_segment_number:
+                highest_segment_number = iter_segment_number
+
+    if highest_segment_number is None:
+        return 0
+
+    return highest_segment_number + 1
+
+def get_segment_closed_marker_path(segment_path:pathlib.Path) -> pathlib.Path:
+    ''' the empty file we create next to a WARC segment once it is finished and safe to move '''
+    return segment_path.with_name(segment_path.name + SEGMENT_CLOSED_MARKER_SUFFIX)
+
+class RotatingWarcFile:
+    '''
+    a WARC file that gets split into numbered segments once it reaches a maximum size, like
+    wpull's `--warc-max-size`
+
+    records are only ever written in whole batches, and rotation only happens between batches, so
+    a sku's records never get split across two segments. When a segment is closed, a
+    `<segment>.closed` marker file is created next to it, to say it can be synced off the machine
+    and deleted while the scrape keeps going
+    '''
+
+    def __init__(self, base_path:pathlib.Path, segment_number:int, max_size:typing.Optional[int]):
+        '''
+        @param base_path - the path given with `--warc-output-file`
+        @param segment_number - the number of the first segment to write to
+        @param max_size - the size in bytes after which we start a new segment, or None to never rotate
+        '''
+
+        self.base_path = base_path
+        self.segment_number = segment_number
+        self.max_size = max_size
+        self.segment_path = None
+        self.warc_fh = None
+        self.warc_writer = None
+        # every segment this has written to, in order
+        self.segment_path_list = []
+
+    def open(self):
+
+        self.segment_path = get_warc_segment_path(self.base_path, self.segment_number)
+        self.segment_path_list.append(self.segment_path)
+        logger.info("writing WARC records to the segment `%s`", self.segment_path)
+        self.warc_fh = open(self.segment_path, "ab")
+        self.warc_writer = WARCWriter(self.warc_fh, gzip=True, warc_version=WARC_VERSION)
+
+    def write_records(self, record_list:typing.Sequence):
+        '''
+        writes (and gzips) a batch of records that were captured by a `CapturedRecordCollector`
+
+        @param record_list - the list of `ArcWarcRecord` objects to write
+        '''
+
+        for iter_record in record_list:
+            self.warc_writer.write_record(iter_record)
+
+        self.warc_fh.flush()
+
+    def sync(self):
+
+        self.warc_fh.flush()
+        os.fsync(self.warc_fh.fileno())
+
+    def needs_rotation(self) -> bool:
+        return self.max_size is not None and self.warc_fh.tell() >= self.max_size
+
+    def rotate(self):
+        ''' closes the current segment and opens the next free numbered segment '''
+
+        self.close(mark_closed=True)
+
+        self.segment_number = max(self.segment_number + 1, get_next_free_warc_segment_number(self.base_path))
+
+        self.open()
+
+    def close(self, mark_closed:bool):
+        '''
+        @param mark_closed - if True, write the marker file saying this segment is finished, this
+        should be False if we are closing because something went wrong
+        '''
+
+        if not self.warc_fh:
+            return
+
+        self.sync()
+        segment_size = self.warc_fh.tell()
+        self.warc_fh.close()
+        self.warc_fh = None
+        self.warc_writer = None
+
+        if mark_closed:
+            marker_path = get_segment_closed_marker_path(self.segment_path)
+            marker_path.touch()
+            logger.info("closed the WARC segment `%s` at `%s` bytes, wrote the marker `%s`", self.segment_path, segment_size, marker_path)
+        else:
+            logger.info("closed the WARC segment `%s` at `%s` bytes", self.segment_path, segment_size)
+
+class CapturedRecordCollector(BaseWARCWriter):
+    '''
+    used as the `writer` of a warcio `RequestRecorder`, but instead of serializing and gzipping the
+    records on the thread that made the request, it just keeps them in memory so they can be handed to
+    the `WarcWriterStage` and written out by a `RotatingWarcFile` on the writer thread
+    '''
+
+    def __init__(self):
+        super().__init__(gzip=False, warc_version=WARC_VERSION)
+        self.record_list = []
+
+    def _do_write_req_resp(self, req, resp, params):
+
+        # the payloads are temp files that the `RequestRecorder` closes as soon as we return, so copy them
+        for iter_record in (resp, req):
+            iter_record.raw_stream = io.BytesIO(iter_record.raw_stream.read())
+            self.record_list.append(iter_record)
+
+    def get_last_response_record(self):
+        ''' the response record of the last request, if there is one '''
+
+        for iter_record in reversed(self.record_list):
+            if iter_record.rec_type == "response":
+                return iter_record
+
+        return None
+
+    def replace_with_revisit_record(self, response_record, payload_digest:str, refers_to_date:str, not_modified:bool):
+        '''
+        swaps a response record for a revisit record that points back at the response with the full payload from an earlier run
+
+        @param response_record - the record to replace, from `get_last_response_record()`
+        @param payload_digest - the `WARC-Payload-Digest` of the earlier response
+        @param refers_to_date - the `WARC-Date` of the earlier response
+        @param not_modified - True if the server said `304 Not Modified`, False if the payload just happened to be identical
+        '''
+
+        target_uri = response_record.rec_headers.get_header("WARC-Target-URI")
+
+        revisit_record = self.create_revisit_record(target_uri, payload_digest, target_uri, refers_to_date,
+            http_headers=response_record.http_headers)
+
+        if not_modified:
+            revisit_record.rec_headers.replace_header("WARC-Profile", REVISIT_PROFILE_SERVER_NOT_MODIFIED)
+
+        # keep the id and date, so the request record's `WARC-Concurrent-To` still points at it
+        for iter_header_name in ("WARC-Record-ID", "WARC-Date"):
+            revisit_record.rec_headers.replace_header(iter_header_name, response_record.rec_headers.get_header(iter_header_name))
+
+        record_idx = next(i for i, x in enumerate(self.record_list) if x is response_record)
+        self.record_list[record_idx] = revisit_record
+
+class WarcWriterStage:
+    '''
+    a dedicated thread that writes things out, fed through a bounded queue
+
+    this keeps the CPU heavy gzip compression (and the file I/O) off of the threads making requests.
+    If the writer can't keep up, the queue fills up and `put()` blocks, which slows down how fast new
+    requests get started, how long we spend blocked like that gets logged so we can see the backpressure
+    '''
+
+    _SENTINEL = object()
+
+    def __init__(self, write_func:typing.Callable, max_queue_size:int):
+        '''
+        @param write_func - called on the writer thread with every item that gets `put()`
+        @param max_queue_size - how many items can be waiting before `put()` blocks
+        '''
+
+        self.write_func = write_func
+        self.max_queue_size = max_queue_size
+        self.item_queue = queue.Queue(maxsize=max_queue_size)
+        self.thread = None
+        self.error = None
+
+        self.items_written = 0
+        self.max_queue_depth = 0
+        self.seconds_blocked_on_put = 0.0
+        self.seconds_spent_writing = 0.0
+        self.last_stats_log_time = time.monotonic()
+
+    def start(self):
+
+        self.thread = threading.Thread(target=self._run, name="warc_writer", daemon=True)
+        self.thread.start()
+
+    def put(self, item):
+
+        if self.error is not None:
+            raise Exception("the WARC writer thread failed") from self.error
+
+        put_start = time.monotonic()
+        self.item_queue.put(item)
+        self.seconds_blocked_on_put += time.monotonic() - put_start
+
+        self.max_queue_depth = max(self.max_queue_depth, self.item_queue.qsize())
+
+    def finish(self):
+        ''' waits for everything in the queue to be written, and then stops the writer thread '''
+
+        if self.thread is None:
+            return
+
+        self.item_queue.put(self._SENTINEL)
+        self.thread.join()
+        self.thread = None
+
+        self.log_stats()
+
+        if self.error is not None:
+            raise Exception("the WARC writer thread failed") from self.error
+
+    def log_stats(self):
+
+        logger.info("writer queue depth: `%s` / `%s` (max seen: `%s`), items written: `%s`, seconds spent writing: `%.1f`, seconds blocked waiting for the writer: `%.1f`",
+            self.item_queue.qsize(), self.max_queue_size, self.max_queue_depth, self.items_written,
+            self.seconds_spent_writing, self.seconds_blocked_on_put)
+
+    def _run(self):
+
+        while True:
+
+            item = self.item_queue.get()
+
+            if item is self._SENTINEL:
+                return
+
+            # once something goes wrong, just drain the queue so `put()` doesn't block forever
+            if self.error is not None:
+                continue
+
+            try:
+                write_start = time.monotonic()
+                self.write_func(item)
+                self.seconds_spent_writing += time.monotonic() - write_start
+                self.items_written += 1
+
+            except Exception as e:
+                logger.exception("the WARC writer thread failed to write `%s`", item)
+                self.error = e
+
+            if time.monotonic() - self.last_stats_log_time >= WRITER_STATS_LOG_INTERVAL_SECONDS:
+                self.last_stats_log_time = time.monotonic()
+                self.log_stats()
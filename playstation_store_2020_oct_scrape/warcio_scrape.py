@@ -1,246 +1,1183 @@
 import time
 import json
 import logging
+import os
 import random
-
-from warcio.capture_http import capture_http
+import threading
+import typing
+import enum
+import heapq
+import itertools
+import pathlib
+import concurrent.futures
+import zlib
+
+from warcio.capture_http import RecordingHTTPConnection, RequestRecorder
 import requests  # requests must be imported after capture_http
 import attr
 import arrow
 
+from playstation_store_2020_oct_scrape import checkpoint_journal
+from playstation_store_2020_oct_scrape import event_log
+from playstation_store_2020_oct_scrape import file_utils
+from playstation_store_2020_oct_scrape import media_extractor
+from playstation_store_2020_oct_scrape import media_url_sink
+from playstation_store_2020_oct_scrape import rate_control
+from playstation_store_2020_oct_scrape import scrape_metrics
+from playstation_store_2020_oct_scrape import validator_cache
+from playstation_store_2020_oct_scrape import warc_output
+
 logger = logging.getLogger(__name__)
 
+KEY_TYPE = "type"
+KEY_INCLUDED = "included"
+KEY_THUMBNAIL_BASE = "thumbnail-url-base"
+KEY_PARENT = "parent"
+KEY_MEDIA_LIST = "media-list"
+KEY_PROMO = "promo"
+KEY_IMAGES = "images"
+KEY_VIDEOS = "videos"
+KEY_SCREENSHOTS = "screenshots"
+KEY_PREVIEW = "preview"
+KEY_URL = "url"
+KEY_THUMBNAIL = "thumbnail"
+KEY_ID = "id"
+KEY_NAME = "name"
+KEY_ATTRIBUTES = "attributes"
+KEY_DEFAULT_SKU = "default-sku-id"
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:84.0) Gecko/20100101 Firefox/84.0"
+
+# no `Host`, requests sets it from the url, so it is right for `--base-url` too
+HEADERS = {
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip, deflate",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Cache-Control": "no-cache",
+    "Dnt": "1",
+    "User-Agent": USER_AGENT,
+  }
+
+STORE_BASE_URL = "https://store.playstation.com"
+VALKYRIE_API_URL_FORMAT = STORE_BASE_URL + "/valkyrie-api/{}/{}/999/resolve/{}"
+CHIHIRO_API_URL_FORMAT = STORE_BASE_URL + "/store/api/chihiro/00_09_000/container/{}/{}/999/{}"
+
+# HTTP statuses that mean the sku doesn't exist (anymore), so there is no point in retrying
+NOT_FOUND_STATUS_CODE_SET = frozenset([404, 410])
+
+# holds the `requests.Session` and warcio `RequestRecorder` for each fetch thread
+_thread_local_state = threading.local()
+
 @attr.s
 class ApiEntry:
     sku:str = attr.ib()
     valkyrie_url:str = attr.ib()
     chihiro_url:str = attr.ib()
 
+class ApiType(enum.Enum):
+    VALKYRIE = 1
+    CHIHIRO = 2
+
+@attr.s(auto_attribs=True, kw_only=True)
+class ApiUrlResult:
+    '''
+    the result of downloading one of the api urls of a `ApiEntry`, this gets
+    handed back from the fetch thread to the main thread
+    '''
+    url:str = attr.ib()
+    success:bool = attr.ib()
+    media_url_list:typing.Sequence[str] = attr.ib()
+    warc_record_list:typing.Sequence = attr.ib(repr=False)
+    # the api said the sku doesn't exist, or it was never requested because the other api said so
+    not_found:bool = attr.ib(default=False)
+    # how the (last) request went, for the rate control
+    status_code:typing.Optional[int] = attr.ib(default=None)
+    sent_time:typing.Optional[float] = attr.ib(default=None)
+    latency_seconds:typing.Optional[float] = attr.ib(default=None)
+    retry_after_seconds:typing.Optional[float] = attr.ib(default=None)
+    byte_count:int = attr.ib(default=0)
+    # how many requests were made for the url, set once it is finished
+    attempt_count:int = attr.ib(default=1)
+    # the response hadn't changed since the last run, so it was saved as a revisit record
+    unchanged:bool = attr.ib(default=False)
+    # what to save in the validator cache for this url, if anything
+    url_validators:typing.Optional[validator_cache.UrlValidators] = attr.ib(default=None)
+
+@attr.s(auto_attribs=True, kw_only=True)
+class ApiEntryResult:
+    '''
+    the joined results of downloading the api urls for a single `ApiEntry`
+    '''
+    api_entry:ApiEntry = attr.ib()
+    pending_api_type_set:typing.Set[ApiType] = attr.ib()
+    url_result_dict:typing.Dict[ApiType, ApiUrlResult] = attr.ib(factory=dict)
+    # api types that only get requested once the valkyrie request shows the sku isn't dead
+    deferred_api_type_list:typing.List[ApiType] = attr.ib(factory=list)
+    # set when valkyrie says the sku doesn't exist
+    dead:bool = attr.ib(default=False)
+    # in the final retry sweep, the result whose failed urls this one is trying again
+    previous_entry_result:typing.Optional["ApiEntryResult"] = attr.ib(default=None, repr=False)
+
+    def set_url_result(self, api_type:ApiType, url_result:ApiUrlResult):
+        self.url_result_dict[api_type] = url_result
+        self.pending_api_type_set.discard(api_type)
+
+    def is_complete(self) -> bool:
+        return not self.pending_api_type_set
+
+    def is_successful(self, api_type:ApiType) -> bool:
+        ''' if the url of the api was downloaded, here or in the result this one is retrying '''
+
+        if api_type in self.url_result_dict and self.url_result_dict[api_type].success:
+            return True
+
+        return self.previous_entry_result is not None and self.previous_entry_result.is_successful(api_type)
+
+    def get_warc_record_list(self) -> typing.List:
+        ''' the valkyrie records always come first, so a sku's records are next to each other in the WARC
+        in the same order no matter which request finished first '''
+        return [y for x in ApiType if x in self.url_result_dict for y in self.url_result_dict[x].warc_record_list]
+
+    def get_media_url_list(self) -> typing.List[str]:
+        return [y for x in ApiType if x in self.url_result_dict for y in self.url_result_dict[x].media_url_list]
+
+@attr.s(auto_attribs=True, kw_only=True)
+class ApiUrlTask:
+    '''
+    one of the api urls of a `ApiEntry` that is being downloaded, it keeps track of how many
+    attempts have been made, and the WARC records of every attempt so far
+    '''
+    entry_result:ApiEntryResult = attr.ib()
+    api_type:ApiType = attr.ib()
+    url:str = attr.ib()
+    attempt:int = attr.ib(default=0)
+    warc_record_list:typing.List = attr.ib(factory=list, repr=False)
+
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class RetryPolicy:
+    max_retries:int = attr.ib()
+    base_delay_seconds:float = attr.ib()
+    max_delay_seconds:float = attr.ib()
+    final_retry_sweep:bool = attr.ib()
+
+    def get_delay_seconds(self, attempt:int) -> float:
+        '''
+        exponential backoff with jitter, the jitter keeps the retries of a bunch of skus that failed
+        at the same time (like when the store hiccups) from all hitting the store at the same time again
+
+        @param attempt - the attempt that just failed, starting from 0
+        @return how many seconds to wait before trying again
+        '''
+
+        delay = min(self.max_delay_seconds, self.base_delay_seconds * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+
+def _get_thread_session_and_recorder():
+    '''
+    gets the `requests.Session` and warcio `RequestRecorder` for the current thread, creating them
+    if this is the first time this thread has asked for them
+
+    warcio's `capture_http` only records requests made from the thread that entered it, and a
+    `RequestRecorder` can only record one request at a time, so every fetch thread needs its own recorder,
+    and its own session so that pooled connections (which hold onto the recorder they were created with)
+    never get shared between threads
+
+    @return a tuple of (`requests.Session`, `RequestRecorder`)
+    '''
+
+    if not hasattr(_thread_local_state, "session"):
+
+        # the writer gets swapped out for every attempt, see `download_api_url()`
+        recorder = RequestRecorder(None)
+        RecordingHTTPConnection.local.recorder = recorder
+
+        session = requests.Session()
+        session.headers.update(HEADERS)
+
+        _thread_local_state.recorder = recorder
+        _thread_local_state.session = session
+
+    return _thread_local_state.session, _thread_local_state.recorder
+
+
+# warcio_scrape has only ever saved these, the chihiro images are higher resolution then the ones that
+# the valkyrie api returns
+WARCIO_MEDIA_URL_KIND_SET = frozenset([
+    media_extractor.MediaUrlKind.THUMBNAIL,
+    media_extractor.MediaUrlKind.PARENT_THUMBNAIL,
+    media_extractor.MediaUrlKind.PREVIEW,
+    media_extractor.MediaUrlKind.PROMO_IMAGE,
+    media_extractor.MediaUrlKind.PROMO_VIDEO,
+    media_extractor.MediaUrlKind.SCREENSHOT,
+    media_extractor.MediaUrlKind.IMAGE,
+])
+
+MEDIA_URL_FUNC_DICT = {
+    ApiType.VALKYRIE: media_extractor.get_valkyrie_media_urls,
+    ApiType.CHIHIRO: media_extractor.get_chihiro_media_urls,
+}
+
+
+def _get_new_url_validators(url:str, response, record_collector:warc_output.CapturedRecordCollector,
+    url_validators:typing.Optional[validator_cache.UrlValidators]) -> typing.Tuple[typing.Optional[validator_cache.UrlValidators], bool]:
+    '''
+    for a full response, works out what to save in the validator cache, and if the payload is the same as the
+    last run, replaces the response record with a revisit record
+
+    @return a tuple of (the UrlValidators to save, True if the payload was unchanged)
+    '''
+
+    response_record = record_collector.get_last_response_record()
+
+    if response_record is None:
+        return None, False
+
+    payload_digest = response_record.rec_headers.get_header("WARC-Payload-Digest")
+
+    if url_validators is not None and payload_digest == url_validators.payload_digest:
+
+        logger.info("-- url `%s` has the same payload as `%s`, saving it as a revisit record", url, url_validators.warc_date)
+        record_collector.replace_with_revisit_record(response_record, url_validators.payload_digest, url_validators.warc_date, not_modified=False)
+
+        return attr.evolve(url_validators, etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified")), True
+
+    return validator_cache.UrlValidators(
+        url=url,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+        payload_digest=payload_digest,
+        warc_date=response_record.rec_headers.get_header("WARC-Date")), False
+
+def download_api_url(url:str, api_type:ApiType, url_validators:typing.Optional[validator_cache.UrlValidators]=None) -> ApiUrlResult:
+    '''
+    makes a single attempt at downloading one of the api urls for a `ApiEntry` and gets the
+    media urls out of it, this is run on one of the fetch threads
+
+    the WARC records for this attempt are just collected rather then written to the WARC file, they
+    get handed to the writer thread, so the records of different threads don't get mixed together and
+    the gzip compression doesn't happen on the fetch threads
+
+    @param url - the valkyrie or chihiro url to download
+    @param api_type - the ApiType of the url
+    @param url_validators - the UrlValidators from the last run, if there was one, to make a conditional request with
+    @return a ApiUrlResult
+    '''
+
+    session, recorder = _get_thread_session_and_recorder()
+
+    record_collector = warc_output.CapturedRecordCollector()
+    recorder.writer = record_collector
+
+    response_json = None
+    status_code = None
+    byte_count = 0
+    retry_after_seconds = None
+    new_url_validators = None
+    unchanged = False
+    sent_time = time.monotonic()
+
+    try:
+
+        request_header_dict = None
+        if url_validators is not None:
+            request_header_dict = url_validators.get_conditional_headers()
+
+        response = session.get(url, headers=request_header_dict)
+        logger.info("-- url `%s` - HTTP `%s`", url, response.status_code)
+
+        status_code = response.status_code
+        byte_count = len(response.content)
+        retry_after_seconds = rate_control.get_retry_after_seconds(response)
+
+        if response.status_code in NOT_FOUND_STATUS_CODE_SET:
+            logger.info("-- url `%s` says the sku doesn't exist", url)
+
+            return ApiUrlResult(
+                url=url,
+                success=False,
+                media_url_list=[],
+                warc_record_list=record_collector.record_list,
+                not_found=True,
+                status_code=status_code,
+                byte_count=byte_count,
+                sent_time=sent_time,
+                latency_seconds=time.monotonic() - sent_time)
+
+        if response.status_code == 304 and url_validators is not None:
+            logger.info("-- url `%s` hasn't changed since `%s`, saving it as a revisit record", url, url_validators.warc_date)
+
+            response_record = record_collector.get_last_response_record()
+            record_collector.replace_with_revisit_record(response_record, url_validators.payload_digest, url_validators.warc_date, not_modified=True)
+
+            # the media urls were already found by the run that got the full response
+            return ApiUrlResult(
+                url=url,
+                success=True,
+                media_url_list=[],
+                warc_record_list=record_collector.record_list,
+                status_code=status_code,
+                byte_count=byte_count,
+                sent_time=sent_time,
+                latency_seconds=time.monotonic() - sent_time,
+                unchanged=True)
+
+        response.raise_for_status()
+        response_json = response.json()
+
+        new_url_validators, unchanged = _get_new_url_validators(url, response, record_collector, url_validators)
+
+    except Exception as e:
+        logger.error("-- error when getting url `%s`: `%s`", url, e)
+
+    media_url_list = []
+
+    if response_json is not None:
+        media_url_list = media_extractor.get_media_url_list(MEDIA_URL_FUNC_DICT[api_type](response_json), WARCIO_MEDIA_URL_KIND_SET)
+        logger.debug("-- found `%s` media urls in `%s`", len(media_url_list), url)
+
+    return ApiUrlResult(
+        url=url,
+        success=response_json is not None,
+        media_url_list=media_url_list,
+        warc_record_list=record_collector.record_list,
+        status_code=status_code,
+        byte_count=byte_count,
+        sent_time=sent_time,
+        latency_seconds=time.monotonic() - sent_time,
+        retry_after_seconds=retry_after_seconds,
+        unchanged=unchanged,
+        url_validators=new_url_validators)
+
+
+class FetchScheduler:
+    '''
+    keeps `concurrency` skus worth of requests in flight on a thread pool
+
+    failed requests don't sleep on the fetch thread, they get put in a retry queue with exponential
+    backoff, and are submitted again when their delay is up, alongside the fresh skus. Requests that run
+    out of retries can be tried one more time in a final retry sweep once every other sku is done
+
+    a "not found" response is never retried, and if it comes from valkyrie the sku is marked as dead and
+    its chihiro request isn't retried either (or with `valkyrie_first`, never made at all)
+
+    if given a `rate_control.AimdController`, it decides how many skus are in flight instead of `concurrency`,
+    and no new requests are sent while it says to wait
+    '''
+
+    def __init__(self, concurrency:int, retry_policy:RetryPolicy, on_entry_complete_func:typing.Callable,
+        valkyrie_first:bool=False, rate_controller:typing.Optional[rate_control.AimdController]=None,
+        url_validator_cache:typing.Optional[validator_cache.ValidatorCache]=None,
+        metrics:typing.Optional[scrape_metrics.ScrapeMetrics]=None):
+        '''
+        @param concurrency - how many skus to have in flight at once
+        @param retry_policy - the RetryPolicy for failed requests
+        @param on_entry_complete_func - called with the ApiEntryResult on the main thread when all of
+        the requests for a ApiEntry are finished
+        @param valkyrie_first - if True, only request chihiro once valkyrie has shown the sku isn't dead,
+        rather then making both requests at the same time
+        @param rate_controller - the AimdController to adjust the concurrency with, or None to always use `concurrency`
+        @param url_validator_cache - the ValidatorCache to make conditional requests with, if any
+        @param metrics - the ScrapeMetrics to count every response and retry in, if any
+        '''
+
+        self.concurrency = concurrency
+        self.retry_policy = retry_policy
+        self.on_entry_complete_func = on_entry_complete_func
+        self.valkyrie_first = valkyrie_first
+        self.rate_controller = rate_controller
+        self.url_validator_cache = url_validator_cache
+        self.metrics = metrics
+
+        # every request of a sku can be in flight at once
+        self.max_in_flight = concurrency * len(ApiType)
+        self.thread_count = self.max_in_flight
+
+        if rate_controller is not None:
+            self.thread_count = rate_controller.max_limit * len(ApiType)
+
+        self.executor = None
+        # future -> ApiUrlTask
+        self.future_dict = {}
+        # heap of (monotonic time the retry is due, tie breaker, ApiUrlTask)
+        self.retry_heap = []
+        self.retry_counter = itertools.count()
+        # (ApiEntryResult, ApiType) tuples for the final retry sweep
+        self.exhausted_list = []
+        self.in_final_sweep = False
+
+    def run(self, api_entry_iter:typing.Iterator[typing.Tuple[int, ApiEntry, typing.Sequence[ApiType]]], api_entry_count:int):
+        '''
+        downloads every ApiEntry, returning once they have all finished (including any retries)
+
+        @param api_entry_iter - iterator of (index, ApiEntry, list of the ApiTypes to download) tuples
+        @param api_entry_count - how many ApiEntry objects there are (or None if we don't know), just used for logging
+        '''
+
+        api_entry_count_str = "?" if api_entry_count is None else api_entry_count
+
+        pending_iter = (("`{} / {}`: url: `{}`".format(idx+1, api_entry_count_str, api_entry), api_entry, api_type_list, None)
+            for idx, api_entry, api_type_list in api_entry_iter)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.thread_count, thread_name_prefix="fetch") as executor:
+
+            self.executor = executor
+            out_of_entries = False
+
+            while True:
+
+                now = time.monotonic()
+
+                pause_seconds = 0
+                if self.rate_controller is not None:
+                    self.max_in_flight = self.rate_controller.get_limit() * len(ApiType)
+                    pause_seconds = self.rate_controller.get_wait_seconds()
+
+                # retries that are due go first, so they don't have to wait behind the fresh skus
+                while not pause_seconds and self.retry_heap and self.retry_heap[0][0] <= now and len(self.future_dict) < self.max_in_flight:
+                    _, _, iter_task = heapq.heappop(self.retry_heap)
+
+                    # valkyrie might have said the sku is dead while this was waiting
+                    if iter_task.entry_result.dead:
+                        logger.info("-- not retrying url `%s`, the sku doesn't exist", iter_task.url)
+                        self._finish_task(iter_task, get_not_found_result(iter_task.url), iter_task.attempt)
+                        continue
+
+                    self._submit_task(iter_task)
+
+                # only submit more skus as others complete so we don't create a future for every single sku up front
+                while not pause_seconds and not out_of_entries and len(self.future_dict) + len(ApiType) <= self.max_in_flight:
+
+                    next_item = next(pending_iter, None)
+
+                    if next_item is None:
+                        out_of_entries = True
+                        break
+
+                    log_str, iter_api_entry, iter_api_type_list, iter_previous_entry_result = next_item
+                    logger.info("%s", log_str)
+                    self._submit_api_entry(iter_api_entry, iter_api_type_list, iter_previous_entry_result)
+
+                if not self.future_dict:
+
+                    if pause_seconds:
+                        # the store told us to back off
+                        time.sleep(pause_seconds)
+                        continue
+
+                    if self.retry_heap:
+                        # nothing in flight, just wait for the next retry to be due
+                        time.sleep(max(0, self.retry_heap[0][0] - now))
+                        continue
+
+                    if out_of_entries and self.exhausted_list and not self.in_final_sweep:
+                        pending_iter = self._get_final_sweep_iter()
+                        out_of_entries = False
+                        continue
+
+                    if out_of_entries:
+                        break
+
+                    continue
+
+                # don't wait past when the next retry is due, unless there is no room to submit it anyway
+                timeout = None
+                if pause_seconds:
+                    timeout = pause_seconds
+                elif self.retry_heap and len(self.future_dict) < self.max_in_flight:
+                    timeout = max(0, self.retry_heap[0][0] - now)
+
+                done_futures, _ = concurrent.futures.wait(self.future_dict.keys(),
+                    timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for iter_future in done_futures:
+                    self._handle_done_future(iter_future)
+
+        self.executor = None
+
+    def _get_final_sweep_iter(self):
+        ''' turns the requests that ran out of retries into a iterator like the one `run()` uses '''
+
+        self.in_final_sweep = True
+
+        # group them back together so a sku's records still end up next to each other
+        sweep_dict = {}
+        for iter_entry_result, iter_api_type in self.exhausted_list:
+
+            iter_api_entry = iter_entry_result.api_entry
+
+            # valkyrie might have said the sku is dead after this ran out of retries
+            if iter_entry_result.dead:
+                logger.info("-- not retrying url `%s` in the final retry sweep, the sku doesn't exist", get_api_url(iter_api_entry, iter_api_type))
+                continue
+
+            sweep_dict.setdefault(iter_api_entry.sku, (iter_entry_result, []))[1].append(iter_api_type)
+
+        self.exhausted_list = []
+
+        logger.info("starting the final retry sweep for `%s` skus", len(sweep_dict))
+
+        # the earlier result goes along, so what already worked for the sku still counts
+        return (("final retry sweep `{} / {}`: url: `{}`".format(idx+1, len(sweep_dict), entry_result.api_entry), entry_result.api_entry,
+            api_type_list, entry_result) for idx, (entry_result, api_type_list) in enumerate(sweep_dict.values()))
+
+    def _submit_api_entry(self, api_entry:ApiEntry, api_type_list:typing.Sequence[ApiType],
+            previous_entry_result:typing.Optional[ApiEntryResult]=None):
+
+        entry_result = ApiEntryResult(api_entry=api_entry, pending_api_type_set=set(api_type_list),
+            previous_entry_result=previous_entry_result)
+
+        api_type_to_submit_list = api_type_list
+
+        if self.valkyrie_first and ApiType.VALKYRIE in api_type_list:
+            api_type_to_submit_list = [ApiType.VALKYRIE]
+            entry_result.deferred_api_type_list = [x for x in api_type_list if x != ApiType.VALKYRIE]
+
+        self._submit_api_types(entry_result, api_type_to_submit_list)
+
+    def _submit_api_types(self, entry_result:ApiEntryResult, api_type_list:typing.Sequence[ApiType]):
+
+        api_entry = entry_result.api_entry
+
+        for iter_api_type in api_type_list:
+
+            url = get_api_url(api_entry, iter_api_type)
+            self._submit_task(ApiUrlTask(entry_result=entry_result, api_type=iter_api_type, url=url))
+
+    def _submit_task(self, task:ApiUrlTask):
+
+        url_validators = None
+        if self.url_validator_cache is not None:
+            url_validators = self.url_validator_cache.get(task.url)
+
+        future = self.executor.submit(download_api_url, task.url, task.api_type, url_validators)
+        self.future_dict[future] = task
+
+    def _handle_done_future(self, future:concurrent.futures.Future):
+
+        task = self.future_dict.pop(future)
+        attempt_result = future.result()
+        task.warc_record_list.extend(attempt_result.warc_record_list)
+
+        if self.rate_controller is not None:
+            self.rate_controller.on_response(attempt_result.status_code, attempt_result.latency_seconds,
+                attempt_result.retry_after_seconds, attempt_result.sent_time)
+
+        if self.metrics is not None:
+            self.metrics.on_response(get_api_name(task.api_type), attempt_result.status_code,
+                attempt_result.latency_seconds, attempt_result.byte_count)
+
+        if attempt_result.not_found:
+
+            if task.api_type == ApiType.VALKYRIE:
+                task.entry_result.dead = True
+
+        elif not attempt_result.success and task.entry_result.dead:
+            logger.info("-- not retrying url `%s`, the sku doesn't exist", task.url)
+            self._finish_task(task, get_not_found_result(task.url), task.attempt + 1)
+            return
+
+        elif not attempt_result.success:
+
+            if task.attempt + 1 < self.retry_policy.max_retries:
+
+                delay = self.retry_policy.get_delay_seconds(task.attempt)
+
+                if attempt_result.retry_after_seconds is not None:
+                    delay = max(delay, attempt_result.retry_after_seconds)
+                logger.info("-- attempt `%s` of `%s` failed for url `%s`, retrying in `%.2f` seconds",
+                    task.attempt + 1, self.retry_policy.max_retries, task.url, delay)
+
+                if self.metrics is not None:
+                    self.metrics.on_retry()
+
+                task.attempt += 1
+                heapq.heappush(self.retry_heap, (time.monotonic() + delay, next(self.retry_counter), task))
+                return
+
+            if self.retry_policy.final_retry_sweep and not self.in_final_sweep:
+                logger.warning("-- ran out of retries for url `%s`, deferring it to the final retry sweep", task.url)
+                self.exhausted_list.append((task.entry_result, task.api_type))
+
+            else:
+                logger.error("-- hit `%s` retries when attempting to get URL `%s`, skipping", self.retry_policy.max_retries, task.url)
+
+        self._finish_task(task, attempt_result, task.attempt + 1)
+
+    def _finish_task(self, task:ApiUrlTask, last_attempt_result:ApiUrlResult, attempt_count:int):
+
+        # the WARC records of every attempt are kept, not just the last one
+        url_result = attr.evolve(last_attempt_result, url=task.url, warc_record_list=task.warc_record_list, attempt_count=attempt_count)
+
+        entry_result = task.entry_result
+        entry_result.set_url_result(task.api_type, url_result)
+
+        if task.api_type == ApiType.VALKYRIE and entry_result.deferred_api_type_list:
+
+            deferred_api_type_list = entry_result.deferred_api_type_list
+            entry_result.deferred_api_type_list = []
+
+            if entry_result.dead:
+                # no point asking chihiro about a sku that valkyrie says doesn't exist
+                for iter_api_type in deferred_api_type_list:
+                    url = get_api_url(entry_result.api_entry, iter_api_type)
+                    logger.info("-- skipping url `%s`, the sku doesn't exist", url)
+                    entry_result.set_url_result(iter_api_type, get_not_found_result(url))
+            else:
+                self._submit_api_types(entry_result, deferred_api_type_list)
+
+        # wait for the other request for this sku to finish
+        if entry_result.is_complete():
+            self.on_entry_complete_func(entry_result)
+
+
+def get_api_name(api_type:ApiType) -> str:
+    ''' the name we use for a ApiType in the checkpoint journal '''
+    return api_type.name.lower()
+
+def get_api_url_formats(base_url:typing.Optional[str]) -> typing.Tuple[str, str]:
+    '''
+    @param base_url - what to use instead of `https://store.playstation.com` (like the mock store), or None for the real store
+    @return a tuple of the (valkyrie, chihiro) url formats
+    '''
+
+    if base_url is None:
+        return VALKYRIE_API_URL_FORMAT, CHIHIRO_API_URL_FORMAT
+
+    base_url = base_url.rstrip("/")
+
+    return VALKYRIE_API_URL_FORMAT.replace(STORE_BASE_URL, base_url, 1), CHIHIRO_API_URL_FORMAT.replace(STORE_BASE_URL, base_url, 1)
+
+def get_not_found_result(url:str) -> ApiUrlResult:
+    ''' the result for a url that wasn't requested (again) because the sku doesn't exist '''
+    return ApiUrlResult(url=url, success=False, media_url_list=[], warc_record_list=[], not_found=True, attempt_count=0)
+
+def get_api_url(api_entry:ApiEntry, api_type:ApiType) -> str:
+    return api_entry.valkyrie_url if api_type == ApiType.VALKYRIE else api_entry.chihiro_url
+
+def get_journal_status(url_result:ApiUrlResult) -> str:
+
+    if url_result.success:
+        return checkpoint_journal.JOURNAL_STATUS_DONE
+    elif url_result.not_found:
+        return checkpoint_journal.JOURNAL_STATUS_NOT_FOUND
+    else:
+        return checkpoint_journal.JOURNAL_STATUS_FAILED
+
+
+@attr.s(auto_attribs=True, kw_only=True, frozen=True)
+class WarcioOutputPaths:
+    '''
+    where a `warcio_scrape` run (or one worker of a `--workers` run) writes its output
+    '''
+    warc_output_file:pathlib.Path = attr.ib()
+    media_files_output_file:pathlib.Path = attr.ib()
+    journal_file:pathlib.Path = attr.ib()
+    # where newly found dead skus are written, the dead skus to skip are always read from `--dead-skus-file`
+    dead_skus_output_file:typing.Optional[pathlib.Path] = attr.ib()
+    metrics_json_file:typing.Optional[pathlib.Path] = attr.ib(default=None)
+    metrics_prometheus_file:typing.Optional[pathlib.Path] = attr.ib(default=None)
+    event_log_file:typing.Optional[pathlib.Path] = attr.ib(default=None)
+    # where the validators of the urls saved by this run are written
+    validator_cache_file:typing.Optional[pathlib.Path] = attr.ib(default=None)
+    # a cache from earlier runs that is only read, for the workers of a `--workers` run
+    previous_validator_cache_file:typing.Optional[pathlib.Path] = attr.ib(default=None)
+
+    @staticmethod
+    def from_parsed_args(parsed_args) -> "WarcioOutputPaths":
+
+        journal_path = parsed_args.journal_file
+        if journal_path is None:
+            journal_path = parsed_args.warc_output_file.with_name(parsed_args.warc_output_file.name + ".journal")
+
+        return WarcioOutputPaths(
+            warc_output_file=parsed_args.warc_output_file,
+            media_files_output_file=parsed_args.media_files_output_file,
+            journal_file=journal_path,
+            dead_skus_output_file=parsed_args.dead_skus_file,
+            metrics_json_file=parsed_args.metrics_json_file,
+            metrics_prometheus_file=parsed_args.metrics_prometheus_file,
+            event_log_file=parsed_args.event_log_file,
+            validator_cache_file=parsed_args.validator_cache)
+
+    def get_worker_paths(self, worker_index:int) -> "WarcioOutputPaths":
+        '''
+        every worker gets its own copy of every output file, `foo.warc.gz` becomes `foo.worker01.warc.gz`, and the
+        validator cache that was given is what the workers look urls up in
+        '''
+
+        worker_str = "worker{:02d}".format(worker_index)
+
+        def _get_optional_worker_path(path:typing.Optional[pathlib.Path]) -> typing.Optional[pathlib.Path]:
+            return None if path is None else file_utils.add_name_suffix(path, worker_str)
+
+        return WarcioOutputPaths(
+            warc_output_file=file_utils.add_name_suffix(self.warc_output_file, worker_str),
+            media_files_output_file=file_utils.add_name_suffix(self.media_files_output_file, worker_str),
+            journal_file=file_utils.add_name_suffix(self.journal_file, worker_str),
+            dead_skus_output_file=_get_optional_worker_path(self.dead_skus_output_file),
+            metrics_json_file=_get_optional_worker_path(self.metrics_json_file),
+            metrics_prometheus_file=_get_optional_worker_path(self.metrics_prometheus_file),
+            event_log_file=_get_optional_worker_path(self.event_log_file),
+            validator_cache_file=_get_optional_worker_path(self.validator_cache_file),
+            previous_validator_cache_file=self.validator_cache_file)
+
+def get_sku_shard(sku:str, shard_count:int) -> int:
+    '''
+    which worker a sku belongs to, this has to be stable between runs (unlike `hash()`) so that
+    `--resume` gives every worker the same skus it had before
+
+    @param sku - the sku
+    @param shard_count - how many workers there are
+    @return the index of the worker, from 0 to `shard_count` - 1
+    '''
+
+    return zlib.crc32(sku.encode("utf-8")) % shard_count
+
 def do_warcio_scrape(parsed_args):
 
-    TIME_SECONDS_TO_SLEEP_BETWEEN_FAILURES = 5
-
-    KEY_TYPE = "type"
-    KEY_INCLUDED = "included"
-    KEY_THUMBNAIL_BASE = "thumbnail-url-base"
-    KEY_PARENT = "parent"
-    KEY_MEDIA_LIST = "media-list"
-    KEY_PROMO = "promo"
-    KEY_IMAGES = "images"
-    KEY_VIDEOS = "videos"
-    KEY_SCREENSHOTS = "screenshots"
-    KEY_PREVIEW = "preview"
-    KEY_URL = "url"
-    KEY_THUMBNAIL = "thumbnail"
-    KEY_ID = "id"
-    KEY_NAME = "name"
-    KEY_ATTRIBUTES = "attributes"
-    KEY_DEFAULT_SKU = "default-sku-id"
-
-    MAX_RETRIES = 5
-
-    USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:84.0) Gecko/20100101 Firefox/84.0"
-
-    HEADERS = {
-        "Accept": "application/json",
-        "Accept-Encoding": "gzip, deflate",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Cache-Control": "no-cache",
-        "Dnt": "1",
-        "Host": "store.playstation.com",
-        "User-Agent": USER_AGENT,
-      }
-
-    VALKYRIE_API_URL_FORMAT = "https://store.playstation.com/valkyrie-api/{}/{}/999/resolve/{}"
-    CHIHIRO_API_URL_FORMAT = "https://store.playstation.com/store/api/chihiro/00_09_000/container/{}/{}/999/{}"
-
-
-    api_entry_list = []
-    discovered_media_url_list = []
-
-    session = requests.Session()
-    session.headers.update(HEADERS)
+    if parsed_args.concurrency < 1:
+        raise Exception("--concurrency must be at least 1, got `{}`".format(parsed_args.concurrency))
+
+    if parsed_args.max_retries < 1:
+        raise Exception("--max-retries must be at least 1, got `{}`".format(parsed_args.max_retries))
+
+    if parsed_args.workers < 1:
+        raise Exception("--workers must be at least 1, got `{}`".format(parsed_args.workers))
+
+    output_paths = WarcioOutputPaths.from_parsed_args(parsed_args)
+
+    if parsed_args.workers == 1:
+        _run_warcio_scrape(parsed_args, output_paths, None)
+    else:
+        _run_sharded_warcio_scrape(parsed_args, output_paths)
+
+def _run_sharded_warcio_scrape(parsed_args, output_paths:WarcioOutputPaths):
+    '''
+    splits the skus between `--workers` processes, each one writing its own WARC segments, media list, journal,
+    dead sku list and validator cache, and once they are all finished, merges the media lists (and dead sku lists and
+    validator caches) into the ones given on the command line and writes a manifest of every WARC segment next to
+    the WARC output file
+    '''
+
+    worker_count = parsed_args.workers
+
+    logger.info("splitting the skus between `%s` worker processes, each downloading `%s` skus at a time",
+        worker_count, parsed_args.concurrency)
+
+    if output_paths.validator_cache_file is not None:
+        # the workers only read it, so it has to be there before they start
+        url_validator_cache = validator_cache.ValidatorCache(output_paths.validator_cache_file)
+        url_validator_cache.open()
+        url_validator_cache.close()
 
     start_time = arrow.utcnow()
 
-    with open(parsed_args.sku_list, "r", encoding="utf-8") as file_list_fh:
-        while True:
-            sku = file_list_fh.readline()
-            if not sku:
-                break
-            else:
-                sku_stripped = sku.strip()
-                valkyrie_url = VALKYRIE_API_URL_FORMAT.format(parsed_args.region_lang, parsed_args.region_country, sku_stripped)
-                chihiro_url = CHIHIRO_API_URL_FORMAT.format(parsed_args.region_country, parsed_args.region_lang, sku_stripped)
-                api_entry_list.append(ApiEntry(sku=sku_stripped, valkyrie_url=valkyrie_url, chihiro_url=chihiro_url))
+    worker_summary_list = []
+    worker_error_list = []
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=worker_count) as executor:
+
+        future_dict = {executor.submit(_run_warcio_scrape, parsed_args, output_paths.get_worker_paths(x), x): x
+            for x in range(worker_count)}
+
+        for iter_future in concurrent.futures.as_completed(future_dict):
+
+            worker_index = future_dict[iter_future]
+
+            try:
+                worker_summary_list.append(iter_future.result())
+                logger.info("worker `%s` finished", worker_index)
 
-    api_entry_list_size = len(api_entry_list)
-    logger.info("have `%s` urls to download", api_entry_list_size)
-    logger.info("writing media urls to `%s`", parsed_args.media_files_output_file)
+            except Exception as e:
+                logger.error("worker `%s` failed: `%s`", worker_index, e)
+                worker_error_list.append(e)
 
+    worker_summary_list.sort(key=lambda x: x["worker"])
 
-    # the capture_http method probably doesn't take a path objet
-    with capture_http(str(parsed_args.warc_output_file), warc_version='1.1'):
+    # merge whatever the workers managed to write, even if some of them failed
+    media_sink = media_url_sink.MediaUrlSink(output_paths.media_files_output_file, _get_media_bloom_filter(parsed_args))
+    media_sink.open()
 
-        for idx, iter_api_entry in enumerate(api_entry_list):
+    try:
+        for iter_worker_index in range(worker_count):
 
-            # prevent DDOS hopefully...
-            # time_to_sleep = random.random()
-            # logger.info("[sleeping for `%s`]", time_to_sleep)
-            # time.sleep(time_to_sleep)
+            iter_media_path = output_paths.get_worker_paths(iter_worker_index).media_files_output_file
 
-            iter_discovered_media_list = []
+            if iter_media_path.exists():
+                logger.info("merging the media urls from `%s` into `%s`", iter_media_path, output_paths.media_files_output_file)
+                media_sink.add(file_utils.iter_content_ids(iter_media_path))
 
-            logger.info("`%s / %s`: url: `%s`", idx+1, api_entry_list_size, iter_api_entry)
+    finally:
+        media_sink.close()
 
+    media_sink.log_stats()
 
-            logger.debug("-- making valkyrie api request")
-            # get normal valkyrie response
-            success = False
-            response = None
-            response_json = None
-            for i in range(MAX_RETRIES):
+    if output_paths.dead_skus_output_file is not None:
 
-                try:
+        dead_sku_set = set()
+        if output_paths.dead_skus_output_file.exists():
+            dead_sku_set = file_utils.load_content_id_set(output_paths.dead_skus_output_file)
 
-                    response = session.get(iter_api_entry.valkyrie_url)
-                    logger.info("-- url `%s` - HTTP `%s`", iter_api_entry.valkyrie_url, response.status_code)
+        new_dead_sku_count = 0
 
-                    response.raise_for_status()
-                    success = True
-                    response_json = response.json()
-                    break
+        with open(output_paths.dead_skus_output_file, "a", encoding="utf-8", newline="\n") as f:
 
-                except Exception as e:
-                    logger.error("-- error number `%s` when getting url `%s`: `%s`", i, iter_api_entry.valkyrie_url, e)
-                    time.sleep(TIME_SECONDS_TO_SLEEP_BETWEEN_FAILURES)
+            for iter_worker_index in range(worker_count):
+
+                iter_dead_path = output_paths.get_worker_paths(iter_worker_index).dead_skus_output_file
+
+                if not iter_dead_path.exists():
                     continue
 
-            if not success:
-                logger.error("-- hit `%s` retries when attempting to get URL `%s`, skipping", MAX_RETRIES, iter_api_entry.valkyrie_url)
+                for iter_sku in file_utils.iter_content_ids(iter_dead_path):
+                    if iter_sku not in dead_sku_set:
+                        dead_sku_set.add(iter_sku)
+                        f.write("{}\n".format(iter_sku))
+                        new_dead_sku_count += 1
 
-            else:
+        logger.info("merged `%s` new dead skus into `%s`", new_dead_sku_count, output_paths.dead_skus_output_file)
+
+    if output_paths.validator_cache_file is not None:
 
-                # go through the json and get media urls
+        url_validator_cache = validator_cache.ValidatorCache(output_paths.validator_cache_file)
+        url_validator_cache.open()
 
-                included_json_list = response_json[KEY_INCLUDED]
+        try:
+            for iter_worker_index in range(worker_count):
 
-                for iter_included_json_dict in included_json_list:
+                iter_cache_path = output_paths.get_worker_paths(iter_worker_index).validator_cache_file
 
-                    iter_attribute_json_dict = iter_included_json_dict[KEY_ATTRIBUTES]
+                if not iter_cache_path.exists():
+                    continue
+
+                url_count = url_validator_cache.merge(iter_cache_path)
+                logger.info("merged `%s` urls from `%s` into the validator cache `%s`", url_count, iter_cache_path, output_paths.validator_cache_file)
 
-                    # get the thumbnail, but check to make sure its there, not
-                    # all of the attribute dicts have it for some reason, like if there
-                    # is a bundle, one will have it, the other won't
-                    if KEY_THUMBNAIL_BASE in iter_attribute_json_dict.keys():
-                        thumbnail = iter_attribute_json_dict[KEY_THUMBNAIL_BASE]
-                        logger.debug("-- found media url (thumbnail): `%s`", thumbnail)
-                        iter_discovered_media_list.append(thumbnail)
+                # it is all in the real cache now, and a old copy shouldn't get merged over a newer one next time
+                iter_cache_path.unlink()
 
-                    # see if there are other media urls
+        finally:
+            url_validator_cache.close()
 
-                    ## look in parent dict
+    end_time = arrow.utcnow()
 
-                    if KEY_PARENT in iter_attribute_json_dict.keys() and iter_attribute_json_dict[KEY_PARENT] is not None:
-                        parent_json_dict = iter_attribute_json_dict[KEY_PARENT]
+    manifest_path = output_paths.warc_output_file.with_name(output_paths.warc_output_file.name + ".manifest.json")
 
-                        parent_id = parent_json_dict[KEY_ID]
-                        # output parent id just in case
+    manifest_dict = {
+        "sku_list": str(parsed_args.sku_list),
+        "region_lang": parsed_args.region_lang,
+        "region_country": parsed_args.region_country,
+        "start_time": start_time.isoformat(),
+        "end_time": end_time.isoformat(),
+        "worker_count": worker_count,
+        "failed_worker_count": len(worker_error_list),
+        "media_files_output_file": str(output_paths.media_files_output_file),
+        "media_urls_written": media_sink.urls_written,
+        "dead_skus_file": None if output_paths.dead_skus_output_file is None else str(output_paths.dead_skus_output_file),
+        "warc_segments": [{"worker": x["worker"], "path": str(y), "size": y.stat().st_size if y.exists() else None}
+            for x in worker_summary_list for y in x["warc_segment_path_list"]],
+        "workers": [{k: str(v) if isinstance(v, pathlib.Path) else v for k, v in x.items() if k != "warc_segment_path_list"}
+            for x in worker_summary_list],
+    }
 
-                        thumbnail = parent_json_dict[KEY_THUMBNAIL]
+    logger.info("writing the manifest of `%s` WARC segments to `%s`", len(manifest_dict["warc_segments"]), manifest_path)
 
-                        logger.debug("-- found media url (parent - thumbnail): `%s`", thumbnail)
-                        iter_discovered_media_list.append(thumbnail)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest_dict, f, indent=4)
 
-                    # media list stuff
+    logger.info("start time: `%s`, end time: `%s`, elapsed time: `%s`", start_time, end_time, end_time - start_time)
 
-                    if KEY_MEDIA_LIST in iter_attribute_json_dict.keys():
+    if worker_error_list:
+        raise Exception("`{}` of the `{}` workers failed".format(len(worker_error_list), worker_count)) from worker_error_list[0]
 
-                        media_list_dict = iter_attribute_json_dict[KEY_MEDIA_LIST]
+def _get_media_bloom_filter(parsed_args) -> typing.Optional[media_url_sink.BloomFilter]:
 
-                        for iter_preview_dict in media_list_dict[KEY_PREVIEW]:
+    if not parsed_args.media_dedup:
+        return None
 
-                            preview_url = iter_preview_dict[KEY_URL]
-                            logger.debug("-- found media url (media list - previews): `%s`", preview_url)
-                            iter_discovered_media_list.append(preview_url)
+    bloom_filter = media_url_sink.BloomFilter(parsed_args.media_dedup_capacity, parsed_args.media_dedup_false_positive_rate)
+    logger.info("deduplicating media urls with a bloom filter of `%s` bytes and `%s` hashes",
+        len(bloom_filter.bit_array), bloom_filter.num_hashes)
 
-                        for iter_promos_images_dict in media_list_dict[KEY_PROMO][KEY_IMAGES]:
+    return bloom_filter
 
-                            image_url = iter_promos_images_dict[KEY_URL]
-                            logger.debug("-- found media url (media list - promos - images): `%s`", image_url)
-                            iter_discovered_media_list.append(image_url)
+def _run_warcio_scrape(parsed_args, output_paths:WarcioOutputPaths, worker_index:typing.Optional[int]) -> dict:
+    '''
+    does the actual scraping, either of every sku or (when `--workers` is used) just the skus of one worker
 
-                        for iter_promos_videos_dict in media_list_dict[KEY_PROMO][KEY_VIDEOS]:
+    @param parsed_args - the arguments from argparse
+    @param output_paths - where to write the output
+    @param worker_index - the index of the worker to download the skus of, or None for every sku
+    @return a dict summarizing what was done, for the manifest
+    '''
 
-                            vid_url = iter_promos_videos_dict[KEY_URL]
-                            logger.debug("-- found media url (media list - promos - videos): `%s`", vid_url)
-                            iter_discovered_media_list.append(vid_url)
+    concurrency = parsed_args.concurrency
 
-                        for iter_screenshot_dict in media_list_dict[KEY_SCREENSHOTS]:
+    retry_policy = RetryPolicy(
+        max_retries=parsed_args.max_retries,
+        base_delay_seconds=parsed_args.retry_base_delay,
+        max_delay_seconds=parsed_args.retry_max_delay,
+        final_retry_sweep=parsed_args.final_retry_sweep)
 
-                            ss_url = iter_screenshot_dict[KEY_URL]
-                            logger.debug("-- found media url (media list - screenshots): `%s`", ss_url)
-                            iter_discovered_media_list.append(ss_url)
+    journal_path = output_paths.journal_file
 
+    # when resuming, skip everything the journal says is done, and write to a new WARC segment
+    # rather then appending to one that might have a half written record at the end
+    done_dict = {}
+    warc_segment_number = 0
 
-            logger.debug("-- making chihiro api request")
-            success_two = False
-            response_two = None
-            response_json_two = None
-            for i in range(MAX_RETRIES):
+    if parsed_args.resume:
 
-                try:
+        if journal_path.exists():
+            done_dict = checkpoint_journal.CheckpointJournal.load_done_dict(journal_path)
+        else:
+            logger.warning("--resume was given but the journal `%s` doesn't exist, starting from the beginning", journal_path)
 
-                    response_two = session.get(iter_api_entry.chihiro_url)
-                    logger.info("-- url `%s` - HTTP `%s`", iter_api_entry.chihiro_url, response_two.status_code)
+        warc_segment_number = warc_output.get_next_free_warc_segment_number(output_paths.warc_output_file)
 
-                    response_two.raise_for_status()
-                    success_two = True
-                    response_json_two = response_two.json()
+    # skus that an earlier run found don't exist, these get skipped entirely
+    dead_sku_set = set()
+    if parsed_args.dead_skus_file is not None and parsed_args.dead_skus_file.exists():
+        dead_sku_set = file_utils.load_content_id_set(parsed_args.dead_skus_file)
+        logger.info("loaded `%s` dead skus from `%s`", len(dead_sku_set), parsed_args.dead_skus_file)
 
-                    break
+    discovered_media_url_count = 0
+    skipped_entry_count = 0
+    skipped_dead_entry_count = 0
+    new_dead_sku_count = 0
+    unchanged_url_count = 0
 
-                except Exception as e:
-                    logger.error("-- error number `%s` when getting url `%s`: `%s`", i, iter_api_entry.chihiro_url, e)
-                    time.sleep(TIME_SECONDS_TO_SLEEP_BETWEEN_FAILURES)
-                    continue
+    start_time = arrow.utcnow()
+
+    # the sku list is streamed rather then read in all at once, counting it first is a extra pass
+    # over the file, but its just for the progress logging so it can be skipped
+    def _iter_skus():
+
+        if worker_index is None:
+            return file_utils.iter_content_ids(parsed_args.sku_list)
+
+        return (x for x in file_utils.iter_content_ids(parsed_args.sku_list) if get_sku_shard(x, parsed_args.workers) == worker_index)
+
+    api_entry_count = None
+    if parsed_args.count_skus:
+        api_entry_count = sum(1 for _ in _iter_skus())
+
+    logger.info("have `%s` urls to download", api_entry_count if api_entry_count is not None else "an unknown number of")
+    logger.info("writing WARC records to `%s`, with a max segment size of `%s` bytes", output_paths.warc_output_file, parsed_args.warc_max_size)
+    logger.info("writing media urls to `%s`", output_paths.media_files_output_file)
+    logger.info("writing the checkpoint journal to `%s`", journal_path)
+    logger.info("downloading `%s` urls at a time", concurrency)
+
+    rate_controller = None
+    if parsed_args.adaptive_concurrency:
+        rate_controller = rate_control.AimdController(
+            initial_limit=concurrency,
+            min_limit=parsed_args.min_concurrency,
+            max_limit=parsed_args.max_concurrency)
+        logger.info("adjusting the concurrency between `%s` and `%s` based on how the store responds",
+            parsed_args.min_concurrency, parsed_args.max_concurrency)
+    logger.info("retry policy: `%s`", retry_policy)
+
+    metrics = scrape_metrics.ScrapeMetrics(sku_total=api_entry_count, worker_index=worker_index)
+
+    # every worker gets its own port, counting up from `--metrics-port`
+    metrics_port = parsed_args.metrics_port
+    if metrics_port and worker_index is not None:
+        metrics_port += worker_index
 
-            if not success_two:
-                logger.error("-- hit `%s` retries when attempting to get URL `%s`, skipping", MAX_RETRIES, iter_api_entry.chihiro_url)
+    metrics_reporter = scrape_metrics.MetricsReporter(metrics,
+        http_port=metrics_port,
+        json_file=output_paths.metrics_json_file,
+        prometheus_file=output_paths.metrics_prometheus_file,
+        interval_seconds=parsed_args.metrics_interval)
+
+    valkyrie_url_format, chihiro_url_format = get_api_url_formats(parsed_args.base_url)
+    if parsed_args.base_url is not None:
+        logger.info("getting the api urls from `%s` instead of the real store", parsed_args.base_url)
+
+    # for the event log, the same sku can be in more then one region
+    region = "{}-{}".format(parsed_args.region_lang, parsed_args.region_country).lower()
+
+    def _get_api_entries_to_download():
+        ''' only builds the ApiEntry (and its urls) for a sku once the scheduler is ready to download it '''
+
+        nonlocal skipped_entry_count, skipped_dead_entry_count
+
+        for idx, iter_sku in enumerate(_iter_skus()):
+
+            if iter_sku in dead_sku_set:
+                logger.debug("skipping `%s`, it is in the dead sku list", iter_sku)
+                skipped_dead_entry_count += 1
+                metrics.on_sku_skipped()
                 continue
 
-            else:
+            done_api_name_set = done_dict.get(iter_sku, set())
+            api_type_list = [x for x in ApiType if get_api_name(x) not in done_api_name_set]
 
-                # get media urls
+            if not api_type_list:
+                logger.debug("skipping `%s`, the journal says it is already done", iter_sku)
+                skipped_entry_count += 1
+                metrics.on_sku_skipped()
+                continue
 
-                # only getting these for now, as they are higher resolution then the ones that the valkyrie api returns
+            valkyrie_url = valkyrie_url_format.format(parsed_args.region_lang, parsed_args.region_country, iter_sku)
+            chihiro_url = chihiro_url_format.format(parsed_args.region_country, parsed_args.region_lang, iter_sku)
 
-                image_dict_list = response_json_two[KEY_IMAGES]
+            yield idx, ApiEntry(sku=iter_sku, valkyrie_url=valkyrie_url, chihiro_url=chihiro_url), api_type_list
 
-                for iter_image_dict in image_dict_list:
+    journal = checkpoint_journal.CheckpointJournal(journal_path)
+    journal.open()
 
-                    image_type = iter_image_dict[KEY_TYPE]
-                    image_url = iter_image_dict[KEY_URL]
-                    logger.debug("-- found media url (chihiro images): `%s` of type `%s`", image_url, image_type)
-                    iter_discovered_media_list.append(image_url)
+    warc_file = warc_output.RotatingWarcFile(output_paths.warc_output_file, warc_segment_number, parsed_args.warc_max_size)
+    warc_file.open()
 
-            num_media_this_run = len(iter_discovered_media_list)
-            logger.debug("-- discovered `%s` media urls for this URL", num_media_this_run)
-            discovered_media_url_list.extend(iter_discovered_media_list)
-            logger.debug("-- discovered media list now has a size of `%s`", len(discovered_media_url_list))
+    media_sink = media_url_sink.MediaUrlSink(output_paths.media_files_output_file, _get_media_bloom_filter(parsed_args))
+    media_sink.open()
 
-            # write out the new media discovered this iteration in case we crash
-            with open(parsed_args.media_files_output_file, "a", encoding="utf-8", newline="\n") as f:
+    url_validator_cache = None
+    if output_paths.validator_cache_file is not None:
+        logger.info("making conditional requests with the validator cache `%s`", output_paths.validator_cache_file)
+        url_validator_cache = validator_cache.ValidatorCache(output_paths.validator_cache_file, output_paths.previous_validator_cache_file)
+        url_validator_cache.open()
 
-                for iter_media_url in iter_discovered_media_list:
-                    f.write("{}\n".format(iter_media_url))
+    event_log_writer = None
+    if output_paths.event_log_file is not None:
+        logger.info("writing a event for every finished url to `%s`", output_paths.event_log_file)
+        event_log_writer = event_log.EventLogWriter(output_paths.event_log_file)
+        event_log_writer.open()
 
-    end_time = arrow.utcnow()
+    dead_sku_fh = None
+    if output_paths.dead_skus_output_file is not None:
+        logger.info("writing skus that don't exist to `%s`", output_paths.dead_skus_output_file)
+        dead_sku_fh = open(output_paths.dead_skus_output_file, "a", encoding="utf-8", newline="\n")
 
-    elapsed_time = end_time - start_time
+    # the fetch threads only collect the WARC records, the files are only ever written to by the writer thread
+    def _sync_output_files():
+        warc_file.sync()
+        media_sink.sync()
 
-    logger.info("start time: `%s`, end time: `%s`, elapsed time: `%s`", start_time, end_time, elapsed_time)
-    logger.info("discovered `%s` media urls", len(discovered_media_url_list))
+        if dead_sku_fh:
+            dead_sku_fh.flush()
+            os.fsync(dead_sku_fh.fileno())
+
+        if event_log_writer:
+            event_log_writer.sync()
+
+        # the validators should never be ahead of the WARC they point to
+        if url_validator_cache:
+            url_validator_cache.commit()
+
+    def _write_entry_result(entry_result:ApiEntryResult):
+        ''' runs on the writer thread '''
+
+        nonlocal discovered_media_url_count, new_dead_sku_count, unchanged_url_count
+
+        warc_file.write_records(entry_result.get_warc_record_list())
+
+        iter_media_url_list = entry_result.get_media_url_list()
+        num_media_this_run = len(iter_media_url_list)
+        logger.debug("-- discovered `%s` media urls for `%s`", num_media_this_run, entry_result.api_entry.sku)
+        discovered_media_url_count += num_media_this_run
+        logger.debug("-- discovered media list now has a size of `%s`", discovered_media_url_count)
+
+        media_sink.add(iter_media_url_list)
+        metrics.on_sku_done(num_media_this_run)
+
+        # valkyrie can say a sku doesn't exist while chihiro still has it, so it is only dead if nothing worked
+        if entry_result.dead and not entry_result.is_successful(ApiType.CHIHIRO):
+            new_dead_sku_count += 1
+
+            if dead_sku_fh:
+                dead_sku_fh.write("{}\n".format(entry_result.api_entry.sku))
+
+        for iter_api_type, iter_url_result in entry_result.url_result_dict.items():
+            journal.add(entry_result.api_entry.sku, get_api_name(iter_api_type), get_journal_status(iter_url_result))
+
+            if event_log_writer:
+                event_log_writer.add(entry_result.api_entry.sku, region, get_api_name(iter_api_type), get_journal_status(iter_url_result),
+                    iter_url_result.url, http_status=iter_url_result.status_code, attempts=iter_url_result.attempt_count,
+                    latency_seconds=iter_url_result.latency_seconds, byte_count=iter_url_result.byte_count)
+
+            if iter_url_result.unchanged:
+                unchanged_url_count += 1
+
+            if url_validator_cache and iter_url_result.success and iter_url_result.url_validators:
+                url_validator_cache.put(iter_url_result.url_validators)
+
+        if warc_file.needs_rotation():
+            # make sure the journal is caught up before the segment is marked as closed, since
+            # it might get moved off the machine as soon as it is
+            _sync_output_files()
+            journal.commit()
+            warc_file.rotate()
+        else:
+            journal.commit_if_due(_sync_output_files)
 
+    writer_stage = warc_output.WarcWriterStage(_write_entry_result, parsed_args.writer_queue_size)
+    writer_stage.start()
 
+    metrics_reporter.start()
 
+    finished_cleanly = False
+
+    try:
+
+        try:
+            fetch_scheduler = FetchScheduler(concurrency, retry_policy, writer_stage.put,
+                valkyrie_first=parsed_args.valkyrie_first, rate_controller=rate_controller,
+                url_validator_cache=url_validator_cache, metrics=metrics)
+            fetch_scheduler.run(_get_api_entries_to_download(), api_entry_count)
+
+        finally:
+            # let the writer get through everything that was already queued
+            writer_stage.finish()
+
+        finished_cleanly = True
+
+    finally:
+        # commit whatever finished, even if we are crashing
+        _sync_output_files()
+        journal.close()
+        media_sink.close()
+
+        if dead_sku_fh:
+            dead_sku_fh.close()
+
+        if event_log_writer:
+            event_log_writer.close()
+
+        if url_validator_cache:
+            url_validator_cache.close()
+
+        warc_file.close(mark_closed=finished_cleanly)
+
+        metrics_reporter.stop()
+
+    end_time = arrow.utcnow()
+
+    elapsed_time = end_time - start_time
+
+    logger.info("start time: `%s`, end time: `%s`, elapsed time: `%s`", start_time, end_time, elapsed_time)
+    logger.info("skipped `%s` skus that the journal said were already done", skipped_entry_count)
+    logger.info("skipped `%s` skus that were in the dead sku list, found `%s` new dead skus", skipped_dead_entry_count, new_dead_sku_count)
+    logger.info("discovered `%s` media urls", discovered_media_url_count)
+    if url_validator_cache:
+        logger.info("`%s` urls were unchanged since the last run and were saved as revisit records", unchanged_url_count)
+    media_sink.log_stats()
+
+    if rate_controller is not None:
+        rate_controller.log_stats()
+
+    return {
+        "worker": worker_index,
+        "sku_count": api_entry_count,
+        "skipped_sku_count": skipped_entry_count,
+        "skipped_dead_sku_count": skipped_dead_entry_count,
+        "new_dead_sku_count": new_dead_sku_count,
+        "unchanged_url_count": unchanged_url_count,
+        "discovered_media_url_count": discovered_media_url_count,
+        "media_files_output_file": output_paths.media_files_output_file,
+        "journal_file": output_paths.journal_file,
+        "warc_segment_path_list": warc_file.segment_path_list,
+    }
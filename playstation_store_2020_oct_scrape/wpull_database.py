@@ -0,0 +1,133 @@
+'''
+creating a wpull database that already has the urls to scrape in it
+
+wpull reads `--input-file` into its database one url at a time before it starts downloading anything, which takes a
+long time for the big regions. Instead the urls can be put into a new database here, and wpull is started with that
+as its `--database` (and a empty `--input-file`, like `scrape_media.py` does)
+
+the tables are the same as the ones wpull 2 creates with sqlalchemy (`wpull/database/sqlmodel.py`), wpull creates
+the other tables it needs (like `queued_files`) itself when it starts
+'''
+
+import logging
+import pathlib
+import sqlite3
+import typing
+
+logger = logging.getLogger(__name__)
+
+WPULL_STATUS_TODO = "todo"
+
+# the `Status` and `LinkType` enums, sqlalchemy stores them as strings and checks them with a constraint
+WPULL_STATUS_TUPLE = ("todo", "in_progress", "done", "skipped", "error")
+WPULL_LINK_TYPE_TUPLE = ("html", "css", "javascript", "media", "sitemap", "file", "directory")
+
+CREATE_TABLES_SCRIPT = '''
+create table url_strings (
+    id integer not null,
+    url varchar not null,
+    primary key (id)
+);
+
+create table queued_urls (
+    id integer not null,
+    url_string_id integer not null,
+    parent_url_string_id integer,
+    root_url_string_id integer,
+    status varchar(11) not null,
+    try_count integer not null,
+    level integer not null,
+    inline_level integer,
+    link_type varchar(10),
+    priority integer not null,
+    post_data varchar,
+    status_code integer,
+    filename varchar,
+    primary key (id),
+    foreign key(url_string_id) references url_strings (id),
+    foreign key(parent_url_string_id) references url_strings (id),
+    foreign key(root_url_string_id) references url_strings (id),
+    constraint status check (status in {status}),
+    constraint link_type check (link_type in {link_type})
+);
+'''.format(status=WPULL_STATUS_TUPLE, link_type=WPULL_LINK_TYPE_TUPLE)
+
+# created after the rows are in, building a index once is a lot faster then updating it for every insert
+CREATE_INDEXES_SCRIPT = '''
+create unique index ix_url_strings_url on url_strings (url);
+create unique index ix_queued_urls_url_string_id on queued_urls (url_string_id);
+create index ix_queued_urls_status on queued_urls (status);
+create index ix_queued_urls_priority on queued_urls (priority);
+'''
+
+INSERT_URL_STRING_STATEMENT = "insert into url_strings (id, url) values (?, ?)"
+
+# a content id list can have the same id twice, which would break the unique index, wpull itself only
+# queues a url once. Done in sqlite so the urls don't all have to be kept in memory to find them
+DELETE_DUPLICATE_URL_STRINGS_STATEMENT = '''
+    delete from url_strings where id not in (select min(id) from url_strings group by url)
+'''
+
+# every url string gets queued with the same id, done in one statement instead of a insert per url
+INSERT_QUEUED_URLS_STATEMENT = '''
+    insert into queued_urls (id, url_string_id, status, try_count, level, priority)
+    select id, id, '{}', 0, 0, 0 from url_strings
+'''.format(WPULL_STATUS_TODO)
+
+# how much memory (in KiB) sqlite can use to cache pages while building the database
+BUILD_CACHE_SIZE_KIB = 256 * 1024
+
+
+def create_wpull_database(database_path:pathlib.Path, url_iter:typing.Iterable[str]) -> int:
+    '''
+    creates a new wpull database with every url queued as `todo`, like wpull would have done with them in a `--input-file`
+
+    everything is inserted in one transaction with the indexes created at the end, and since the file is new, the
+    journal is turned off while doing it, if anything goes wrong the half written file is deleted
+
+    @param database_path - where to create the database, it can't exist already
+    @param url_iter - the urls, duplicates are left out like wpull does
+    @return how many urls were queued
+    '''
+
+    if database_path.exists():
+        raise Exception("the database `{}` already exists, refusing to add urls to it".format(database_path))
+
+    connection = sqlite3.connect(str(database_path), isolation_level=None)
+
+    try:
+        connection.execute("pragma journal_mode = off")
+        connection.execute("pragma synchronous = off")
+        connection.execute("pragma cache_size = -{}".format(BUILD_CACHE_SIZE_KIB))
+        connection.executescript(CREATE_TABLES_SCRIPT)
+
+        connection.execute("begin")
+
+        # the prepared statement is run for every url as they are read, without building up a list of them
+        connection.executemany(INSERT_URL_STRING_STATEMENT, enumerate(url_iter, start=1))
+        inserted_url_count = connection.execute("select count(*) from url_strings").fetchone()[0]
+
+        connection.execute(DELETE_DUPLICATE_URL_STRINGS_STATEMENT)
+        url_count = connection.execute("select count(*) from url_strings").fetchone()[0]
+        if inserted_url_count != url_count:
+            logger.info("left out `%s` duplicate urls", inserted_url_count - url_count)
+
+        connection.execute(INSERT_QUEUED_URLS_STATEMENT)
+
+        logger.info("inserted `%s` urls into `%s`, creating the indexes", url_count, database_path)
+        for iter_statement in CREATE_INDEXES_SCRIPT.split(";"):
+            connection.execute(iter_statement)
+
+        connection.execute("commit")
+
+        # back to what wpull expects for the actual scrape
+        connection.execute("pragma journal_mode = delete")
+
+    except BaseException:
+        connection.close()
+        logger.error("failed to create the wpull database `%s`, deleting it", database_path)
+        database_path.unlink()
+        raise
+
+    connection.close()
+    return url_count
@@ -0,0 +1,24 @@
+import pathlib
+
+from playstation_store_2020_oct_scrape import checkpoint_journal
+
+
+def test_journal_round_trip(tmp_path):
+
+    journal_path = tmp_path / "test.warc.gz.journal"
+
+    journal = checkpoint_journal.CheckpointJournal(journal_path)
+    journal.open()
+    journal.add("SKU1", "valkyrie", checkpoint_journal.JOURNAL_STATUS_DONE)
+    journal.add("SKU1", "chihiro", checkpoint_journal.JOURNAL_STATUS_FAILED)
+    journal.add("SKU2", "chihiro", checkpoint_journal.JOURNAL_STATUS_DONE)
+    journal.add("SKU4", "valkyrie", checkpoint_journal.JOURNAL_STATUS_NOT_FOUND)
+    journal.close()
+
+    # simulate a crash in the middle of writing a line
+    with open(journal_path, "a", encoding="utf-8") as f:
+        f.write("SKU3\tvalkyrie\td")
+
+    done_dict = checkpoint_journal.CheckpointJournal.load_done_dict(journal_path)
+
+    assert done_dict == {"SKU1": {"valkyrie"}, "SKU2": {"chihiro"}, "SKU4": {"valkyrie"}}
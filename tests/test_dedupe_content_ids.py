@@ -0,0 +1,74 @@
+import argparse
+import json
+
+import pytest
+
+from playstation_store_2020_oct_scrape import dedupe_content_ids
+from playstation_store_2020_oct_scrape import file_utils
+
+
+def _write_list(path, content_id_list):
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with file_utils.open_text_file(path, "wt") as f:
+        f.write("".join("{}\n".format(x) for x in content_id_list))
+
+def _read_list(path):
+
+    with file_utils.open_text_file(path) as f:
+        return f.read().splitlines()
+
+# 2 forces almost every id through a run file, 1000 keeps them all in memory
+@pytest.mark.parametrize("max_ids_in_memory", [2, 1000])
+def test_run_output_folder(tmp_path, max_ids_in_memory):
+
+    old_us_path = tmp_path / "old" / "en-us.txt"
+    new_us_path = tmp_path / "new" / "en-us.txt.xz"
+    jp_path = tmp_path / "new" / "ja-jp.txt.xz"
+
+    _write_list(old_us_path, ["UP0000-CUSA00002_00-GAME", "UP0000-CUSA00001_00-GAME", "UP0000-CUSA00002_00-GAME", ""])
+    # a id that another one starts with has to sort first
+    _write_list(new_us_path, ["UP0000-CUSA00003_00-GAME", "UP0000-CUSA00001_00-GAME", "UP0000-CUSA00001_00-GAMEX"])
+    _write_list(jp_path, ["JP0000-CUSA00001_00-GAME", "UP0000-CUSA00001_00-GAME"])
+
+    output_folder = tmp_path / "output"
+    output_folder.mkdir()
+    report_path = tmp_path / "report.json"
+
+    dedupe_content_ids.run(argparse.Namespace(content_ids_file_list=[old_us_path, new_us_path, jp_path, old_us_path],
+        output_folder=output_folder, output_file=None, compression="xz", report_file=report_path,
+        max_ids_in_memory=max_ids_in_memory, temp_dir=tmp_path))
+
+    assert sorted(x.name for x in output_folder.iterdir()) == ["en-us.txt.xz", "ja-jp.txt.xz"]
+    assert _read_list(output_folder / "en-us.txt.xz") == ["UP0000-CUSA00001_00-GAME", "UP0000-CUSA00001_00-GAMEX",
+        "UP0000-CUSA00002_00-GAME", "UP0000-CUSA00003_00-GAME"]
+    assert _read_list(output_folder / "ja-jp.txt.xz") == ["JP0000-CUSA00001_00-GAME", "UP0000-CUSA00001_00-GAME"]
+
+    # the runs are cleaned up
+    assert sorted(x.name for x in tmp_path.iterdir()) == ["new", "old", "output", "report.json"]
+
+    with open(report_path, "r", encoding="utf-8") as f:
+        report_dict = json.load(f)
+
+    # the list given twice is only read once
+    assert [x["path"] for x in report_dict["lists"]] == [str(old_us_path), str(new_us_path), str(jp_path)]
+    assert report_dict["lists"][0] == {"path": str(old_us_path), "region": "en-us", "ids": 3, "unique_ids": 2, "duplicate_ids": 1,
+        "shared_ids": 1, "only_here_ids": 1, "overlap": {str(new_us_path): 1, str(jp_path): 1}}
+    assert report_dict["lists"][1]["overlap"] == {str(old_us_path): 1, str(jp_path): 1}
+    assert report_dict["lists"][1]["only_here_ids"] == 2
+    assert report_dict["lists"][2]["only_here_ids"] == 1
+
+def test_dedupe_content_id_lists_single_output(tmp_path):
+
+    a_path = tmp_path / "a.txt"
+    b_path = tmp_path / "b.txt"
+    _write_list(a_path, ["C", "A", "B"])
+    _write_list(b_path, ["B", "D", "A"])
+
+    stats_list = dedupe_content_ids.dedupe_content_id_lists([a_path, b_path], {None: tmp_path / "all.txt"}, 1)
+
+    assert _read_list(tmp_path / "all.txt") == ["A", "B", "C", "D"]
+    assert [(x.shared_id_count, x.only_here_id_count) for x in stats_list] == [(2, 1), (2, 1)]
+
+    with pytest.raises(Exception):
+        dedupe_content_ids.dedupe_content_id_lists([a_path], {None: tmp_path / "all.txt"}, 0)
@@ -0,0 +1,63 @@
+import argparse
+import zipfile
+
+import pytest
+
+from playstation_store_2020_oct_scrape import diff_content_ids
+from playstation_store_2020_oct_scrape import file_utils
+
+
+def _write_list(path, content_id_list):
+
+    with file_utils.open_text_file(path, "wt") as f:
+        f.write("".join("{}\n".format(x) for x in content_id_list))
+
+def _write_snapshot_zip(zip_path, folder_name, region_dict, temp_dir):
+
+    with zipfile.ZipFile(zip_path, "w") as zip_file:
+        for region, content_id_list in region_dict.items():
+            list_path = temp_dir / "{}.txt.xz".format(region)
+            _write_list(list_path, content_id_list)
+            zip_file.write(list_path, "{}/regions/{}.txt.xz".format(folder_name, region))
+
+@pytest.mark.parametrize("max_ids_in_memory", [1, 1000])
+def test_run_zip_and_list(tmp_path, max_ids_in_memory):
+
+    old_path = tmp_path / "old.txt"
+    _write_list(old_path, ["UP0000-CUSA00003_00-GAME", "UP0000-CUSA00001_00-GAME", "UP0000-CUSA00002_00-GAME", "UP0000-CUSA00001_00-GAME"])
+
+    new_zip_path = tmp_path / "master.zip"
+    _write_snapshot_zip(new_zip_path, "playstation_content_ids-master", {
+        "en-us": ["UP0000-CUSA00004_00-GAME", "UP0000-CUSA00002_00-GAME", "UP0000-CUSA00001_00-GAME", "UP0000-CUSA00000_00-GAME"],
+        "ja-jp": ["JP0000-CUSA00001_00-GAME"],
+    }, tmp_path)
+
+    added_path = tmp_path / "added.txt.xz"
+    removed_path = tmp_path / "removed.txt"
+
+    diff_content_ids.run(argparse.Namespace(old_snapshot=old_path, new_snapshot=new_zip_path, region="en-US",
+        added_output_file=added_path, removed_output_file=removed_path, max_ids_in_memory=max_ids_in_memory, temp_dir=tmp_path))
+
+    with file_utils.open_text_file(added_path) as f:
+        assert f.read().splitlines() == ["UP0000-CUSA00000_00-GAME", "UP0000-CUSA00004_00-GAME"]
+
+    assert removed_path.read_text(encoding="utf-8").splitlines() == ["UP0000-CUSA00003_00-GAME"]
+
+    # the extracted list and the runs are cleaned up
+    assert sorted(x.name for x in tmp_path.iterdir()) == ["added.txt.xz", "en-us.txt.xz", "ja-jp.txt.xz", "master.zip", "old.txt", "removed.txt"]
+
+def test_get_content_ids_path(tmp_path):
+
+    list_path = tmp_path / "en-us.txt"
+    assert diff_content_ids.get_content_ids_path(list_path, None, tmp_path) == list_path
+
+    zip_path = tmp_path / "snapshot.zip"
+    _write_snapshot_zip(zip_path, "playstation_content_ids-0123abc", {"en-us": ["UP0000-CUSA00000_00-GAME"]}, tmp_path)
+
+    assert diff_content_ids.get_content_ids_path(zip_path, "en-us", tmp_path).name == "en-us.txt.xz"
+
+    with pytest.raises(Exception):
+        diff_content_ids.get_content_ids_path(zip_path, None, tmp_path)
+
+    with pytest.raises(Exception):
+        diff_content_ids.get_content_ids_path(zip_path, "de-de", tmp_path)
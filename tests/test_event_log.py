@@ -0,0 +1,92 @@
+from playstation_store_2020_oct_scrape import event_log
+
+
+def test_event_log_round_trip(tmp_path):
+
+    event_log_path = tmp_path / "events.jsonl"
+
+    event_log_writer = event_log.EventLogWriter(event_log_path)
+    event_log_writer.open()
+
+    try:
+        event_log_writer.add("UP0000-SKU00001", "en-us", "valkyrie", event_log.EVENT_STATUS_FAILED, "http://valkyrie/UP0000-SKU00001",
+            http_status=503, attempts=5, latency_seconds=0.25)
+        event_log_writer.add("UP0000-SKU00001", "en-us", "chihiro", event_log.EVENT_STATUS_DONE, "http://chihiro/UP0000-SKU00001",
+            http_status=200, latency_seconds=0.5, byte_count=100)
+        event_log_writer.add("UP0000-SKU00002", "en-us", "valkyrie", event_log.EVENT_STATUS_NOT_FOUND, "http://valkyrie/UP0000-SKU00002",
+            http_status=404)
+        # a later retry round
+        event_log_writer.add("UP0000-SKU00001", "en-us", "valkyrie", event_log.EVENT_STATUS_DONE, "http://valkyrie/UP0000-SKU00001",
+            http_status=200, attempts=2)
+        event_log_writer.sync()
+
+    finally:
+        event_log_writer.close()
+
+    # like a crash in the middle of writing a line
+    with open(event_log_path, "a", encoding="utf-8") as f:
+        f.write('{"sku":"UP0000-SKU00003","region":"en-us","api":"valk')
+
+    event_index = event_log.EventIndex()
+
+    with open(event_log_path, "r", encoding="utf-8") as f:
+        event_index.add_lines(f)
+
+    assert event_index.event_count == 4
+    assert event_index.malformed_line_count == 1
+    assert event_index.total_bytes == 100
+
+    assert event_index.get_url_outcome("UP0000-SKU00001", "en-us", "valkyrie") == \
+        event_log.UrlOutcome(event_log.EVENT_STATUS_DONE, "http://valkyrie/UP0000-SKU00001", 7, 200)
+    assert event_index.get_item_set("valkyrie", event_log.EVENT_STATUS_FAILED) == set()
+    assert event_index.get_item_set("valkyrie", event_log.EVENT_STATUS_DONE) == {("en-us", "UP0000-SKU00001")}
+    assert event_index.get_status_count_dict() == {
+        "chihiro": {event_log.EVENT_STATUS_DONE: 1},
+        "valkyrie": {event_log.EVENT_STATUS_DONE: 1, event_log.EVENT_STATUS_NOT_FOUND: 1},
+    }
+
+def test_event_index_keeps_the_best_status():
+
+    event_index = event_log.EventIndex()
+    event_index.add_lines([
+        event_log.get_event_line("UP0000-SKU00001", "en-us", "chihiro", event_log.EVENT_STATUS_DONE, "http://chihiro/UP0000-SKU00001"),
+        event_log.get_event_line("UP0000-SKU00001", "en-us", "chihiro", event_log.EVENT_STATUS_FAILED, "http://chihiro/UP0000-SKU00001", http_status=500),
+    ])
+
+    assert event_index.get_url_outcome("UP0000-SKU00001", "en-us", "chihiro").status == event_log.EVENT_STATUS_DONE
+    assert event_index.get_url_outcome("UP0000-SKU00001", "en-us", "chihiro").attempts == 2
+    assert event_log.get_status_for_http_status(410) == event_log.EVENT_STATUS_NOT_FOUND
+    assert event_log.get_status_for_http_status(None) == event_log.EVENT_STATUS_FAILED
+
+def test_done_lines_match_the_fast_path():
+
+    line = event_log.get_event_line("UP0000-SKU00001", "en-us", "valkyrie", event_log.EVENT_STATUS_DONE, "http://valkyrie/UP0000-SKU00001",
+        http_status=200, attempts=3, byte_count=10)
+
+    assert event_log.DONE_EVENT_LINE_REGEX_OBJ.match(line) is not None
+
+    event_index = event_log.EventIndex()
+    event_index.add_lines([line])
+
+    assert event_index.get_url_outcome("UP0000-SKU00001", "en-us", "valkyrie") == \
+        event_log.UrlOutcome(event_log.EVENT_STATUS_DONE, "http://valkyrie/UP0000-SKU00001", 3, 200)
+    assert event_index.total_bytes == 10
+    assert event_index.latency_count == 0
+
+def test_event_index_keeps_regions_apart():
+
+    valkyrie_url_format = "https://store.playstation.com/valkyrie-api/{}/{}/999/resolve/UP0000-SKU00001"
+
+    event_index = event_log.EventIndex()
+    event_index.add_lines([
+        event_log.get_event_line("UP0000-SKU00001", "en-us", "valkyrie", event_log.EVENT_STATUS_DONE, valkyrie_url_format.format("en", "us")),
+        event_log.get_event_line("UP0000-SKU00001", "es-us", "valkyrie", event_log.EVENT_STATUS_FAILED, valkyrie_url_format.format("es", "us")),
+        # a line from before the region was written, it comes from the url instead
+        '{{"sku":"UP0000-SKU00001","api":"valkyrie","status":"failed","url":"{}"}}\n'.format(valkyrie_url_format.format("ja", "jp")),
+    ])
+
+    assert event_index.get_url_outcome("UP0000-SKU00001", "en-us", "valkyrie").status == event_log.EVENT_STATUS_DONE
+    assert event_index.get_url_outcome("UP0000-SKU00001", "es-us", "valkyrie").status == event_log.EVENT_STATUS_FAILED
+    assert event_index.get_item_set("valkyrie", event_log.EVENT_STATUS_FAILED) == {("es-us", "UP0000-SKU00001"), ("ja-jp", "UP0000-SKU00001")}
+    assert event_log.get_region_from_url("http://127.0.0.1:8080/store/api/chihiro/00_09_000/container/us/es/999/UP0000-SKU00001") == "es-us"
+    assert event_log.get_region_from_url("http://example.com/UP0000-SKU00001") == event_log.UNKNOWN_REGION
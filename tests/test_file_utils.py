@@ -0,0 +1,26 @@
+import pytest
+
+from playstation_store_2020_oct_scrape import file_utils
+
+
+@pytest.mark.parametrize("file_name", ["ids.txt", "ids.txt.xz", "ids.txt.gz"])
+def test_iter_content_ids(tmp_path, file_name):
+
+    file_path = tmp_path / file_name
+
+    with file_utils.open_text_file(file_path, "wt") as f:
+        f.write("UP0001-CUSA00001_00-AAAAAAAAAAAAAAAA\n\n  UP0002-CUSA00002_00-BBBBBBBBBBBBBBBB  \n")
+
+    assert list(file_utils.iter_content_ids(file_path)) == [
+        "UP0001-CUSA00001_00-AAAAAAAAAAAAAAAA",
+        "UP0002-CUSA00002_00-BBBBBBBBBBBBBBBB"]
+    assert file_utils.count_content_ids(file_path) == 2
+
+@pytest.mark.parametrize("name,expected_name", [
+    ("psstore_en-us.warc.gz", "psstore_en-us.worker01.warc.gz"),
+    ("media.txt", "media.worker01.txt"),
+    ("no_extension", "no_extension.worker01"),
+])
+def test_add_name_suffix(tmp_path, name, expected_name):
+
+    assert file_utils.add_name_suffix(tmp_path / name, "worker01") == tmp_path / expected_name
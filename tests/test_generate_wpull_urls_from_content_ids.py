@@ -0,0 +1,102 @@
+import argparse
+import json
+import sqlite3
+
+import pytest
+
+from playstation_store_2020_oct_scrape import file_utils
+from playstation_store_2020_oct_scrape import generate_wpull_urls_from_content_ids
+
+
+def _write_region(regions_folder, region, content_id_list):
+
+    with file_utils.open_text_file(regions_folder / "{}.txt.xz".format(region), "wt") as f:
+        f.write("".join("{}\n".format(x) for x in content_id_list))
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_run_batch_matches_run(tmp_path, monkeypatch, jobs):
+
+    # small chunks, so content ids get split between them
+    monkeypatch.setattr(generate_wpull_urls_from_content_ids, "URL_LIST_CHUNK_SIZE", 100)
+
+    regions_folder = tmp_path / "regions"
+    regions_folder.mkdir()
+    output_folder = tmp_path / "output"
+    output_folder.mkdir()
+
+    us_content_id_list = ["UP0000-CUSA{:05d}_00-GAME0000000".format(x) for x in range(50)]
+    _write_region(regions_folder, "en-us", us_content_id_list)
+    _write_region(regions_folder, "zh-hans-cn", ["HP0000-CUSA00000_00-GAME0000000", "", "HP0000-CUSA00001_00-GAME0000000"])
+    _write_region(regions_folder, "ja-jp", ["JP0000-CUSA00000_00-GAME0000000"])
+
+    counts_path = tmp_path / "counts.json"
+
+    generate_wpull_urls_from_content_ids.run_batch(argparse.Namespace(regions_folder=regions_folder,
+        language_tag=["en-US", "zh-Hans-CN"], output_folder=output_folder, compression="xz",
+        counts_file=counts_path, jobs=jobs, base_url=None))
+
+    assert sorted(x.name for x in output_folder.iterdir()) == ["wpull_urls_en-us.txt.xz", "wpull_urls_zh-hans-cn.txt.xz"]
+
+    # the same as the single region mode
+    generate_wpull_urls_from_content_ids.run(argparse.Namespace(content_ids_file=regions_folder / "en-us.txt.xz",
+        output_file=tmp_path / "en-us.txt", output_database=None, region_lang="en", region_country="us",
+        dead_skus_file=None, base_url=None))
+
+    with file_utils.open_text_file(output_folder / "wpull_urls_en-us.txt.xz") as f:
+        assert f.read() == (tmp_path / "en-us.txt").read_text(encoding="utf-8")
+
+    with file_utils.open_text_file(output_folder / "wpull_urls_zh-hans-cn.txt.xz") as f:
+        assert f.read().splitlines()[:2] == [
+            "https://store.playstation.com/valkyrie-api/zh/cn/999/resolve/HP0000-CUSA00000_00-GAME0000000",
+            "https://store.playstation.com/store/api/chihiro/00_09_000/container/cn/zh/999/HP0000-CUSA00000_00-GAME0000000"]
+
+    with open(counts_path, "r", encoding="utf-8") as f:
+        count_dict = json.load(f)
+
+    assert count_dict["en-us"]["content_ids"] == 50
+    assert count_dict["zh-hans-cn"] == {"content_ids": 2, "urls": 4, "output_file": "wpull_urls_zh-hans-cn.txt.xz"}
+
+def test_get_region_url_list_list(tmp_path):
+
+    (tmp_path / "en-us.txt.xz").touch()
+    (tmp_path / "ja-jp.txt.xz").touch()
+    (tmp_path / "README.md").touch()
+
+    region_url_list_list = generate_wpull_urls_from_content_ids.get_region_url_list_list(tmp_path, tmp_path, None)
+    assert [x.region for x in region_url_list_list] == ["en-us", "ja-jp"]
+
+    with pytest.raises(Exception):
+        generate_wpull_urls_from_content_ids.get_region_url_list_list(tmp_path, tmp_path, ["de-de"])
+
+def test_run_output_database(tmp_path):
+
+    content_ids_path = tmp_path / "ids.txt"
+    content_ids_path.write_text("UP0000-CUSA00000_00-GAME\nUP0000-CUSA00001_00-GAME\nUP0000-CUSA00000_00-GAME\nUP0000-DEAD00000_00-GAME\n", encoding="utf-8")
+    dead_skus_path = tmp_path / "dead.txt"
+    dead_skus_path.write_text("UP0000-DEAD00000_00-GAME\n", encoding="utf-8")
+    database_path = tmp_path / "wpull.sqlite3"
+
+    parsed_args = argparse.Namespace(content_ids_file=content_ids_path, output_file=None, output_database=database_path,
+        region_lang="en", region_country="us", dead_skus_file=dead_skus_path, base_url=None)
+    generate_wpull_urls_from_content_ids.run(parsed_args)
+
+    connection = sqlite3.connect(database_path)
+    row_list = connection.execute('''
+        select url_strings.url, queued_urls.status, queued_urls.try_count, queued_urls.level
+        from queued_urls join url_strings on url_strings.id = queued_urls.url_string_id order by queued_urls.id''').fetchall()
+    index_name_set = {x[0] for x in connection.execute("select name from sqlite_master where type = 'index'")}
+    connection.close()
+
+    assert row_list == [
+        ("https://store.playstation.com/valkyrie-api/en/us/999/resolve/UP0000-CUSA00000_00-GAME", "todo", 0, 0),
+        ("https://store.playstation.com/store/api/chihiro/00_09_000/container/us/en/999/UP0000-CUSA00000_00-GAME", "todo", 0, 0),
+        ("https://store.playstation.com/valkyrie-api/en/us/999/resolve/UP0000-CUSA00001_00-GAME", "todo", 0, 0),
+        ("https://store.playstation.com/store/api/chihiro/00_09_000/container/us/en/999/UP0000-CUSA00001_00-GAME", "todo", 0, 0),
+    ]
+    assert {"ix_url_strings_url", "ix_queued_urls_url_string_id", "ix_queued_urls_status"} <= index_name_set
+
+    # never adds to a database that is already there, like one wpull has been using
+    with pytest.raises(Exception):
+        generate_wpull_urls_from_content_ids.run(parsed_args)
+
+    assert database_path.exists()
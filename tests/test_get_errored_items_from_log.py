@@ -0,0 +1,228 @@
+import argparse
+import gzip
+
+import pytest
+
+from playstation_store_2020_oct_scrape import event_log
+from playstation_store_2020_oct_scrape import get_errored_items_from_log
+from playstation_store_2020_oct_scrape.warcio_scrape import ApiEntry
+
+LOG_LINE_PREFIX = "2020-11-11T23:57:57.376226+09:00 MainThread playstation_store_2020_oct_scrape.warcio_scrape INFO    : "
+BASE_URL = "http://127.0.0.1:8080"
+
+
+def _get_api_entry(sku):
+    return ApiEntry(sku=sku,
+        valkyrie_url="{}/valkyrie-api/en/us/999/resolve/{}".format(BASE_URL, sku),
+        chihiro_url="{}/store/api/chihiro/00_09_000/container/us/en/999/{}".format(BASE_URL, sku))
+
+def _get_start_line(idx, api_entry):
+    return "{}`{} / ?`: url: `{}`\n".format(LOG_LINE_PREFIX, idx, api_entry)
+
+def _get_failure_line(url):
+    return "{}-- hit `5` retries when attempting to get URL `{}`, skipping\n".format(LOG_LINE_PREFIX, url)
+
+@pytest.fixture
+def log_text():
+    ''' a `--concurrency` log, where the failures of an item come after other items started '''
+
+    api_entry_list = [_get_api_entry("UP0000-CUSA{:05d}_00-GAME".format(idx)) for idx in range(40)]
+    line_list = []
+
+    for idx, iter_api_entry in enumerate(api_entry_list):
+
+        line_list.append(_get_start_line(idx + 1, iter_api_entry))
+        line_list.append("{}-- url `{}` - HTTP `200`\n".format(LOG_LINE_PREFIX, iter_api_entry.chihiro_url))
+
+        if idx >= 3 and idx % 3 == 0:
+            line_list.append(_get_failure_line(api_entry_list[idx - 3].valkyrie_url))
+        if idx >= 3 and idx % 6 == 0:
+            line_list.append(_get_failure_line(api_entry_list[idx - 3].chihiro_url))
+
+    # the old log format, the failed item is the one that started last
+    line_list.append("{}-- hit `5` retries when attempting to get {}, skipping\n".format(LOG_LINE_PREFIX, api_entry_list[-1]))
+    line_list.append("{}start time: `2020-11-11T00:00:00+00:00`, end time: `2020-11-12T00:00:00+00:00`\n".format(LOG_LINE_PREFIX))
+    # a later run appended to the same log
+    line_list.append(_get_start_line(1, _get_api_entry("UP0000-NEVER00000_00-GAME")))
+    line_list.append(_get_failure_line(_get_api_entry("UP0000-NEVER00000_00-GAME").valkyrie_url))
+
+    return "".join(line_list)
+
+def _get_expected_failed_flags_dict():
+
+    expected_failed_flags_dict = {}
+
+    for idx in range(3, 40, 3):
+        expected_failed_flags_dict["UP0000-CUSA{:05d}_00-GAME".format(idx - 3)] = [True, idx % 6 == 0]
+
+    expected_failed_flags_dict["UP0000-CUSA00039_00-GAME"] = [True, False]
+    return expected_failed_flags_dict
+
+def test_parse_log_lines(log_text):
+
+    parse_result = get_errored_items_from_log.parse_log_lines(log_text.splitlines(keepends=True))
+
+    assert parse_result.total_items_count == 40
+    assert parse_result.hit_log_end
+    assert parse_result.failed_flags_dict == _get_expected_failed_flags_dict()
+    assert parse_result.started_url_dict["UP0000-CUSA00007_00-GAME"] == \
+        (_get_api_entry("UP0000-CUSA00007_00-GAME").valkyrie_url, _get_api_entry("UP0000-CUSA00007_00-GAME").chihiro_url)
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_parse_log_compressed_and_chunked(log_text, tmp_path, jobs):
+
+    log_path = tmp_path / "warcio_scrape.log"
+    log_path.write_text(log_text, encoding="utf-8")
+
+    gzip_log_path = tmp_path / "warcio_scrape.log.gz"
+    with gzip.open(gzip_log_path, "wt", encoding="utf-8") as f:
+        f.write(log_text)
+
+    expected_failed_flags_dict = _get_expected_failed_flags_dict()
+
+    for iter_log_path in (log_path, gzip_log_path):
+
+        parse_result = get_errored_items_from_log.parse_log(iter_log_path, jobs)
+
+        assert parse_result.total_items_count == 40
+        assert parse_result.failed_flags_dict == expected_failed_flags_dict
+        assert expected_failed_flags_dict.keys() <= parse_result.started_url_dict.keys()
+
+def test_get_log_chunk_offset_list(log_text, tmp_path):
+
+    log_path = tmp_path / "warcio_scrape.log"
+    log_path.write_bytes(log_text.encode("utf-8"))
+
+    chunk_offset_list = get_errored_items_from_log.get_log_chunk_offset_list(log_path, 7)
+    log_bytes = log_path.read_bytes()
+
+    assert chunk_offset_list[0][0] == 0
+    assert chunk_offset_list[-1][1] == len(log_bytes)
+
+    for (iter_start, iter_end), (iter_next_start, _) in zip(chunk_offset_list, chunk_offset_list[1:]):
+        assert iter_end == iter_next_start
+        assert log_bytes[iter_start - 1:iter_start] in (b"", b"\n")
+
+def test_run_output_as_urls(log_text, tmp_path):
+
+    log_path = tmp_path / "warcio_scrape.log"
+    log_path.write_text(log_text, encoding="utf-8")
+    output_path = tmp_path / "errored.txt"
+
+    get_errored_items_from_log.run(argparse.Namespace(source_log_list=[log_path], source_log_glob_list=None, event_log_list=None,
+        error_item_output_file=output_path, error_item_output_folder=None, output_as_URLs=True,
+        only_dual_failures=True, only_valkyrie_failures=False, only_chihiro_failures=False, jobs=1))
+
+    api_entry = _get_api_entry("UP0000-CUSA00003_00-GAME")
+    assert output_path.read_text(encoding="utf-8").splitlines()[:2] == [api_entry.valkyrie_url, api_entry.chihiro_url]
+
+def test_run_merges_retry_rounds_per_region(tmp_path):
+
+    us_entry_list = [_get_api_entry("UP0000-CUSA{:05d}_00-GAME".format(idx)) for idx in range(3)]
+    jp_entry = ApiEntry(sku="JP0000-CUSA00000_00-GAME",
+        valkyrie_url="{}/valkyrie-api/ja/jp/999/resolve/JP0000-CUSA00000_00-GAME".format(BASE_URL),
+        chihiro_url="{}/store/api/chihiro/00_09_000/container/jp/ja/999/JP0000-CUSA00000_00-GAME".format(BASE_URL))
+
+    # the first round: everything fails for the first two, then the second round only retries those
+    round_1_lines = [_get_start_line(idx + 1, x) for idx, x in enumerate(us_entry_list)] + [
+        _get_failure_line(us_entry_list[0].valkyrie_url),
+        _get_failure_line(us_entry_list[1].valkyrie_url),
+        _get_failure_line(us_entry_list[1].chihiro_url)]
+    round_2_lines = [_get_start_line(1, us_entry_list[0]), _get_start_line(2, us_entry_list[1]),
+        _get_failure_line(us_entry_list[1].chihiro_url)]
+    jp_lines = [_get_start_line(1, jp_entry), _get_failure_line(jp_entry.chihiro_url)]
+
+    (tmp_path / "droplet_1").mkdir()
+    (tmp_path / "droplet_2").mkdir()
+    (tmp_path / "droplet_1" / "round_2.log").write_text("".join(round_2_lines), encoding="utf-8")
+    (tmp_path / "droplet_1" / "ja-jp.log").write_text("".join(jp_lines), encoding="utf-8")
+    with gzip.open(tmp_path / "droplet_2" / "round_1.log.gz", "wt", encoding="utf-8") as f:
+        f.write("".join(round_1_lines))
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+
+    get_errored_items_from_log.run(argparse.Namespace(source_log_list=[tmp_path / "droplet_1" / "round_2.log"],
+        source_log_glob_list=[str(tmp_path / "droplet_*" / "*.log*")], event_log_list=None,
+        error_item_output_file=None, error_item_output_folder=output_dir, output_as_URLs=True,
+        only_dual_failures=False, only_valkyrie_failures=False, only_chihiro_failures=True, jobs=2))
+
+    assert sorted(x.name for x in output_dir.iterdir()) == ["errored_items_en-us.txt", "errored_items_ja-jp.txt"]
+    assert (output_dir / "errored_items_en-us.txt").read_text(encoding="utf-8") == "{}\n".format(us_entry_list[1].chihiro_url)
+    assert (output_dir / "errored_items_ja-jp.txt").read_text(encoding="utf-8") == "{}\n".format(jp_entry.chihiro_url)
+
+def test_run_keeps_the_same_sku_in_each_region_apart(tmp_path):
+
+    sku = "UP0000-CUSA00000_00-GAME"
+    us_entry = _get_api_entry(sku)
+    es_entry = ApiEntry(sku=sku,
+        valkyrie_url="{}/valkyrie-api/es/us/999/resolve/{}".format(BASE_URL, sku),
+        chihiro_url="{}/store/api/chihiro/00_09_000/container/us/es/999/{}".format(BASE_URL, sku))
+
+    # `es-us` failed on valkyrie, and `en-us` worked, in either order
+    (tmp_path / "en-us.log").write_text(_get_start_line(1, us_entry), encoding="utf-8")
+    (tmp_path / "es-us.log").write_text(_get_start_line(1, es_entry) + _get_failure_line(es_entry.valkyrie_url), encoding="utf-8")
+
+    for iter_source_log_list in ([tmp_path / "en-us.log", tmp_path / "es-us.log"], [tmp_path / "es-us.log", tmp_path / "en-us.log"]):
+
+        output_dir = tmp_path / "output_{}".format(iter_source_log_list[0].stem)
+        output_dir.mkdir()
+
+        get_errored_items_from_log.run(argparse.Namespace(source_log_list=iter_source_log_list, source_log_glob_list=None, event_log_list=None,
+            error_item_output_file=None, error_item_output_folder=output_dir, output_as_URLs=True,
+            only_dual_failures=False, only_valkyrie_failures=False, only_chihiro_failures=False, jobs=1))
+
+        assert sorted(x.name for x in output_dir.iterdir()) == ["errored_items_es-us.txt"]
+        assert (output_dir / "errored_items_es-us.txt").read_text(encoding="utf-8") == "{}\n{}\n".format(es_entry.valkyrie_url, es_entry.chihiro_url)
+
+def test_run_with_event_log(log_text, tmp_path):
+
+    log_path = tmp_path / "warcio_scrape.log"
+    log_path.write_text(log_text, encoding="utf-8")
+
+    # a later run that only has a event log, where one of the failed skus worked
+    api_entry = _get_api_entry("UP0000-CUSA00003_00-GAME")
+    event_log_path = tmp_path / "events.jsonl.gz"
+    with gzip.open(event_log_path, "wt", encoding="utf-8") as f:
+        f.write(event_log.get_event_line(api_entry.sku, "en-us", "valkyrie", event_log.EVENT_STATUS_DONE, api_entry.valkyrie_url))
+        f.write(event_log.get_event_line(api_entry.sku, "en-us", "chihiro", event_log.EVENT_STATUS_DONE, api_entry.chihiro_url))
+
+    output_path = tmp_path / "errored.txt"
+
+    get_errored_items_from_log.run(argparse.Namespace(source_log_list=[log_path], source_log_glob_list=None, event_log_list=[event_log_path],
+        error_item_output_file=output_path, error_item_output_folder=None, output_as_URLs=False,
+        only_dual_failures=True, only_valkyrie_failures=False, only_chihiro_failures=False, jobs=1))
+
+    assert output_path.read_text(encoding="utf-8").splitlines() == ["UP0000-CUSA{:05d}_00-GAME".format(x) for x in range(9, 39, 6)]
+
+    # just the event log
+    get_errored_items_from_log.run(argparse.Namespace(source_log_list=None, source_log_glob_list=None, event_log_list=[event_log_path],
+        error_item_output_file=output_path, error_item_output_folder=None, output_as_URLs=False,
+        only_dual_failures=False, only_valkyrie_failures=False, only_chihiro_failures=False, jobs=1))
+
+    assert output_path.read_text(encoding="utf-8") == ""
+
+def test_run_with_event_logs_of_more_then_one_region(tmp_path):
+
+    sku = "UP0000-CUSA00000_00-GAME"
+    us_entry = _get_api_entry(sku)
+    es_entry = ApiEntry(sku=sku,
+        valkyrie_url="{}/valkyrie-api/es/us/999/resolve/{}".format(BASE_URL, sku),
+        chihiro_url="{}/store/api/chihiro/00_09_000/container/us/es/999/{}".format(BASE_URL, sku))
+
+    event_log_path = tmp_path / "events.jsonl"
+    with open(event_log_path, "w", encoding="utf-8") as f:
+        f.write(event_log.get_event_line(sku, "es-us", "valkyrie", event_log.EVENT_STATUS_FAILED, es_entry.valkyrie_url))
+        f.write(event_log.get_event_line(sku, "es-us", "chihiro", event_log.EVENT_STATUS_DONE, es_entry.chihiro_url))
+        f.write(event_log.get_event_line(sku, "en-us", "valkyrie", event_log.EVENT_STATUS_DONE, us_entry.valkyrie_url))
+        f.write(event_log.get_event_line(sku, "en-us", "chihiro", event_log.EVENT_STATUS_DONE, us_entry.chihiro_url))
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+
+    get_errored_items_from_log.run(argparse.Namespace(source_log_list=None, source_log_glob_list=None, event_log_list=[event_log_path],
+        error_item_output_file=None, error_item_output_folder=output_dir, output_as_URLs=True,
+        only_dual_failures=False, only_valkyrie_failures=True, only_chihiro_failures=False, jobs=1))
+
+    assert sorted(x.name for x in output_dir.iterdir()) == ["errored_items_es-us.txt"]
+    assert (output_dir / "errored_items_es-us.txt").read_text(encoding="utf-8") == "{}\n".format(es_entry.valkyrie_url)
@@ -0,0 +1,100 @@
+import argparse
+import sqlite3
+
+from playstation_store_2020_oct_scrape import get_errored_items_from_wpull_db
+
+BASE_URL = "http://127.0.0.1:8080"
+
+# the tables wpull 2 creates, with only the columns we use
+WPULL_SCHEMA = '''
+create table url_strings (id integer not null primary key, url varchar not null);
+create unique index ix_url_strings_url on url_strings (url);
+create table queued_urls (
+    id integer not null primary key,
+    url_string_id integer not null references url_strings (id),
+    status varchar(11) not null,
+    try_count integer not null,
+    status_code integer
+);
+create unique index ix_queued_urls_url_string_id on queued_urls (url_string_id);
+create index ix_queued_urls_status on queued_urls (status);
+'''
+
+
+def _get_urls(sku, lang="en", country="us"):
+    return ("{}/valkyrie-api/{}/{}/999/resolve/{}".format(BASE_URL, lang, country, sku),
+        "{}/store/api/chihiro/00_09_000/container/{}/{}/999/{}".format(BASE_URL, country, lang, sku))
+
+def _create_wpull_database(database_path, row_list):
+    ''' @param row_list - (url, status, status_code) '''
+
+    connection = sqlite3.connect(database_path)
+    connection.executescript(WPULL_SCHEMA)
+
+    for idx, (url, status, status_code) in enumerate(row_list):
+        connection.execute("insert into url_strings (id, url) values (?, ?)", (idx + 1, url))
+        connection.execute("insert into queued_urls (url_string_id, status, try_count, status_code) values (?, ?, ?, ?)",
+            (idx + 1, status, 0 if status_code is None else 1, status_code))
+
+    connection.commit()
+    connection.close()
+
+def test_run_merges_databases(tmp_path):
+
+    valkyrie_1, chihiro_1 = _get_urls("UP0000-CUSA00001_00-GAME")
+    valkyrie_2, chihiro_2 = _get_urls("UP0000-CUSA00002_00-GAME")
+    valkyrie_3, chihiro_3 = _get_urls("UP0000-CUSA00003_00-GAME")
+    jp_valkyrie, jp_chihiro = _get_urls("JP0000-CUSA00001_00-GAME", "ja", "jp")
+
+    _create_wpull_database(tmp_path / "round_1.sqlite3", [
+        (valkyrie_1, "error", 500),
+        (chihiro_1, "done", 200),
+        (valkyrie_2, "done", 403),
+        (chihiro_2, "error", None),
+        (valkyrie_3, "done", 404),
+        (chihiro_3, "todo", None),
+        ("https://apollo2.dl.playstation.net/cdn/UP0000/CUSA00003_00/icon.png", "skipped", None),
+        (jp_valkyrie, "done", 200),
+        (jp_chihiro, "in_progress", None),
+    ])
+    # the retry round got one of them
+    _create_wpull_database(tmp_path / "round_2.sqlite3", [
+        (chihiro_2, "done", 200),
+        (chihiro_3, "error", 503),
+    ])
+
+    output_path = tmp_path / "errored.txt"
+
+    get_errored_items_from_wpull_db.run(argparse.Namespace(wpull_database_list=[tmp_path / "round_1.sqlite3"],
+        wpull_database_glob_list=[str(tmp_path / "*.sqlite3")], error_item_output_file=output_path, error_item_output_folder=None,
+        output_as_URLs=True, exclude_never_attempted=False,
+        only_dual_failures=False, only_valkyrie_failures=False, only_chihiro_failures=False))
+
+    assert output_path.read_text(encoding="utf-8").splitlines() == [valkyrie_1, valkyrie_2, chihiro_3, jp_chihiro]
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+
+    get_errored_items_from_wpull_db.run(argparse.Namespace(wpull_database_list=[tmp_path / "round_1.sqlite3"],
+        wpull_database_glob_list=None, error_item_output_file=None, error_item_output_folder=output_dir,
+        output_as_URLs=False, exclude_never_attempted=True,
+        only_dual_failures=False, only_valkyrie_failures=False, only_chihiro_failures=False))
+
+    assert sorted(x.name for x in output_dir.iterdir()) == ["errored_items_en-us.txt"]
+    assert (output_dir / "errored_items_en-us.txt").read_text(encoding="utf-8").splitlines() == \
+        ["UP0000-CUSA00001_00-GAME", "UP0000-CUSA00002_00-GAME"]
+
+def test_queries_use_the_indexes(tmp_path):
+
+    _create_wpull_database(tmp_path / "wpull.sqlite3", [])
+
+    connection = sqlite3.connect(tmp_path / "wpull.sqlite3")
+    query_plan = " ".join(x[-1] for x in connection.execute("explain query plan " + get_errored_items_from_wpull_db.UNFINISHED_URL_QUERY))
+
+    url_list = ["{}/valkyrie-api/en/us/999/resolve/{}".format(BASE_URL, x) for x in range(get_errored_items_from_wpull_db.FINISHED_URL_QUERY_BATCH_SIZE)]
+    lookup_query_plan = " ".join(x[-1] for x in connection.execute("explain query plan " + get_errored_items_from_wpull_db.FINISHED_URL_QUERY_FORMAT.format(
+        ", ".join("?" * len(url_list)), done="done", finished=get_errored_items_from_wpull_db.FINISHED_STATUS_CODE_TUPLE), url_list))
+    connection.close()
+
+    assert "ix_queued_urls_status" in query_plan
+    assert "ix_url_strings_url" in lookup_query_plan
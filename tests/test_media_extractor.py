@@ -0,0 +1,48 @@
+from playstation_store_2020_oct_scrape import media_extractor
+from playstation_store_2020_oct_scrape.media_extractor import MediaUrl, MediaUrlKind
+
+
+def test_valkyrie_media_urls():
+
+    response_json = {"included": [
+        {"attributes": {
+            "content-rating": {"url": "rating"},
+            "thumbnail-url-base": "thumb",
+            "parent": {"id": "parent-id", "thumbnail": "parent-thumb"},
+            "media-list": {
+                "preview": [{"url": "preview"}],
+                "promo": {"images": [{"url": "promo-image"}], "videos": [{"url": "promo-video"}]},
+                "screenshots": [{"url": "ss-1"}, {"url": None}, {"url": "ss-2"}]}}},
+        # bundles and such are missing most of these
+        {"attributes": {"parent": None}},
+        {"id": "no attributes"}]}
+
+    assert media_extractor.get_valkyrie_media_urls(response_json) == [
+        MediaUrl(MediaUrlKind.CONTENT_RATING, "rating"),
+        MediaUrl(MediaUrlKind.THUMBNAIL, "thumb"),
+        MediaUrl(MediaUrlKind.PARENT_THUMBNAIL, "parent-thumb"),
+        MediaUrl(MediaUrlKind.PREVIEW, "preview"),
+        MediaUrl(MediaUrlKind.PROMO_IMAGE, "promo-image"),
+        MediaUrl(MediaUrlKind.PROMO_VIDEO, "promo-video"),
+        MediaUrl(MediaUrlKind.SCREENSHOT, "ss-1"),
+        MediaUrl(MediaUrlKind.SCREENSHOT, "ss-2"),
+    ]
+
+def test_chihiro_media_urls():
+
+    response_json = {
+        "content_rating": {"url": "rating"},
+        "images": [{"type": 1, "url": "image"}],
+        "promomedia": [{"materials": [{"urls": [{"url": "material"}]}]}],
+        "sku_links": [{"url": "sku-link"}]}
+
+    media_url_list = media_extractor.get_chihiro_media_urls(response_json)
+
+    assert media_extractor.get_media_url_list(media_url_list) == ["rating", "image", "material", "sku-link"]
+    assert media_extractor.get_media_url_list(media_url_list, {MediaUrlKind.IMAGE}) == ["image"]
+
+def test_unexpected_json():
+
+    assert media_extractor.get_valkyrie_media_urls({"errors": [{"status": "404"}]}) == []
+    assert media_extractor.get_valkyrie_media_urls({"included": "not a list"}) == []
+    assert media_extractor.get_chihiro_media_urls([]) == []
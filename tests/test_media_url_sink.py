@@ -0,0 +1,30 @@
+from playstation_store_2020_oct_scrape import media_url_sink
+
+
+def test_bloom_filter():
+
+    bloom_filter = media_url_sink.BloomFilter(1000, 0.001)
+
+    assert bloom_filter.add("http://example.com/a.png") is False
+    assert bloom_filter.add("http://example.com/a.png") is True
+    assert "http://example.com/a.png" in bloom_filter
+    assert "http://example.com/b.png" not in bloom_filter
+
+def test_media_url_sink_deduplicates_across_runs(tmp_path):
+
+    media_path = tmp_path / "media.txt"
+
+    media_sink = media_url_sink.MediaUrlSink(media_path, media_url_sink.BloomFilter(1000, 0.001))
+    media_sink.open()
+    media_sink.add(["a", "b", "a"])
+    media_sink.close()
+
+    assert media_sink.urls_deduplicated == 1
+
+    # a new sink should pick up what is already in the file
+    media_sink = media_url_sink.MediaUrlSink(media_path, media_url_sink.BloomFilter(1000, 0.001))
+    media_sink.open()
+    media_sink.add(["b", "c"])
+    media_sink.close()
+
+    assert media_path.read_text(encoding="utf-8").splitlines() == ["a", "b", "c"]
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+import requests
+
+from playstation_store_2020_oct_scrape import mock_store_server
+
+
+@pytest.fixture
+def fixture_dir(tmp_path):
+
+    (tmp_path / "valkyrie").mkdir()
+    (tmp_path / "chihiro").mkdir()
+    (tmp_path / "grid").mkdir()
+
+    (tmp_path / "valkyrie" / "UP0000-SKU00001.json").write_text(json.dumps({"included": []}), encoding="utf-8")
+    (tmp_path / "chihiro" / "UP0000-SKU00001.json").write_text(json.dumps({"images": []}), encoding="utf-8")
+    (tmp_path / "grid" / "1.html").write_text("<html>page 1</html>", encoding="utf-8")
+
+    return tmp_path
+
+def _start_server(store_data, config):
+
+    mock_server = mock_store_server.MockStoreServer(store_data, config)
+    mock_server.start()
+    return mock_server
+
+def test_get_resource_kind_and_key():
+
+    assert mock_store_server.get_resource_kind_and_key("/valkyrie-api/en/us/999/resolve/UP0000-SKU00001") == \
+        (mock_store_server.MockResourceKind.VALKYRIE, "UP0000-SKU00001")
+    assert mock_store_server.get_resource_kind_and_key("/store/api/chihiro/00_09_000/container/us/en/999/UP0000-SKU00001") == \
+        (mock_store_server.MockResourceKind.CHIHIRO, "UP0000-SKU00001")
+    assert mock_store_server.get_resource_kind_and_key("/de-de/grid/STORE-MSF75508-FULLGAMES/3") == \
+        (mock_store_server.MockResourceKind.GRID, "3")
+    assert mock_store_server.get_resource_kind_and_key("/store/api/chihiro/00_09_000/container/us/en/999/UP0000-SKU00001/image") is None
+
+def test_mock_store_serves_fixtures(fixture_dir):
+
+    store_data = mock_store_server.MockStoreData()
+    store_data.load_fixture_dir(fixture_dir)
+
+    mock_server = _start_server(store_data, mock_store_server.MockStoreConfig())
+
+    try:
+        base_url = mock_server.get_base_url()
+
+        response = requests.get(base_url + "/valkyrie-api/en/us/999/resolve/UP0000-SKU00001")
+        assert response.status_code == 200
+        assert response.json() == {"included": []}
+
+        # the validator cache of `warcio_scrape` relies on this
+        response = requests.get(base_url + "/valkyrie-api/en/us/999/resolve/UP0000-SKU00001",
+            headers={"If-None-Match": response.headers["ETag"]})
+        assert response.status_code == 304
+
+        assert requests.get(base_url + "/store/api/chihiro/00_09_000/container/us/en/999/UP0000-SKU00002").status_code == 404
+
+        # past the last grid page, the last page is shown
+        assert requests.get(base_url + "/de-de/grid/STORE-MSF75508-FULLGAMES/5").text == "<html>page 1</html>"
+
+    finally:
+        mock_server.stop()
+
+def test_mock_store_throttles_and_synthesizes():
+
+    mock_server = _start_server(mock_store_server.MockStoreData(synthetic=True),
+        mock_store_server.MockStoreConfig(throttle_rate=1.0, retry_after_seconds=3))
+
+    try:
+        response = requests.get(mock_server.get_base_url() + "/valkyrie-api/en/us/999/resolve/UP0000-SKU00001")
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "3"
+
+    finally:
+        mock_server.stop()
+
+    mock_server = _start_server(mock_store_server.MockStoreData(synthetic=True), mock_store_server.MockStoreConfig())
+
+    try:
+        response = requests.get(mock_server.get_base_url() + "/store/api/chihiro/00_09_000/container/us/en/999/UP0000-SKU00001")
+        assert response.status_code == 200
+        assert response.json()["id"] == "UP0000-SKU00001"
+
+    finally:
+        mock_server.stop()
+
+def test_mock_store_data_fixture_dir_round_trip(fixture_dir, tmp_path_factory):
+
+    store_data = mock_store_server.MockStoreData()
+    store_data.load_fixture_dir(fixture_dir)
+    store_data.add(mock_store_server.MockResourceKind.VALKYRIE, "UP0000-SKU00002",
+        mock_store_server.MockResponse(status_code=404, content_type="application/json", body=b""))
+
+    output_dir = tmp_path_factory.mktemp("saved")
+    store_data.save_fixture_dir(output_dir)
+
+    saved_store_data = mock_store_server.MockStoreData()
+    saved_store_data.load_fixture_dir(output_dir)
+
+    # the 404 can't be saved as a fixture
+    assert saved_store_data.get_sku_list() == ["UP0000-SKU00001"]
+    assert saved_store_data.get_response(mock_store_server.MockResourceKind.GRID, "1").body == b"<html>page 1</html>"
@@ -0,0 +1,44 @@
+import time
+
+from playstation_store_2020_oct_scrape import rate_control
+
+
+def test_aimd_controller_increases_when_healthy():
+
+    rate_controller = rate_control.AimdController(initial_limit=2, min_limit=1, max_limit=3)
+
+    for _ in range(2):
+        rate_controller.on_response(200, 0.1)
+
+    assert rate_controller.get_limit() == 3
+
+    # never above the max
+    for _ in range(10):
+        rate_controller.on_response(200, 0.1)
+
+    assert rate_controller.get_limit() == 3
+
+def test_aimd_controller_backs_off_when_throttled():
+
+    rate_controller = rate_control.AimdController(initial_limit=8, min_limit=1, max_limit=16)
+
+    sent_time = time.monotonic()
+    rate_controller.on_response(429, 0.1, retry_after_seconds=30, sent_time=sent_time)
+
+    assert rate_controller.get_limit() == 4
+    assert rate_controller.get_wait_seconds() > 25
+
+    # requests that were already in flight when we backed off don't lower it again
+    rate_controller.on_response(429, 0.1, sent_time=sent_time)
+
+    assert rate_controller.get_limit() == 4
+
+def test_aimd_controller_backs_off_on_errors():
+
+    rate_controller = rate_control.AimdController(initial_limit=4, min_limit=1, max_limit=16)
+
+    for status_code in [200, 500, 200, None]:
+        rate_controller.on_response(status_code, 0.1)
+
+    assert rate_controller.get_limit() == 2
+    assert rate_controller.get_wait_seconds() == 0
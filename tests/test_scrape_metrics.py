@@ -0,0 +1,46 @@
+import pytest
+
+from playstation_store_2020_oct_scrape import scrape_metrics
+
+
+def test_latency_histogram_percentile():
+
+    histogram = scrape_metrics.LatencyHistogram([1.0, 2.0, 4.0])
+
+    assert histogram.get_percentile(0.5) is None
+
+    for iter_seconds in [0.5, 0.5, 1.5, 3.0]:
+        histogram.observe(iter_seconds)
+
+    # half of them are in the first bucket
+    assert histogram.get_percentile(0.5) == pytest.approx(1.0)
+    assert histogram.get_percentile(0.75) == pytest.approx(2.0)
+    assert histogram.get_percentile(1.0) == pytest.approx(4.0)
+
+    assert histogram.get_cumulative_bucket_list() == [("1.0", 2), ("2.0", 3), ("4.0", 4), ("+Inf", 4)]
+
+def test_scrape_metrics_snapshot_and_prometheus_text():
+
+    metrics = scrape_metrics.ScrapeMetrics(sku_total=4)
+
+    metrics.on_response("valkyrie", 200, 0.2, 100)
+    metrics.on_response("chihiro", 429, 0.1, 0)
+    metrics.on_retry()
+    metrics.on_response("chihiro", None, None, 0)
+    metrics.on_sku_done(3)
+    metrics.on_sku_skipped()
+
+    snapshot = metrics.get_snapshot()
+
+    assert snapshot["request_count"] == 3
+    assert snapshot["bytes_in"] == 100
+    assert snapshot["retry_count"] == 1
+    assert snapshot["media_url_count"] == 3
+    assert snapshot["status_codes"] == {"chihiro": {"429": 1, "error": 1}, "valkyrie": {"200": 1}}
+    assert snapshot["latency"]["chihiro"]["count"] == 1
+    assert snapshot["eta_seconds"] is not None
+
+    prometheus_text = metrics.get_prometheus_text()
+
+    assert 'psstore_scrape_responses_total{api="chihiro",status="429"} 1' in prometheus_text
+    assert 'psstore_scrape_request_latency_seconds_bucket{api="valkyrie",le="+Inf"} 1' in prometheus_text
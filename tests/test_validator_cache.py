@@ -0,0 +1,35 @@
+from playstation_store_2020_oct_scrape import validator_cache
+
+
+def test_url_validators_conditional_headers():
+
+    url_validators = validator_cache.UrlValidators(url="http://example.com/a", etag="\"abc\"", last_modified=None,
+        payload_digest="sha1:AAAA", warc_date="2020-10-01T00:00:00Z")
+
+    assert url_validators.get_conditional_headers() == {"If-None-Match": "\"abc\""}
+
+def test_validator_cache_round_trip(tmp_path):
+
+    cache_path = tmp_path / "validators.sqlite3"
+
+    url_validators = validator_cache.UrlValidators(url="http://example.com/a", etag="\"abc\"",
+        last_modified="Thu, 01 Oct 2020 00:00:00 GMT", payload_digest="sha1:AAAA", warc_date="2020-10-01T00:00:00Z")
+
+    cache = validator_cache.ValidatorCache(cache_path)
+    cache.open()
+    cache.put(url_validators)
+    cache.close()
+
+    # a new run should see what the last one saved
+    cache = validator_cache.ValidatorCache(cache_path)
+    cache.open()
+
+    assert cache.get("http://example.com/a") == url_validators
+    assert cache.get("http://example.com/b") is None
+
+    cache.put(validator_cache.UrlValidators(url="http://example.com/a", etag=None, last_modified=None,
+        payload_digest="sha1:BBBB", warc_date="2020-10-02T00:00:00Z"))
+
+    assert cache.get("http://example.com/a").payload_digest == "sha1:BBBB"
+
+    cache.close()
@@ -0,0 +1,46 @@
+import pytest
+
+from playstation_store_2020_oct_scrape import warc_output
+
+
+def test_warc_segment_path(tmp_path):
+
+    base_path = tmp_path / "psstore_en-us.warc.gz"
+
+    assert warc_output.get_warc_segment_path(base_path, 0) == base_path
+    assert warc_output.get_warc_segment_path(base_path, 3) == tmp_path / "psstore_en-us-00003.warc.gz"
+
+    assert warc_output.get_next_free_warc_segment_number(base_path) == 0
+    base_path.touch()
+    warc_output.get_warc_segment_path(base_path, 1).touch()
+    assert warc_output.get_next_free_warc_segment_number(base_path) == 2
+
+    # a segment that was synced off the machine and deleted still has its number used up
+    warc_output.get_segment_closed_marker_path(warc_output.get_warc_segment_path(base_path, 4)).touch()
+    assert warc_output.get_next_free_warc_segment_number(base_path) == 5
+
+def test_warc_writer_stage_writes_in_order():
+
+    written_list = []
+    writer_stage = warc_output.WarcWriterStage(written_list.append, 2)
+    writer_stage.start()
+
+    for i in range(10):
+        writer_stage.put(i)
+
+    writer_stage.finish()
+
+    assert written_list == list(range(10))
+    assert writer_stage.items_written == 10
+
+def test_warc_writer_stage_raises_writer_errors():
+
+    def _fail(item):
+        raise ValueError(item)
+
+    writer_stage = warc_output.WarcWriterStage(_fail, 2)
+    writer_stage.start()
+    writer_stage.put(1)
+
+    with pytest.raises(Exception):
+        writer_stage.finish()
@@ -0,0 +1,419 @@
+import argparse
+import json
+import threading
+import time
+
+import pytest
+from warcio.archiveiterator import ArchiveIterator
+
+from playstation_store_2020_oct_scrape import file_utils
+from playstation_store_2020_oct_scrape import mock_store_server
+from playstation_store_2020_oct_scrape import warcio_scrape
+from playstation_store_2020_oct_scrape.mock_store_server import MockResourceKind, MockResponse
+
+SKU_LIST = ["UP0000-CUSA{:05d}_00-GAME".format(x) for x in range(6)]
+
+
+@pytest.fixture
+def start_mock_store():
+
+    mock_server_list = []
+
+    def _start(store_data=None, **config_kwargs):
+
+        if store_data is None:
+            store_data = mock_store_server.MockStoreData(synthetic=True)
+
+        mock_server = mock_store_server.MockStoreServer(store_data, mock_store_server.MockStoreConfig(seed=1, **config_kwargs))
+        mock_server.start()
+        mock_server_list.append(mock_server)
+        return mock_server
+
+    yield _start
+
+    for iter_mock_server in mock_server_list:
+        iter_mock_server.stop()
+
+def _get_parsed_args(tmp_path, base_url, name="scrape", **kwargs):
+    ''' the same arguments `main.py` would give `do_warcio_scrape()`, with short retry delays '''
+
+    sku_list_path = tmp_path / "skus.txt"
+    if not sku_list_path.exists():
+        sku_list_path.write_text("".join("{}\n".format(x) for x in SKU_LIST), encoding="utf-8")
+
+    arg_dict = dict(
+        sku_list=sku_list_path,
+        region_lang="en",
+        region_country="us",
+        warc_output_file=tmp_path / "{}.warc.gz".format(name),
+        media_files_output_file=tmp_path / "{}_media.txt".format(name),
+        media_dedup=True,
+        media_dedup_capacity=1000,
+        media_dedup_false_positive_rate=0.0001,
+        warc_max_size=None,
+        concurrency=2,
+        adaptive_concurrency=False,
+        min_concurrency=1,
+        max_concurrency=16,
+        workers=1,
+        writer_queue_size=100,
+        max_retries=2,
+        retry_base_delay=0.01,
+        retry_max_delay=0.05,
+        final_retry_sweep=True,
+        dead_skus_file=None,
+        valkyrie_first=False,
+        validator_cache=None,
+        journal_file=None,
+        event_log_file=None,
+        resume=False,
+        count_skus=True,
+        metrics_port=None,
+        metrics_json_file=None,
+        metrics_prometheus_file=None,
+        metrics_interval=30.0,
+        base_url=base_url)
+    arg_dict.update(kwargs)
+
+    return argparse.Namespace(**arg_dict)
+
+def _get_served_count(mock_server, kind_name, status_code=None):
+    return sum(v for (iter_kind_name, iter_status_code), v in mock_server.served_count_dict.items()
+        if iter_kind_name == kind_name and (status_code is None or iter_status_code == status_code))
+
+def _get_warc_record_type_list(warc_path):
+
+    with open(warc_path, "rb") as f:
+        return [x.rec_type for x in ArchiveIterator(f)]
+
+def _read_lines(path):
+    return file_utils.iter_content_ids(path) if path.exists() else []
+
+
+@pytest.mark.parametrize("final_retry_sweep", [True, False])
+def test_retries_and_final_sweep(tmp_path, start_mock_store, final_retry_sweep):
+
+    mock_server = start_mock_store(error_rate=1.0)
+    event_log_path = tmp_path / "events.jsonl"
+
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url(), max_retries=3,
+        final_retry_sweep=final_retry_sweep, event_log_file=event_log_path))
+
+    # `max_retries` attempts, and as many again in the final sweep
+    attempt_count = 3 * (2 if final_retry_sweep else 1)
+    assert _get_served_count(mock_server, "valkyrie", 500) == len(SKU_LIST) * attempt_count
+    assert _get_served_count(mock_server, "chihiro", 500) == len(SKU_LIST) * attempt_count
+
+    with open(event_log_path, "r", encoding="utf-8") as f:
+        event_list = [json.loads(x) for x in f]
+
+    # written once when the retries run out, and again after the sweep
+    assert len(event_list) == len(SKU_LIST) * 2 * (2 if final_retry_sweep else 1)
+    assert {(x["region"], x["status"], x["attempts"], x["http_status"]) for x in event_list} == {("en-us", "failed", 3, 500)}
+
+def test_retry_after_is_waited_for(tmp_path, start_mock_store):
+
+    mock_server = start_mock_store(throttle_rate=1.0, retry_after_seconds=0.5)
+
+    start = time.monotonic()
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url(), concurrency=1,
+        max_retries=2, final_retry_sweep=False))
+    elapsed_seconds = time.monotonic() - start
+
+    assert _get_served_count(mock_server, "valkyrie", 429) == len(SKU_LIST) * 2
+    # the backoff alone would be 0.05 seconds at most
+    assert elapsed_seconds >= 0.5
+
+def test_not_found_is_never_retried(tmp_path, start_mock_store):
+
+    store_data = mock_store_server.MockStoreData(synthetic=True)
+    store_data.add(MockResourceKind.VALKYRIE, SKU_LIST[0], MockResponse(status_code=404, content_type="application/json", body=b"{}"))
+    store_data.add(MockResourceKind.CHIHIRO, SKU_LIST[0], MockResponse(status_code=410, content_type="application/json", body=b"{}"))
+    # chihiro still has this one, so it isn't dead
+    store_data.add(MockResourceKind.VALKYRIE, SKU_LIST[1], MockResponse(status_code=404, content_type="application/json", body=b"{}"))
+
+    mock_server = start_mock_store(store_data)
+    dead_skus_path = tmp_path / "dead.txt"
+
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url(), dead_skus_file=dead_skus_path))
+
+    assert _get_served_count(mock_server, "valkyrie", 404) == 2
+    assert _get_served_count(mock_server, "chihiro", 410) == 1
+    assert _get_served_count(mock_server, "chihiro", 200) == len(SKU_LIST) - 1
+    assert list(_read_lines(dead_skus_path)) == [SKU_LIST[0]]
+
+def test_valkyrie_first_skips_chihiro_for_dead_skus(tmp_path, start_mock_store):
+
+    store_data = mock_store_server.MockStoreData(synthetic=True)
+    store_data.add(MockResourceKind.VALKYRIE, SKU_LIST[0], MockResponse(status_code=404, content_type="application/json", body=b"{}"))
+
+    mock_server = start_mock_store(store_data)
+    dead_skus_path = tmp_path / "dead.txt"
+
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url(), valkyrie_first=True, dead_skus_file=dead_skus_path))
+
+    assert _get_served_count(mock_server, "valkyrie") == len(SKU_LIST)
+    assert _get_served_count(mock_server, "chihiro") == len(SKU_LIST) - 1
+    assert list(_read_lines(dead_skus_path)) == [SKU_LIST[0]]
+
+    # the next run doesn't ask about it at all
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url(), name="second",
+        valkyrie_first=True, dead_skus_file=dead_skus_path))
+
+    assert _get_served_count(mock_server, "valkyrie", 404) == 1
+
+def test_resume_skips_done_skus(tmp_path, start_mock_store):
+
+    mock_server = start_mock_store()
+
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url()))
+    served_count = sum(mock_server.served_count_dict.values())
+    assert served_count == len(SKU_LIST) * 2
+
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url(), resume=True))
+    assert sum(mock_server.served_count_dict.values()) == served_count
+
+    # the resumed run never appends to the first segment
+    assert (tmp_path / "scrape-00001.warc.gz").exists()
+
+def test_workers_merge_the_same_media_list(tmp_path, start_mock_store):
+
+    mock_server = start_mock_store()
+
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url(), name="single"))
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url(), name="sharded", workers=2))
+
+    single_media_list = list(_read_lines(tmp_path / "single_media.txt"))
+    assert single_media_list
+    assert sorted(_read_lines(tmp_path / "sharded_media.txt")) == sorted(single_media_list)
+
+    with open(tmp_path / "sharded.warc.gz.manifest.json", "r", encoding="utf-8") as f:
+        manifest_dict = json.load(f)
+
+    assert manifest_dict["failed_worker_count"] == 0
+    assert sorted(x["worker"] for x in manifest_dict["warc_segments"]) == [0, 1]
+    assert sum(x["sku_count"] for x in manifest_dict["workers"]) == len(SKU_LIST)
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_validator_cache_writes_revisit_records(tmp_path, start_mock_store, workers):
+
+    mock_server = start_mock_store()
+    validator_cache_path = tmp_path / "validators.sqlite3"
+
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url(), name="first",
+        validator_cache=validator_cache_path, workers=workers))
+
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url(), name="second",
+        validator_cache=validator_cache_path, workers=workers))
+
+    assert _get_served_count(mock_server, "valkyrie", 304) == len(SKU_LIST)
+    assert _get_served_count(mock_server, "chihiro", 304) == len(SKU_LIST)
+
+    warc_path_list = sorted(tmp_path.glob("first*.warc.gz")), sorted(tmp_path.glob("second*.warc.gz"))
+    assert all("revisit" not in _get_warc_record_type_list(x) for x in warc_path_list[0])
+
+    record_type_list = [y for x in warc_path_list[1] for y in _get_warc_record_type_list(x)]
+    assert record_type_list.count("revisit") == len(SKU_LIST) * 2
+    assert "response" not in record_type_list
+
+    # the caches of the workers were merged into the one that was given
+    assert not list(tmp_path.glob("validators.worker*"))
+
+def test_final_sweep_skips_skus_that_turned_out_dead(monkeypatch):
+
+    requested_url_list = []
+
+    def _fake_download_api_url(url, api_type, url_validators=None):
+
+        requested_url_list.append(url)
+
+        if api_type == warcio_scrape.ApiType.VALKYRIE:
+            # chihiro runs out of retries before valkyrie comes back
+            time.sleep(0.3)
+            return warcio_scrape.ApiUrlResult(url=url, success=False, media_url_list=[], warc_record_list=[], not_found=True, status_code=404)
+
+        return warcio_scrape.ApiUrlResult(url=url, success=False, media_url_list=[], warc_record_list=[], status_code=500)
+
+    monkeypatch.setattr(warcio_scrape, "download_api_url", _fake_download_api_url)
+
+    entry_result_list = []
+    retry_policy = warcio_scrape.RetryPolicy(max_retries=2, base_delay_seconds=0.01, max_delay_seconds=0.01, final_retry_sweep=True)
+    fetch_scheduler = warcio_scrape.FetchScheduler(1, retry_policy, entry_result_list.append)
+
+    api_entry = warcio_scrape.ApiEntry(sku="SKU1", valkyrie_url="valkyrie/SKU1", chihiro_url="chihiro/SKU1")
+    fetch_scheduler.run(iter([(0, api_entry, list(warcio_scrape.ApiType))]), 1)
+
+    assert requested_url_list.count("valkyrie/SKU1") == 1
+    assert requested_url_list.count("chihiro/SKU1") == 2
+    assert len(entry_result_list) == 1
+    assert entry_result_list[0].dead
+
+def test_final_sweep_keeps_what_already_worked(tmp_path, start_mock_store, monkeypatch):
+
+    store_data = mock_store_server.MockStoreData(synthetic=True)
+    store_data.add(MockResourceKind.VALKYRIE, SKU_LIST[0], MockResponse(status_code=404, content_type="application/json", body=b"{}"))
+
+    mock_server = start_mock_store(store_data)
+    dead_skus_path = tmp_path / "dead.txt"
+
+    download_api_url = warcio_scrape.download_api_url
+    failed_url_list = []
+
+    def _fake_download_api_url(url, api_type, url_validators=None):
+
+        # valkyrie only says the sku doesn't exist in the final sweep, long after chihiro worked
+        if api_type == warcio_scrape.ApiType.VALKYRIE and url.endswith(SKU_LIST[0]) and len(failed_url_list) < 2:
+            failed_url_list.append(url)
+            return warcio_scrape.ApiUrlResult(url=url, success=False, media_url_list=[], warc_record_list=[], status_code=500)
+
+        return download_api_url(url, api_type, url_validators)
+
+    monkeypatch.setattr(warcio_scrape, "download_api_url", _fake_download_api_url)
+
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url(), dead_skus_file=dead_skus_path))
+
+    assert _get_served_count(mock_server, "valkyrie", 404) == 1
+    assert _get_served_count(mock_server, "chihiro", 200) == len(SKU_LIST)
+    assert list(_read_lines(dead_skus_path)) == []
+
+def test_concurrency_keeps_that_many_skus_in_flight(monkeypatch):
+
+    lock = threading.Lock()
+    in_flight_count = 0
+    max_in_flight_count = 0
+
+    def _fake_download_api_url(url, api_type, url_validators=None):
+
+        nonlocal in_flight_count, max_in_flight_count
+
+        with lock:
+            in_flight_count += 1
+            max_in_flight_count = max(max_in_flight_count, in_flight_count)
+
+        time.sleep(0.05)
+
+        with lock:
+            in_flight_count -= 1
+
+        return warcio_scrape.ApiUrlResult(url=url, success=True, media_url_list=[url + "/image"], warc_record_list=[url])
+
+    monkeypatch.setattr(warcio_scrape, "download_api_url", _fake_download_api_url)
+
+    entry_result_list = []
+    retry_policy = warcio_scrape.RetryPolicy(max_retries=1, base_delay_seconds=0.01, max_delay_seconds=0.01, final_retry_sweep=False)
+    fetch_scheduler = warcio_scrape.FetchScheduler(3, retry_policy, entry_result_list.append)
+
+    api_entry_list = [warcio_scrape.ApiEntry(sku=x, valkyrie_url="valkyrie/" + x, chihiro_url="chihiro/" + x) for x in SKU_LIST * 2]
+    fetch_scheduler.run(((idx, x, list(warcio_scrape.ApiType)) for idx, x in enumerate(api_entry_list)), len(api_entry_list))
+
+    # both requests of 3 skus at a time
+    assert max_in_flight_count == 6
+    assert len(entry_result_list) == len(api_entry_list)
+    assert all(x.is_complete() for x in entry_result_list)
+
+def test_concurrency_writes_every_sku_to_one_warc(tmp_path, start_mock_store):
+
+    mock_server = start_mock_store()
+
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url(), concurrency=4))
+
+    assert _get_served_count(mock_server, "valkyrie", 200) == len(SKU_LIST)
+    assert _get_served_count(mock_server, "chihiro", 200) == len(SKU_LIST)
+
+    # a request and a response record for every url, all in the one WARC
+    assert [x.name for x in tmp_path.glob("scrape*.warc.gz")] == ["scrape.warc.gz"]
+    assert _get_warc_record_type_list(tmp_path / "scrape.warc.gz").count("response") == len(SKU_LIST) * 2
+    assert list(_read_lines(tmp_path / "scrape_media.txt"))
+
+def test_both_requests_of_a_sku_run_at_the_same_time(monkeypatch):
+
+    started_event_dict = {x: threading.Event() for x in warcio_scrape.ApiType}
+
+    def _fake_download_api_url(url, api_type, url_validators=None):
+
+        started_event_dict[api_type].set()
+
+        # valkyrie only finishes once chihiro has started, and chihiro finishes first
+        if api_type == warcio_scrape.ApiType.VALKYRIE:
+            assert started_event_dict[warcio_scrape.ApiType.CHIHIRO].wait(5)
+            time.sleep(0.05)
+
+        return warcio_scrape.ApiUrlResult(url=url, success=True, media_url_list=[url + "/image"], warc_record_list=[url + "/record"])
+
+    monkeypatch.setattr(warcio_scrape, "download_api_url", _fake_download_api_url)
+
+    entry_result_list = []
+    retry_policy = warcio_scrape.RetryPolicy(max_retries=1, base_delay_seconds=0.01, max_delay_seconds=0.01, final_retry_sweep=False)
+    fetch_scheduler = warcio_scrape.FetchScheduler(1, retry_policy, entry_result_list.append)
+
+    api_entry = warcio_scrape.ApiEntry(sku="SKU1", valkyrie_url="valkyrie/SKU1", chihiro_url="chihiro/SKU1")
+    fetch_scheduler.run(iter([(0, api_entry, list(warcio_scrape.ApiType))]), 1)
+
+    # joined into one result, with the valkyrie records first no matter which finished first
+    assert len(entry_result_list) == 1
+    assert entry_result_list[0].get_warc_record_list() == ["valkyrie/SKU1/record", "chihiro/SKU1/record"]
+    assert entry_result_list[0].get_media_url_list() == ["valkyrie/SKU1/image", "chihiro/SKU1/image"]
+
+def test_records_of_a_sku_are_next_to_each_other(tmp_path, start_mock_store):
+
+    mock_server = start_mock_store(latency_jitter_seconds=0.02)
+
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url(), concurrency=3))
+
+    with open(tmp_path / "scrape.warc.gz", "rb") as f:
+        target_uri_list = [x.rec_headers.get_header("WARC-Target-URI") for x in ArchiveIterator(f) if x.rec_type == "response"]
+
+    sku_list = [x.rsplit("/", 1)[-1] for x in target_uri_list]
+    assert sorted(sku_list) == sorted(SKU_LIST * 2)
+    assert all(x == y for x, y in zip(sku_list[::2], sku_list[1::2]))
+    assert all("/valkyrie-api/" in x for x in target_uri_list[::2])
+
+def test_retry_delays_back_off_with_jitter():
+
+    retry_policy = warcio_scrape.RetryPolicy(max_retries=10, base_delay_seconds=1.0, max_delay_seconds=10.0, final_retry_sweep=False)
+
+    for iter_attempt, iter_max_delay in enumerate([1.0, 2.0, 4.0, 8.0, 10.0, 10.0]):
+        delay_list = [retry_policy.get_delay_seconds(iter_attempt) for _ in range(100)]
+        assert all(iter_max_delay / 2 <= x <= iter_max_delay for x in delay_list)
+        assert len(set(delay_list)) > 1
+
+def test_retries_wait_without_blocking_other_skus(monkeypatch):
+
+    attempt_count_dict = {}
+
+    def _fake_download_api_url(url, api_type, url_validators=None):
+
+        attempt_count_dict[url] = attempt_count_dict.get(url, 0) + 1
+
+        # the first sku fails twice before it works
+        if url.endswith("SKU0") and attempt_count_dict[url] <= 2:
+            return warcio_scrape.ApiUrlResult(url=url, success=False, media_url_list=[], warc_record_list=[], status_code=503)
+
+        time.sleep(0.01)
+        return warcio_scrape.ApiUrlResult(url=url, success=True, media_url_list=[], warc_record_list=[])
+
+    monkeypatch.setattr(warcio_scrape, "download_api_url", _fake_download_api_url)
+
+    entry_result_list = []
+    retry_policy = warcio_scrape.RetryPolicy(max_retries=3, base_delay_seconds=0.3, max_delay_seconds=0.3, final_retry_sweep=False)
+    fetch_scheduler = warcio_scrape.FetchScheduler(1, retry_policy, entry_result_list.append)
+
+    api_entry_list = [warcio_scrape.ApiEntry(sku=x, valkyrie_url="valkyrie/" + x, chihiro_url="chihiro/" + x)
+        for x in ("SKU0", "SKU1", "SKU2", "SKU3")]
+    fetch_scheduler.run(((idx, x, list(warcio_scrape.ApiType)) for idx, x in enumerate(api_entry_list)), len(api_entry_list))
+
+    # the other skus went ahead while the first one waited for its retries
+    assert [x.api_entry.sku for x in entry_result_list] == ["SKU1", "SKU2", "SKU3", "SKU0"]
+    assert entry_result_list[-1].is_successful(warcio_scrape.ApiType.VALKYRIE)
+    assert entry_result_list[-1].url_result_dict[warcio_scrape.ApiType.CHIHIRO].attempt_count == 3
+
+def test_base_url_requests_are_sent_to_its_host(tmp_path, start_mock_store):
+
+    mock_server = start_mock_store()
+
+    warcio_scrape.do_warcio_scrape(_get_parsed_args(tmp_path, mock_server.get_base_url()))
+
+    with open(tmp_path / "scrape.warc.gz", "rb") as f:
+        host_set = {x.http_headers.get_header("Host") for x in ArchiveIterator(f) if x.rec_type == "request"}
+
+    assert host_set == {mock_server.get_base_url().split("://", 1)[1].rstrip("/")}
@@ -1,35 +1,62 @@
 import logging
 import json
 import enum
+import functools
+import os
 import re
+import sys
+import time
 
+from wpull.application.hook import Actions
 from wpull.application.plugin import WpullPlugin, PluginFunctions, hook, event
 from wpull.pipeline.session import ItemSession
-import jmespath
-import jmespath.parser
-import attr
+
+try:
+    from playstation_store_2020_oct_scrape import event_log
+    from playstation_store_2020_oct_scrape import media_extractor
+except ImportError:
+    # `bootstrap_wpull.py` extracts `media_extractor.py` and `event_log.py` out of the pex and puts them next to this plugin
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import event_log
+    import media_extractor
 
 logger = logging.getLogger(__name__)
 
 # logger.setLevel("WARNING")
 
-VALKYRIE_URL_PREFIX = "https://store.playstation.com/valkyrie-api/"
-CHIHIRO_URL_PREFIX = "https://store.playstation.com/store/api/chihiro/"
+# wpull doesn't give plugins their own command line arguments, so pointing the plugin at somewhere
+# other then the real store (like the mock store) is done with a environment variable
+STORE_BASE_URL = os.environ.get("PSSTORE_BASE_URL", "https://store.playstation.com").rstrip("/")
+
+VALKYRIE_URL_PREFIX = STORE_BASE_URL + "/valkyrie-api/"
+CHIHIRO_URL_PREFIX = STORE_BASE_URL + "/store/api/chihiro/"
 CHIHIRO_IMAGE_URL_SUFFIX = "/image"
 
-URLS_TO_SKIP_REGEX_LIST = [
+# if set, a line gets written here for every response (or error) for a api url, see `event_log.py`
+EVENT_LOG_PATH = os.environ.get("PSSTORE_EVENT_LOG")
+
+# `accept_url` runs for every url wpull looks at, so instead of trying a regex per host one at a time, every url is
+# matched once against a single regex made out of these
+URLS_TO_SKIP_HOST_SET = frozenset([
 
     # this is a wierd one, i think its because its trying to search the response for urls and somehow gets this?
     # need to investigate it , TODO
-    re.compile("^http[s]?://json/.*"),
+    # example: http://json/
+    "json",
 
     # example: http://cdn.sp-int.ac.playstation.net/UP4235/CUSA06154_00/0njVKtt3dBGfRXDZWLzjhOSRGcqOl21Z.png’
-    re.compile("^http[s]?://cdn\.sp-int\.ac\.playstation.net.*"),
+    "cdn.sp-int.ac.playstation.net",
 
     # example: https://npmt.mgmt.tools.playstation.net/s3.action?mgmt-aws/EP0001/CUSA05264_00/jpKmTVGn_PREVIEW_SCREENSHOT1_508698.jpg
-    re.compile("http[s]?://npmt\.mgmt\.tools\.playstation.net.*"),
+    "npmt.mgmt.tools.playstation.net",
+
+])
 
-]
+# the host has to be followed by the port, path, query, fragment or nothing, so `json.example.com` still gets through
+URLS_TO_SKIP_REGEX = re.compile("https?://(?:{})(?:[/:?#]|$)".format("|".join(re.escape(x) for x in sorted(URLS_TO_SKIP_HOST_SET))))
+
+# if set, how long every hook takes is added up, and logged when wpull is done
+HOOK_TIMINGS_ENABLED = bool(os.environ.get("PSSTORE_HOOK_TIMINGS"))
 
 
 class UrlType(enum.Enum):
@@ -37,89 +64,141 @@ class UrlType(enum.Enum):
     CHIHIRO = 2
 
 
-@attr.s(auto_attribs=True, kw_only=True, frozen=True)
-class JsonSearchQuery:
-    url_type:UrlType = attr.ib()
-    jmespath_query:str = attr.ib()
-    jmespath_compiled_query:jmespath.parser.ParsedResult = attr.ib()
+MEDIA_URL_FUNC_DICT = {
+    UrlType.VALKYRIE: media_extractor.get_valkyrie_media_urls,
+    UrlType.CHIHIRO: media_extractor.get_chihiro_media_urls,
+}
 
 
-class PsStoreJsonApiWpullPlugin(WpullPlugin):
+def get_api_url_type(url:str):
+    ''' @return the UrlType of one of the main JSON api urls, or None for anything else '''
 
+    if url.startswith(VALKYRIE_URL_PREFIX):
+        return UrlType.VALKYRIE
+    elif url.startswith(CHIHIRO_URL_PREFIX) and not url.endswith(CHIHIRO_IMAGE_URL_SUFFIX):
+        return UrlType.CHIHIRO
 
-    def __debug_logging_tree(self):
+    return None
 
-        import logging_tree
-        print("{}".format( logging_tree.format.build_description(node=None)))
+# which `timed_hook` there is gets decided once, here, so with the timings off the hooks wpull calls are the plain methods
+if HOOK_TIMINGS_ENABLED:
+
+    def timed_hook(func):
+        ''' adds up how many times the hook is called and how long it takes in `self.hook_timing_dict` '''
+
+        @functools.wraps(func)
+        def _wrapper(self, *args, **kwargs):
+
+            start = time.perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                timing_list = self.hook_timing_dict.setdefault(func.__name__, [0, 0.0])
+                timing_list[0] += 1
+                timing_list[1] += time.perf_counter() - start
+
+        return _wrapper
 
+else:
 
-    def _get_json_search_query(self, url_type:UrlType, jmespath_query:str):
-        ''' helper to return a JsonSearchQuery object from
-        a UrlType and a jmespath_query
-        '''
+    def timed_hook(func):
+        ''' the timings are off, so the hook is left as is '''
+        return func
 
-        return JsonSearchQuery(
-            url_type=url_type,
-            jmespath_query=jmespath_query,
-            jmespath_compiled_query=jmespath.compile(jmespath_query) )
 
+class PsStoreJsonApiWpullPlugin(WpullPlugin):
+
+
+    def __debug_logging_tree(self):
+
+        import logging_tree
+        print("{}".format( logging_tree.format.build_description(node=None)))
 
 
     def activate(self):
 
         super().activate()
 
-        # use `[]` instead of `[*]` to flatten projections
-        # see https://jmespath.org/tutorial.html#flatten-projections
-        self.valkyrie_jmespath_expressions = [
-            self._get_json_search_query(UrlType.VALKYRIE, '''included[].attributes."content-rating".url'''),
-            self._get_json_search_query(UrlType.VALKYRIE, '''included[].attributes."thumbnail-url-base"'''),
-            self._get_json_search_query(UrlType.VALKYRIE, '''included[].attributes.parent.thumbnail'''),
-            self._get_json_search_query(UrlType.VALKYRIE, '''included[].attributes."media-list".preview.url'''),
-            self._get_json_search_query(UrlType.VALKYRIE, '''included[].attributes."media-list".promo.images[].url'''),
-            self._get_json_search_query(UrlType.VALKYRIE, '''included[].attributes."media-list".promo.videos[].url'''),
-            self._get_json_search_query(UrlType.VALKYRIE, '''included[].attributes."media-list".screenshots[].url'''),
-            ]
-
-        self.chihiro_jmespath_expressions = [
-            self._get_json_search_query(UrlType.CHIHIRO, '''content_rating.url'''),
-            self._get_json_search_query(UrlType.CHIHIRO, '''images[].url'''),
-            self._get_json_search_query(UrlType.CHIHIRO, '''promomedia[].materials[].urls[].url'''),
-            self._get_json_search_query(UrlType.CHIHIRO, '''sku_links[].url'''),
-            ]
-
         logger.debug("activate()")
 
+        self.event_log_writer = None
+
+        # hook name -> [times called, total seconds], see `timed_hook()`
+        self.hook_timing_dict = {}
+
+        if EVENT_LOG_PATH:
+            logger.info("writing a event for every api url response to `%s`", EVENT_LOG_PATH)
+            self.event_log_writer = event_log.EventLogWriter(EVENT_LOG_PATH)
+            self.event_log_writer.open()
+
     def deactivate(self):
         super().deactivate()
 
         logger.debug("deactivate()")
 
-    @hook(PluginFunctions.accept_url)
-    def my_accept_url(self, item_session: ItemSession, verdict: bool, reasons: dict) -> bool:
+        if self.event_log_writer is not None:
+            self.event_log_writer.close()
+
+        for iter_hook_name, (iter_call_count, iter_seconds) in sorted(self.hook_timing_dict.items()):
+            logger.info("hook `%s`: called `%s` times, `%.3f` seconds total, `%.1f` us per call", iter_hook_name,
+                iter_call_count, iter_seconds, iter_seconds / iter_call_count * 1e6)
 
+    def _add_event(self, item_session:ItemSession, http_status, byte_count:int):
 
         url = item_session.request.url
+        url_type = get_api_url_type(url)
 
-        # go through each regex of URLs to ignore
-        # if we match against a url, we return false
-        for iter_regex in URLS_TO_SKIP_REGEX_LIST:
+        if self.event_log_writer is None or url_type is None:
+            return
 
-            maybe_match = iter_regex.search(url)
+        # wpull does the retrying itself, so this is one line per attempt, `EventIndex` adds them back up. All there is
+        # to go on is the url, so the region comes out of it like the sku does
+        self.event_log_writer.add(url.rsplit("/", 1)[-1], event_log.get_region_from_url(url), url_type.name.lower(),
+            event_log.get_status_for_http_status(http_status), url, http_status=http_status, byte_count=byte_count)
+        self.event_log_writer.flush()
 
-            logger.debug("my_accept_url(): testing url `%s` against regex `%s`, result is `%s`", url, iter_regex, maybe_match)
+    @hook(PluginFunctions.handle_response)
+    @timed_hook
+    def my_handle_response(self, item_session: ItemSession):
 
-            if maybe_match:
+        response = item_session.response
+        self._add_event(item_session, response.status_code, response.body.size() if response.body is not None else 0)
 
-                logger.info("my_accept_url(): ignoring the url `%s` because it matched against regex `%s`", url, iter_regex)
+        # let wpull decide what to do with the response, like it would without this hook
+        return Actions.NORMAL
 
-                return False
+    @hook(PluginFunctions.handle_error)
+    @timed_hook
+    def my_handle_error(self, item_session: ItemSession, error: BaseException):
+
+        self._add_event(item_session, None, 0)
+
+        return Actions.NORMAL
+
+    @hook(PluginFunctions.accept_url)
+    @timed_hook
+    def my_accept_url(self, item_session: ItemSession, verdict: bool, reasons: dict) -> bool:
+
+
+        url = item_session.request.url
+
+        # if the url is one of the ones to ignore, we return false
+        if URLS_TO_SKIP_REGEX.match(url):
+
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("my_accept_url(): ignoring the url `%s` because it matched one of the urls to skip", url)
+
+            return False
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("my_accept_url(): not skipping the url `%s`, wpull's verdict is `%s`", url, verdict)
 
         # if it is not explicitly ignored by us, return whatever verdict wpull has for this url
         # if we return just True, then it will infinitely retry stuff like errors
         return verdict
 
     @event(PluginFunctions.get_urls)
+    @timed_hook
     def my_get_urls(self, item_session: ItemSession):
 
         the_url = item_session.request.url
@@ -127,16 +206,9 @@ class PsStoreJsonApiWpullPlugin(WpullPlugin):
         logger.info("get_urls() for url `%s`", the_url)
 
 
-        if the_url.startswith(VALKYRIE_URL_PREFIX) \
-            or (the_url.startswith(CHIHIRO_URL_PREFIX) and not the_url.endswith(CHIHIRO_IMAGE_URL_SUFFIX)):
+        the_type = get_api_url_type(the_url)
 
-            the_type = None
-            if the_url.startswith(VALKYRIE_URL_PREFIX):
-                the_type = UrlType.VALKYRIE
-            elif the_url.startswith(CHIHIRO_URL_PREFIX):
-                the_type = UrlType.CHIHIRO
-            else:
-                raise Exception("unknown url prefix? `%s`", the_url)
+        if the_type is not None:
 
             urls = self.process_result(the_type, item_session)
 
@@ -156,13 +228,7 @@ class PsStoreJsonApiWpullPlugin(WpullPlugin):
 
         urls_to_add_set = set()
 
-        jmespath_expr_list = None
-
-        if url_type == UrlType.VALKYRIE:
-            jmespath_expr_list = self.valkyrie_jmespath_expressions
-        elif url_type == UrlType.CHIHIRO:
-            jmespath_expr_list = self.chihiro_jmespath_expressions
-        else:
+        if url_type not in MEDIA_URL_FUNC_DICT:
             raise Exception("prcoess_result(): unknown url type `{}`".format(url_type))
 
         try:
@@ -181,51 +247,15 @@ class PsStoreJsonApiWpullPlugin(WpullPlugin):
                 url_type, url)
             return set()
 
-        for iter_json_search_query_obj in jmespath_expr_list:
-
-            try:
-                iter_jmespath_expr = iter_json_search_query_obj.jmespath_compiled_query
-
-                result_set = set()
-                result_obj = iter_jmespath_expr.search(json_obj)
-
-                logger.info("`process_result() - %s`: the expr `%s` found result: `%s`",
-                    url_type, iter_json_search_query_obj.jmespath_query, result_obj)
-
-                # convert jmespath result into a set
-                if result_obj is None:
-                    logger.debug("result_obj is none, skipping")
-
-                elif isinstance(result_obj, list):
-                    final_set = set()
-                    for iter_result in result_obj:
-                        if iter_result:
-                            final_set.add(iter_result)
-
-                    result_set.update(final_set)
-
-
-                elif isinstance(result_obj, str):
-
-                    # have to do it this way or else it will make a set of the
-                    # individual characters of the string which isn't what we want
-                    result_set = {result_obj}
-
-                else:
-                    # we got a list, convert to a set to deduplicate urls
-                    result_set = set(result_obj)
-
-
-                if result_set:
-                    logger.debug("adding `%s` entries to result set", len(result_set))
-                    urls_to_add_set.update(result_set)
+        # the extractor only walks the document once, and skips empty urls
+        try:
+            urls_to_add_set = set(media_extractor.get_media_url_list(MEDIA_URL_FUNC_DICT[url_type](json_obj)))
 
-            except Exception as exc:
+        except Exception as exc:
 
-                logger.exception("Unhandled exception when processing the url `%s` with the JsonSearchQuery `%s`",
-                    url, iter_json_search_query_obj)
+            logger.exception("Unhandled exception when getting the media urls out of the url `%s`", url)
 
-                raise exc
+            raise exc
 
         logger.info("`process_result() - %s`: urls parsed from url `%s` were: `%s`", url_type, url, urls_to_add_set)
 